@@ -1,8 +1,14 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from sistema.cache import cache
+from sistema.cache import cache, invalidate_tags
+
+
+def _get_exceptions_tag(key_date_id):
+    return 'dates.key_date_exceptions:%d' % key_date_id
 
 
 class KeyDate(models.Model):
@@ -49,12 +55,13 @@ class KeyDate(models.Model):
     def __str__(self):
         return '{}: {}'.format(self.datetime, self.name)
 
+    # Exceptions are invalidated in invalidate_exceptions_cache()
     @property
-    @cache(60)
+    @cache(3600, tags=lambda self: [_get_exceptions_tag(self.id)])
     def _group_exceptions(self):
         return list(self.group_exceptions.all())
 
-    @cache(60)
+    @cache(3600, tags=lambda self, user: [_get_exceptions_tag(self.id)])
     def _user_exceptions(self, user):
         return self.user_exceptions.filter(user=user).first()
 
@@ -207,3 +214,11 @@ class GroupKeyDateException(models.Model):
     def __str__(self):
         return 'Перенос даты "{}" для {} на {}'.format(
             self.key_date, self.group, self.datetime)
+
+
+@receiver(post_save, sender=UserKeyDateException)
+@receiver(post_delete, sender=UserKeyDateException)
+@receiver(post_save, sender=GroupKeyDateException)
+@receiver(post_delete, sender=GroupKeyDateException)
+def invalidate_exceptions_cache(sender, instance, **kwargs):
+    invalidate_tags(_get_exceptions_tag(instance.key_date_id))
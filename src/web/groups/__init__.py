@@ -1,3 +1,3 @@
 from . import checks
 
-from groups.api import is_user_in_group
+from groups.api import is_user_in_group, get_group_membership
@@ -1,12 +1,31 @@
-def is_user_in_group(user, group_name, school=None):
+def get_group_membership(request):
+    """
+    :return: request-scoped groups.middleware.GroupMembershipResolver.
+    It's usually created by GroupMembershipMiddleware, but can be missed
+    for requests created not by the Django handler (i.e. in tests)
+    """
+    # Importing here because this API is pulled into __init__.py. Django is unable to load models there.
+    from groups.middleware import GroupMembershipResolver
+
+    if not hasattr(request, 'group_membership'):
+        request.group_membership = GroupMembershipResolver()
+    return request.group_membership
+
+
+def is_user_in_group(user, group_name, school=None, request=None):
     """
     Check whether the user is in the group
     :param user: User object
     :param group_name: group's short_name
     :param school: if school is None, look only for a system-wide group.
     Otherwise, look for a group belonging to this school
+    :param request: if passed, the group and the answer are cached
+    for this request
     :return: True if user is in group, False otherwise
     """
+    if request is not None:
+        return get_group_membership(request).is_user_in_group(user, group_name, school)
+
     # Importing here because this API is pulled into __init__.py. Django is unable to load models there.
     from groups import models
 
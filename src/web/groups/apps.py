@@ -12,6 +12,9 @@ class GroupsConfig(AppConfig):
         self._auto_members = []
 
     def ready(self):
+        from groups import materialized
+        materialized.connect_signals()
+
         try:
             self._ensure_all_groups_exist_and_configured()
             self._set_hook_for_new_school()
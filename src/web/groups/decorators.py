@@ -1,9 +1,8 @@
 from functools import wraps
 
-from django.db.models import Q
 from django.http.response import HttpResponseNotFound
 
-from groups.models import AbstractGroup
+from groups.api import get_group_membership
 
 __all__ = ['only_for_groups']
 
@@ -32,18 +31,18 @@ def only_for_groups(*group_names):
                 return handler(request, *args, **kwargs)
 
             school = getattr(request, 'school', None)
+            group_membership = get_group_membership(request)
 
-            matched_groups = AbstractGroup.objects.filter(
-                Q(short_name__in=group_names) &
-                (Q(school=school) | Q(school__isnull=True))
-            )
-            groups_by_short_name = {}
-            for group in matched_groups:
-                groups_by_short_name[group.short_name] = group
+            groups_by_short_name = {
+                group_name: group_membership.get_group(
+                    group_name, school, with_system_wide=True
+                )
+                for group_name in group_names
+            }
 
             # At first check all names for existing
             for group_name in group_names:
-                if group_name not in groups_by_short_name:
+                if groups_by_short_name[group_name] is None:
                     raise ValueError(
                         'Invalid group_name in only_for_groups(): %s. '
                         'Can\'t find this group for school %s or system-wide' % (
@@ -53,7 +52,7 @@ def only_for_groups(*group_names):
 
             for group_name in group_names:
                 group = groups_by_short_name[group_name]
-                if group.is_user_in_group(request.user):
+                if group_membership.is_member(request.user, group):
                     return handler(request, *args, **kwargs)
 
             return HttpResponseNotFound()
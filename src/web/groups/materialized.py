@@ -0,0 +1,178 @@
+"""
+Incremental maintenance of the materialized group members table
+(groups.models.GroupMember).
+
+Members of a group are rebuilt lazily on the first access after the group has
+been invalidated. A group is invalidated when its own settings or memberships
+change and when any of its inputs changes. Inputs of dynamic groups are
+registered with `register_dependency()`, i.e. in entrance:
+
+    materialized.register_dependency(
+        EntranceStatus,
+        lambda status: EntranceStatusesGroup.objects.filter(school_id=status.school_id),
+    )
+
+Groups built from other groups (i.e. UnionGroup) are found with functions
+registered by `register_dependants()`, so invalidation of one group also
+invalidates all groups which depend on it, transitively.
+"""
+
+from django.apps import apps
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+
+from groups import models
+
+# List of (model, function(instance) -> QuerySet of affected groups)
+_dependencies = []
+
+# List of functions(group_ids) -> QuerySet of groups built from these groups
+_dependants_finders = []
+
+
+def register_dependency(model, get_affected_groups):
+    """
+    Registers an input of dynamic groups. After saving or deleting any instance
+    of `model` (or its subclass) groups returned by
+    `get_affected_groups(instance)` are invalidated.
+    """
+    _dependencies.append((model, get_affected_groups))
+
+
+def register_dependants(find_dependants):
+    """
+    Registers function `find_dependants(group_ids)` which returns QuerySet of
+    groups whose members are computed from members of groups `group_ids`.
+    """
+    _dependants_finders.append(find_dependants)
+
+
+def _find_dependants(group_ids):
+    dependants_ids = set()
+    for find_dependants in _dependants_finders:
+        dependants_ids.update(find_dependants(group_ids).values_list('id', flat=True))
+    return dependants_ids
+
+
+def invalidate(group_ids, only_dependants=False):
+    """
+    Marks materialized members of groups `group_ids` and of all groups
+    depending on them as not actual.
+    """
+    group_ids = set(group_ids)
+    if not group_ids:
+        return
+
+    invalidated_ids = set() if only_dependants else set(group_ids)
+    visited_ids = set(group_ids)
+    level_ids = group_ids
+    while level_ids:
+        level_ids = _find_dependants(level_ids) - visited_ids
+        visited_ids.update(level_ids)
+        invalidated_ids.update(level_ids)
+
+    if invalidated_ids:
+        models.GroupMembersState.invalidate(invalidated_ids)
+
+
+def _on_dependency_changed(get_affected_groups):
+    def handler(instance, **kwargs):
+        invalidate(get_affected_groups(instance).values_list('id', flat=True))
+    return handler
+
+
+def _on_group_saved(instance, **kwargs):
+    invalidate([instance.id])
+
+
+def _on_group_deleted(instance, **kwargs):
+    # Called before deletion: relations to the dependant groups still exist
+    invalidate([instance.id], only_dependants=True)
+
+
+def _on_group_membership_changed(instance, **kwargs):
+    invalidate([instance.group_id])
+
+
+def _on_user_membership_saved(instance, created, **kwargs):
+    if not created:
+        invalidate([instance.group_id])
+        return
+
+    # New member can be added into the actual table without rebuilding.
+    # Version is increased first, so rebuilding running concurrently
+    # will not mark the table as actual without this member
+    models.GroupMembersState.objects.filter(group_id=instance.group_id).update(
+        version=F('version') + 1,
+    )
+    if models.GroupMembersState.objects.filter(group_id=instance.group_id, is_actual=True).exists():
+        models.GroupMember.objects.bulk_create(
+            [models.GroupMember(group_id=instance.group_id, user_id=instance.member_id)],
+            ignore_conflicts=True,
+        )
+    invalidate([instance.group_id], only_dependants=True)
+
+
+def _on_user_membership_deleted(instance, **kwargs):
+    # User can remain in the group via nested groups, so rebuild it
+    invalidate([instance.group_id])
+
+
+def _on_composed_groups_changed(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate([instance.id])
+    elif pk_set:
+        # instance is a member group, pk_set contains composed groups
+        invalidate(pk_set)
+    else:
+        invalidate([instance.id], only_dependants=True)
+
+
+def _find_composed_dependants(group_ids):
+    return models.AbstractGroup.objects.filter(
+        # ManuallyFilledGroup with nested groups
+        Q(id__in=models.GroupInGroupMembership.objects.filter(
+            member_id__in=group_ids
+        ).values('group_id')) |
+        Q(id__in=models.UnionGroup.groups.through.objects.filter(
+            abstractgroup_id__in=group_ids
+        ).values('uniongroup_id')) |
+        Q(id__in=models.IntersectionGroup.groups.through.objects.filter(
+            abstractgroup_id__in=group_ids
+        ).values('intersectiongroup_id')) |
+        Q(id__in=models.DifferenceGroup.objects.filter(
+            Q(from_group_id__in=group_ids) | Q(not_from_group_id__in=group_ids)
+        ).values('id'))
+    ).non_polymorphic()
+
+
+register_dependants(_find_composed_dependants)
+
+
+def _get_model_with_subclasses(model):
+    return [m for m in apps.get_models() if issubclass(m, model)]
+
+
+def connect_signals():
+    # Signals are sent with the concrete model as a sender, so handlers are
+    # connected to each subclass (i.e. for polymorphic models). Handlers
+    # without sender would disable fast deletes for all models
+    for group_model in _get_model_with_subclasses(models.AbstractGroup):
+        post_save.connect(_on_group_saved, sender=group_model)
+        pre_delete.connect(_on_group_deleted, sender=group_model)
+
+    post_save.connect(_on_group_membership_changed, sender=models.GroupInGroupMembership)
+    post_delete.connect(_on_group_membership_changed, sender=models.GroupInGroupMembership)
+    post_save.connect(_on_user_membership_saved, sender=models.UserInGroupMembership)
+    post_delete.connect(_on_user_membership_deleted, sender=models.UserInGroupMembership)
+    m2m_changed.connect(_on_composed_groups_changed, sender=models.UnionGroup.groups.through)
+    m2m_changed.connect(_on_composed_groups_changed, sender=models.IntersectionGroup.groups.through)
+
+    for model, get_affected_groups in _dependencies:
+        handler = _on_dependency_changed(get_affected_groups)
+        for sender in _get_model_with_subclasses(model):
+            # weak=False: handler is a closure which is referenced only here
+            post_save.connect(handler, sender=sender, weak=False)
+            post_delete.connect(handler, sender=sender, weak=False)
@@ -0,0 +1,87 @@
+import functools
+
+from django.apps import apps
+from django.db.models import Q
+from django.utils.deprecation import MiddlewareMixin
+
+from groups.models import AbstractGroup
+
+
+@functools.lru_cache(maxsize=None)
+def _get_system_group_names():
+    names = set()
+    for app_config in apps.get_app_configs():
+        names.update(getattr(app_config, 'sistema_groups', {}).keys())
+    return frozenset(names)
+
+
+class GroupMembershipResolver:
+    """
+    Request-scoped cache of groups and of users' membership in them.
+    The first lookup loads all system groups (see `sistema_groups` in apps)
+    for the school with one query, so access checks in decorators, staff
+    interfaces and templates don't query groups again and again. Answers for
+    each (user, group) pair are memoized.
+    """
+    def __init__(self):
+        # (school_id, short_name) -> group or None if there is no such group
+        self._groups = {}
+        # (user_id, group_id) -> bool
+        self._membership = {}
+
+    def _load_groups(self, group_names, school_id):
+        not_loaded_names = {
+            group_name
+            for group_name in set(group_names) | _get_system_group_names()
+            if (school_id, group_name) not in self._groups or
+            (None, group_name) not in self._groups
+        }
+        if not not_loaded_names:
+            return
+
+        # System-wide groups are loaded too, they can be used
+        # as a fallback for the school groups
+        school_filter = Q(school__isnull=True)
+        if school_id is not None:
+            school_filter |= Q(school_id=school_id)
+        for group in AbstractGroup.objects.filter(
+            school_filter, short_name__in=not_loaded_names
+        ):
+            self._groups[(group.school_id, group.short_name)] = group
+        for group_name in not_loaded_names:
+            self._groups.setdefault((school_id, group_name), None)
+            self._groups.setdefault((None, group_name), None)
+
+    def get_group(self, group_name, school=None, with_system_wide=False):
+        """
+        :return: group with this short_name from the school (or system-wide
+        one if school is None) or None if there is no such group. If
+        `with_system_wide` is True, system-wide group is returned if the school
+        has no such group.
+        """
+        school_id = school.id if school is not None else None
+        self._load_groups([group_name], school_id)
+        group = self._groups[(school_id, group_name)]
+        if group is None and with_system_wide:
+            group = self._groups[(None, group_name)]
+        return group
+
+    def is_member(self, user, group):
+        key = (user.id, group.id)
+        if key not in self._membership:
+            self._membership[key] = group.is_user_in_group(user)
+        return self._membership[key]
+
+    def is_user_in_group(self, user, group_name, school=None):
+        group = self.get_group(group_name, school)
+        if group is None:
+            raise ValueError('Unknown group name %s for school %s' % (
+                group_name,
+                school
+            ))
+        return self.is_member(user, group)
+
+
+class GroupMembershipMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        request.group_membership = GroupMembershipResolver()
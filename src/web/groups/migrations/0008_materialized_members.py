@@ -0,0 +1,36 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('groups', '0007_alter_abstractgroup_polymorphic_ctype_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupMembersState',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='groups.abstractgroup')),
+                ('is_actual', models.BooleanField(default=False, help_text='Соответствует ли таблица GroupMember текущему составу группы')),
+                ('version', models.PositiveIntegerField(default=0, help_text='Увеличивается при каждой инвалидации. Нужна, чтобы не пометить актуальной таблицу, изменившуюся во время пересчёта')),
+                ('updated_at', models.DateTimeField(blank=True, default=None, help_text='Когда таблица GroupMember была пересчитана в последний раз', null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GroupMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='groups.abstractgroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'user')},
+            },
+        ),
+    ]
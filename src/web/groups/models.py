@@ -1,11 +1,12 @@
-import collections
+import datetime
 
 import djchoices
 import polymorphic.models
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.functional import cached_property
 
-from sistema.cache import cache
 import schools.models
 import users.models
 
@@ -67,19 +68,20 @@ class AbstractGroup(polymorphic.models.PolymorphicModel):
     def is_user_in_group(self, user):
         """
         You can override this method in subclass.
-        By default, it calls overridden self.user_ids.
-        Be careful: this approach can be slow on large groups.
+        By default, it looks up the user in the materialized members table
+        (see GroupMember).
         :return: True if user is in group and False otherwise.
         """
-        return user.id in self.user_ids
+        return self.materialized_user_ids.filter(user_id=user.id).exists()
 
     @property
     def users(self):
         """
-        You can override this method in subclass. By default it calls overridden self.user_ids
+        You can override this method in subclass. By default it uses
+        the materialized members table (see GroupMember).
         :return: QuerySet for users.models.User model with users from this group
         """
-        return users.models.User.objects.filter(id__in=self.user_ids)
+        return users.models.User.objects.filter(id__in=self.materialized_user_ids)
 
     @property
     def user_ids(self):
@@ -91,6 +93,23 @@ class AbstractGroup(polymorphic.models.PolymorphicModel):
             self.__class__.__name__
         )
 
+    def _compute_user_ids(self):
+        """
+        Computes members of the group from scratch. Used for rebuilding
+        the materialized members table. Groups which return materialized
+        members from user_ids should override this method.
+        """
+        return self.user_ids
+
+    @property
+    def materialized_user_ids(self):
+        """
+        :return: QuerySet of ids of group members from the materialized
+        members table. The table is rebuilt first if it's not actual.
+        """
+        GroupMembersState.ensure_actual(self)
+        return GroupMember.objects.filter(group=self).values_list('user_id', flat=True)
+
     @property
     def default_access_type(self):
         if self.list_members_to_everyone:
@@ -139,26 +158,27 @@ class AbstractGroup(polymorphic.models.PolymorphicModel):
 
 
 class ManuallyFilledGroup(AbstractGroup):
-    # If there will be problems with performance of this method,
-    # it can be useful to cache full list of group's members and
-    # rebuild it after adding or removing a new member
     @property
-    @cache(60)
     def user_ids(self):
+        return self.materialized_user_ids
+
+    def _compute_user_ids(self):
         visited_groups_ids = {self.id}
         not_manually_filled_groups_members_ids = set()
-        queue = collections.deque([self])
-        while queue:
-            group = queue.popleft()
-            for child_group in group._group_memberships:
-                if child_group.member.id not in visited_groups_ids:
-                    visited_groups_ids.add(child_group.member.id)
-                    if child_group.member.get_real_instance_class() is ManuallyFilledGroup:
-                        queue.append(child_group.member.get_real_instance())
-                    else:
-                        not_manually_filled_groups_members_ids.update(
-                            child_group.member.get_real_instance().user_ids
-                        )
+        # Walk over nested groups level by level. Polymorphic queryset returns
+        # real instances with one query per group type, not per group
+        level_groups_ids = {self.id}
+        while level_groups_ids:
+            child_groups = AbstractGroup.objects.filter(
+                member_in_groups__group_id__in=level_groups_ids
+            ).exclude(id__in=visited_groups_ids).distinct()
+            level_groups_ids = set()
+            for child_group in child_groups:
+                visited_groups_ids.add(child_group.id)
+                if type(child_group) is ManuallyFilledGroup:
+                    level_groups_ids.add(child_group.id)
+                else:
+                    not_manually_filled_groups_members_ids.update(child_group.user_ids)
 
         return not_manually_filled_groups_members_ids.union(
             UserInGroupMembership.objects.filter(
@@ -316,6 +336,9 @@ class IntersectionGroup(AbstractGroup):
 
     @property
     def user_ids(self):
+        return self.materialized_user_ids
+
+    def _compute_user_ids(self):
         if self.groups.count() == 0:
             return []
 
@@ -338,6 +361,9 @@ class UnionGroup(AbstractGroup):
 
     @property
     def user_ids(self):
+        return self.materialized_user_ids
+
+    def _compute_user_ids(self):
         user_ids = set()
         for group in self.groups.all():
             user_ids.update(group.user_ids)
@@ -362,4 +388,106 @@ class DifferenceGroup(AbstractGroup):
 
     @property
     def user_ids(self):
+        return self.materialized_user_ids
+
+    def _compute_user_ids(self):
         return set(self.from_group.user_ids) - set(self.not_from_group.user_ids)
+
+
+class GroupMember(models.Model):
+    """
+    Materialized members of a group. Rows are maintained by groups.materialized
+    and rebuilt by GroupMembersState.ensure_actual(), don't change them directly.
+    """
+    group = models.ForeignKey(
+        AbstractGroup,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+
+    user = models.ForeignKey(
+        users.models.User,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        unique_together = ('group', 'user')
+
+    def __str__(self):
+        return '%s в %s' % (self.user, self.group)
+
+
+class GroupMembersState(models.Model):
+    # Members table can be missed on invalidation if the group inputs are
+    # changed bypassing signals (i.e. by QuerySet.update()), so it's rebuilt
+    # periodically anyway
+    MAX_AGE = datetime.timedelta(minutes=10)
+
+    group = models.OneToOneField(
+        AbstractGroup,
+        primary_key=True,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+
+    is_actual = models.BooleanField(
+        default=False,
+        help_text='Соответствует ли таблица GroupMember текущему составу группы',
+    )
+
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text='Увеличивается при каждой инвалидации. Нужна, чтобы не '
+                  'пометить актуальной таблицу, изменившуюся во время пересчёта',
+    )
+
+    updated_at = models.DateTimeField(
+        null=True,
+        default=None,
+        blank=True,
+        help_text='Когда таблица GroupMember была пересчитана в последний раз',
+    )
+
+    def __str__(self):
+        return 'Состояние участников %s' % (self.group, )
+
+    @classmethod
+    def ensure_actual(cls, group):
+        """
+        Rebuilds materialized members of the group if they are not actual.
+        Only the difference between stored and computed members is written.
+        """
+        state, _ = cls.objects.get_or_create(group_id=group.id)
+        if (state.is_actual and state.updated_at is not None and
+                state.updated_at > timezone.now() - cls.MAX_AGE):
+            return
+
+        user_ids = set(group._compute_user_ids())
+        with transaction.atomic():
+            stored_user_ids = set(
+                GroupMember.objects.filter(group_id=group.id)
+                .values_list('user_id', flat=True)
+            )
+            GroupMember.objects.filter(
+                group_id=group.id,
+                user_id__in=stored_user_ids - user_ids,
+            ).delete()
+            GroupMember.objects.bulk_create(
+                [GroupMember(group_id=group.id, user_id=user_id)
+                 for user_id in user_ids - stored_user_ids],
+                ignore_conflicts=True,
+            )
+            # If the group has been invalidated during rebuilding,
+            # version has been changed and the state remains not actual
+            cls.objects.filter(group_id=group.id, version=state.version).update(
+                is_actual=True,
+                updated_at=timezone.now(),
+            )
+
+    @classmethod
+    def invalidate(cls, group_ids):
+        cls.objects.filter(group_id__in=group_ids).update(
+            is_actual=False,
+            version=F('version') + 1,
+        )
@@ -2,8 +2,7 @@ from typing import Iterable
 
 import django.urls
 import django.views
-import xlsxwriter
-from django.http import HttpResponseNotFound, HttpResponse
+from django.http import HttpResponseNotFound
 from django.shortcuts import render, get_object_or_404
 from django.utils.decorators import method_decorator
 from django.utils.safestring import mark_safe
@@ -14,7 +13,9 @@ import sistema.staff
 import users.models
 from frontend.table import A
 from groups import models
-from sistema.export import ExcelColumn, PlainExcelColumn, LinkExcelColumn
+from sistema.export import (
+    ExcelColumn, PlainExcelColumn, LinkExcelColumn, write_columns, xlsx_streaming_response,
+)
 
 
 class GroupMembersTable(frontend.table.Table):
@@ -206,44 +207,32 @@ class ExportGroup(django.views.View):
             return HttpResponseNotFound()
 
         members = list(group.users.order_by('id').select_related('profile'))
-
-        columns = self._get_columns(request, members)
-
-        ct = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        response = HttpResponse(content_type=ct)
-        response['Content-Disposition'] = f"attachment; filename={group.short_name}.xlsx"
-
-        book = xlsxwriter.Workbook(response, {'in_memory': True})
-        # 31 is max length of Excel worksheet's name.
-        # Also some characters are forbidden in worksheet names, but let's ignore it for now.
-        sheet = book.add_worksheet(f'{group.school.name}. {group.name}'[:31])
-
-        # TODO (andgein): It's a copy-paste from ExportCompleteEnrollingTable, clean it up?
-        header_fmt = book.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'align': 'center',
-        })
-        cell_fmt = book.add_format({
-            'text_wrap': True,
-        })
         plain_header = (request.GET.get('plain_header') != 'false')
-        for column in columns:
-            column.header_format = header_fmt
-            column.cell_format = cell_fmt
-            column.plain_header = plain_header
-
-        # Write header
-        header_height = max(column.header_height for column in columns)
-        irow, icol = 0, 0
-        for column in columns:
-            column.write(sheet, irow, icol, header_height=header_height)
-            icol += column.width
-
-        sheet.freeze_panes(1 if plain_header else header_height, 3)
-        book.close()
 
-        return response
+        def write_workbook(book):
+            # 31 is max length of Excel worksheet's name.
+            # Also some characters are forbidden in worksheet names, but let's ignore it for now.
+            sheet = book.add_worksheet(f'{group.school.name}. {group.name}'[:31])
+
+            # TODO (andgein): It's a copy-paste from ExportCompleteEnrollingTable, clean it up?
+            header_fmt = book.add_format({
+                'bold': True,
+                'text_wrap': True,
+                'align': 'center',
+            })
+            cell_fmt = book.add_format({
+                'text_wrap': True,
+            })
+            write_columns(
+                sheet,
+                self._get_columns(request, members),
+                plain_header=plain_header,
+                header_format=header_fmt,
+                cell_format=cell_fmt,
+                frozen_columns=3,
+            )
+
+        return xlsx_streaming_response(f'{group.short_name}.xlsx', write_workbook)
 
     def _get_columns(self, request, members: Iterable[users.models.User]) -> Iterable[ExcelColumn]:
         columns = []
@@ -251,57 +240,57 @@ class ExportGroup(django.views.View):
         columns.append(LinkExcelColumn(
             name='id',
             cell_width=5,
-            data=[user.id for user in members],
-            data_urls=[
+            data=(user.id for user in members),
+            data_urls=(
                 request.build_absolute_uri(django.urls.reverse(
                     'school:entrance:enrolling_user',
                     args=(request.school.short_name, user.id)))
                 for user in members
-            ],
+            ),
         ))
 
         columns.append(LinkExcelColumn(
             name='Фамилия',
-            data=[user.profile.last_name if hasattr(user, 'profile') else '' for user in members],
-            data_urls=[getattr(user.profile.poldnev_person, 'url', '') if hasattr(user, 'profile') else ''
-                       for user in members],
+            data=(user.profile.last_name if hasattr(user, 'profile') else '' for user in members),
+            data_urls=(getattr(user.profile.poldnev_person, 'url', '') if hasattr(user, 'profile') else ''
+                       for user in members),
         ))
 
         columns.append(PlainExcelColumn(
             name='Имя',
-            data=[user.profile.first_name if hasattr(user, 'profile') else '' for user in members],
+            data=(user.profile.first_name if hasattr(user, 'profile') else '' for user in members),
         ))
 
         columns.append(PlainExcelColumn(
             name='Отчество',
-            data=[user.profile.middle_name if hasattr(user, 'profile') else '' for user in members],
+            data=(user.profile.middle_name if hasattr(user, 'profile') else '' for user in members),
         ))
 
         columns.append(PlainExcelColumn(
             name='Пол',
-            data=['жм'[user.profile.sex == users.models.UserProfile.Sex.MALE] if hasattr(user, 'profile') else ''
-                  for user in members],
+            data=('жм'[user.profile.sex == users.models.UserProfile.Sex.MALE] if hasattr(user, 'profile') else ''
+                  for user in members),
         ))
 
         columns.append(PlainExcelColumn(
             name='Город',
-            data=[user.profile.city if hasattr(user, 'profile') else '' for user in members],
+            data=(user.profile.city if hasattr(user, 'profile') else '' for user in members),
         ))
 
         columns.append(PlainExcelColumn(
             name='Класс',
             cell_width=7,
-            data=[user.profile.get_class() if hasattr(user, 'profile') else '' for user in members],
+            data=(user.profile.get_class() if hasattr(user, 'profile') else '' for user in members),
         ))
 
         columns.append(PlainExcelColumn(
             name='Школа',
-            data=[user.profile.school_name if hasattr(user, 'profile') else '' for user in members],
+            data=(user.profile.school_name if hasattr(user, 'profile') else '' for user in members),
         ))
 
         columns.append(PlainExcelColumn(
             name='Емэйл',
-            data=[user.email for user in members]
+            data=(user.email for user in members)
         ))
 
         return columns
@@ -21,13 +21,14 @@ class IfInGroupNode(Node):
     def render(self, context):
         # TODO (andgein): make tag usefull for system-wide group,
         # not for school-specific ones only
-        school = context['request'].school
+        request = context['request']
+        school = request.school
         if self.user is None:
-            user = context['request'].user
+            user = request.user
         else:
             user = self.user.resolve(context, True)
         group_name = self.group_name.resolve(context, True)
-        if groups.is_user_in_group(user, group_name, school):
+        if groups.is_user_in_group(user, group_name, school, request=request):
             return self.nodelist_true.render(context)
         return self.nodelist_false.render(context)
 
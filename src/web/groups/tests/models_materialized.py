@@ -0,0 +1,71 @@
+"""Tests for materialized members of groups.models.AbstractGroup."""
+
+from django.test import TestCase
+
+import groups.models
+import users.models
+
+
+class MaterializedGroupMembersTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            users.models.User.objects.create_user(
+                'user%d' % i, 'user%d@test.org' % i, 'password')
+            for i in range(4)
+        ]
+        self.group = groups.models.ManuallyFilledGroup.objects.create(
+            short_name='group', name='Group', description='')
+        self.nested_group = groups.models.ManuallyFilledGroup.objects.create(
+            short_name='nested', name='Nested', description='')
+        self.other_group = groups.models.ManuallyFilledGroup.objects.create(
+            short_name='other', name='Other', description='')
+        groups.models.GroupInGroupMembership.objects.create(
+            group=self.group, member=self.nested_group)
+
+        self.group.add_user(self.users[0])
+        self.nested_group.add_user(self.users[1])
+        self.other_group.add_user(self.users[2])
+
+        self.union = groups.models.UnionGroup.objects.create(
+            short_name='union', name='Union', description='')
+        self.union.groups.set([self.group, self.other_group])
+        self.difference = groups.models.DifferenceGroup.objects.create(
+            short_name='difference', name='Difference', description='',
+            from_group=self.union, not_from_group=self.nested_group)
+
+    def assertMembers(self, group, expected_users):
+        group.refresh_from_db()
+        self.assertSetEqual(set(group.user_ids), {u.id for u in expected_users})
+        self.assertSetEqual(set(group.users), set(expected_users))
+        for user in self.users:
+            self.assertEqual(group.is_user_in_group(user), user in expected_users)
+
+    def test_nested_groups(self):
+        self.assertMembers(self.group, self.users[:2])
+        self.assertMembers(self.union, self.users[:3])
+        self.assertMembers(self.difference, [self.users[0], self.users[2]])
+
+    def test_added_user_invalidates_dependants(self):
+        self.assertMembers(self.difference, [self.users[0], self.users[2]])
+
+        self.nested_group.add_user(self.users[3])
+
+        self.assertMembers(self.group, self.users[:2] + [self.users[3]])
+        self.assertMembers(self.union, self.users)
+        self.assertMembers(self.difference, [self.users[0], self.users[2]])
+
+    def test_removed_user_and_group(self):
+        self.assertMembers(self.union, self.users[:3])
+
+        groups.models.UserInGroupMembership.objects.filter(
+            group=self.nested_group, member=self.users[1]).delete()
+        self.assertMembers(self.union, [self.users[0], self.users[2]])
+
+        self.union.groups.remove(self.other_group)
+        self.assertMembers(self.union, [self.users[0]])
+        self.assertMembers(self.difference, [self.users[0]])
+
+    def test_actual_members_are_not_rebuilt(self):
+        self.assertMembers(self.union, self.users[:3])
+        with self.assertNumQueries(2):
+            self.assertTrue(self.union.is_user_in_group(self.users[0]))
@@ -0,0 +1,49 @@
+"""Tests for groups.middleware.GroupMembershipResolver."""
+
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory
+
+import groups
+import groups.decorators
+import groups.models
+import users.models
+
+
+class GroupMembershipResolverTestCase(TestCase):
+    def setUp(self):
+        self.user = users.models.User.objects.create_user(
+            'user', 'user@test.org', 'password')
+        self.other_user = users.models.User.objects.create_user(
+            'other', 'other@test.org', 'password')
+        self.group = groups.models.ManuallyFilledGroup.objects.create(
+            short_name='test_group', name='Test group', description='')
+        self.group.add_user(self.user)
+
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_answers_are_memoized(self):
+        self.assertTrue(groups.is_user_in_group(
+            self.user, 'test_group', request=self.request))
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertTrue(groups.is_user_in_group(
+                    self.user, 'test_group', request=self.request))
+        self.assertFalse(groups.is_user_in_group(
+            self.other_user, 'test_group', request=self.request))
+
+    def test_unknown_group(self):
+        with self.assertRaises(ValueError):
+            groups.is_user_in_group(self.user, 'unknown', request=self.request)
+
+    def test_only_for_groups_uses_request_cache(self):
+        @groups.decorators.only_for_groups('test_group')
+        def view(request):
+            return HttpResponse()
+
+        self.assertEqual(view(self.request).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(view(self.request).status_code, 200)
+
+        self.request.user = self.other_user
+        self.assertEqual(view(self.request).status_code, 404)
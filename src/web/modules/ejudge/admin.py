@@ -21,6 +21,7 @@ class QueueElementAdmin(admin.ModelAdmin):
         'submission_link',
         'language',
         'status',
+        'claimed_by',
         'updated_at',
     )
 
@@ -0,0 +1,291 @@
+import threading
+import urllib.parse
+
+import requests
+from bs4 import BeautifulSoup
+
+from .metrics import SubmitterMetrics
+
+
+class EjudgeException(Exception):
+    pass
+
+
+class CantSubmitEjudgeException(EjudgeException):
+    pass
+
+
+class SessionExpiredEjudgeException(EjudgeException):
+    pass
+
+
+class _ContestSession:
+    """
+    SID of the contest shared between threads. requests.Session (and its
+    cookie jar) is not thread-safe, so each thread sends requests through its
+    own http session with cookies received on the last login.
+    """
+    def __init__(self):
+        self.sid = None
+        self.cookies = {}
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        """ Http session of the current thread """
+        if not hasattr(self._local, 'http'):
+            self._local.http = requests.session()
+            self._local.sid = None
+        if self._local.sid != self.sid:
+            self._local.http.cookies.update(self.cookies)
+            self._local.sid = self.sid
+        return self._local.http
+
+
+class EjudgeClient:
+    """
+    Client for ejudge's `new-client` interface.
+
+    Keeps a SID for each contest and logs in again only when ejudge stops
+    accepting the SID. Instances can be shared between threads: the SID is
+    shared, but each thread has its own persistent http session.
+    """
+
+    # Substrings which ejudge puts into a page when the SID is not valid anymore
+    SESSION_EXPIRED_MARKERS = ['Invalid session']
+
+    VIEW_SUBMISSIONS_ACTION = 140
+    PROBLEM_PAGE_ACTION = 139
+    REPORT_ACTION = 37
+
+    def __init__(self, backend_address, login, password, stdout, style, metrics=None):
+        self.backend_address = backend_address
+        self.ejudge_login = login
+        self.ejudge_password = password
+        self.stdout = stdout
+        self.style = style
+        self.metrics = SubmitterMetrics() if metrics is None else metrics
+
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    @staticmethod
+    def _find_between(text, pre, post):
+        start_pos = text.find(pre)
+        finish_pos = text.find(post, start_pos)
+        if finish_pos < 0:
+            finish_pos = len(text)
+        return text[start_pos+len(pre):finish_pos]
+
+    def _build_client_url(self, sid='', action=0, additional_params=''):
+        params = ''
+        if sid != '':
+            params += '&SID=%s' % (sid, )
+        if action > 0:
+            params += '&action=%d' % (action, )
+        if additional_params != '':
+            params += '&%s' % (additional_params, )
+        if params.startswith('&'):
+            params = '?' + params[1:]
+
+        # TODO (andgein): build address with library functions
+        return '%s/cgi-bin/new-client%s' % (self.backend_address, params)
+
+    def _get_contest_session(self, contest_id):
+        with self._sessions_lock:
+            if contest_id not in self._sessions:
+                self._sessions[contest_id] = _ContestSession()
+            return self._sessions[contest_id]
+
+    def _login(self, contest_session, contest_id):
+        self.stdout.write(
+            'Try to authorize in ejudge contest %d with login %s and password %s' % (
+                contest_id, self.ejudge_login, '*' * len(self.ejudge_password)
+            )
+        )
+        login_url = self._build_client_url()
+        login_data = {'contest_id': contest_id,
+                      'role': 0,
+                      'prob_name': '',
+                      'login': self.ejudge_login,
+                      'password': self.ejudge_password,
+                      'locale_id': 0}
+        self.metrics.inc('logins')
+        http = contest_session.http
+        r = http.post(login_url, login_data)
+        if r.status_code != 200:
+            raise EjudgeException('Invalid http status code: %d' % r.status_code)
+
+        self.stdout.write('Success: current url is %s' % r.url)
+        new_url = urllib.parse.urlparse(r.url)
+        qs = urllib.parse.parse_qs(new_url.query)
+        if 'SID' not in qs:
+            raise EjudgeException('Can\'t find param SID in url: %s' % r.url)
+        sid = qs['SID'][0]
+        self.stdout.write('Current SID for contest %d is %s' % (contest_id, sid))
+        return sid, http.cookies.get_dict()
+
+    def _get_sid(self, contest_session, contest_id, expired_sid=None):
+        with contest_session.lock:
+            # Another thread could have already logged in while we waited
+            # for the lock
+            if contest_session.sid is None or contest_session.sid == expired_sid:
+                sid, cookies = self._login(contest_session, contest_id)
+                # Cookies are set first: other threads take them when they
+                # see the new SID
+                contest_session.cookies = cookies
+                contest_session.sid = sid
+            return contest_session.sid
+
+    def _call_with_session(self, contest_id, func):
+        """
+        Calls `func(http_session, sid)` with the cached SID for the contest.
+        If ejudge reports that the SID has expired, logs in again and repeats
+        the call once.
+        """
+        contest_session = self._get_contest_session(contest_id)
+        sid = self._get_sid(contest_session, contest_id)
+        try:
+            return func(contest_session.http, sid)
+        except SessionExpiredEjudgeException:
+            self.stdout.write(self.style.WARNING(
+                'SID %s for contest %d has expired' % (sid, contest_id)
+            ))
+            sid = self._get_sid(contest_session, contest_id, expired_sid=sid)
+            return func(contest_session.http, sid)
+
+    def _check_response(self, r):
+        if r.status_code != 200:
+            raise EjudgeException('Bad http status code: %d' % r.status_code)
+        if any(marker in r.text for marker in self.SESSION_EXPIRED_MARKERS):
+            raise SessionExpiredEjudgeException(r.url)
+
+    def submit(self, contest_id, problem_id, language_ejudge_id, file_name):
+        def do_submit(http, sid):
+            submit_url = self._build_client_url()
+            submit_data = {'SID': sid,
+                           'prob_id': problem_id,
+                           'lang_id': language_ejudge_id,
+                           'action_40': True,
+                           }
+            with open(file_name, 'rb') as opened_file, self.metrics.timer('submit_time'):
+                files = {'file': opened_file}
+                r = http.post(submit_url, submit_data, files=files)
+            self._check_response(r)
+            return r
+
+        r = self._call_with_session(contest_id, do_submit)
+
+        error_string = 'Error: '
+        if error_string in r.text:
+            error_message = self._find_between(r.text, error_string, '<')
+            raise CantSubmitEjudgeException(error_message)
+
+        # TODO: use bs4?
+        run_id_pre = '<td class="b1">'
+        run_id_post = '</td>'
+        run_id = self._find_between(r.text, run_id_pre, run_id_post)
+        try:
+            run_id = int(run_id)
+        except ValueError as e:
+            raise EjudgeException('Invalid non-numeric run_id: %s' % run_id) from e
+
+        return run_id
+
+    def _download_page(self, contest_id, action, additional_params=''):
+        def do_download(http, sid):
+            url = self._build_client_url(sid, action, additional_params)
+            self.stdout.write(self.style.WARNING(
+                'Download page from %s' % (url,)
+            ))
+            self.metrics.inc('pages_fetched')
+            r = http.get(url)
+            self._check_response(r)
+            return r.text
+
+        return self._call_with_session(contest_id, do_download)
+
+    @staticmethod
+    def _parse_runs_page(page):
+        """
+        Parses runs table from the page and returns index
+        {run_id: (result, failed_test, score)}
+        """
+        parsed = BeautifulSoup(page)
+        table = parsed.find(attrs={'class': 'table'})
+        runs = {}
+        if table is None:
+            return runs
+
+        for tr in table.find_all('tr')[1:]:
+            tds = tr.find_all('td')
+            # Run_id, Time, Size, Problem, Language, Result, Failed Test, Report
+            try:
+                run_id = int(tds[0].get_text())
+            except (IndexError, ValueError):
+                continue
+
+            result = tds[5].get_text()
+            failed_test = tds[6].get_text()
+            try:
+                failed_test = int(failed_test)
+            except Exception:
+                failed_test = None
+
+            score = None
+            if result == 'Partial solution':
+                try:
+                    score = int(tds[7].get_text())
+                except Exception:
+                    pass
+
+            runs[run_id] = (result, failed_test, score)
+        return runs
+
+    def get_runs_statuses(self, contest_id, runs):
+        """
+        Finds statuses of several runs of one contest at once.
+
+        `runs` is a dict {submit_id: problem_id}. Returns dict
+        {submit_id: (result, failed_test, score)} for all runs found in ejudge.
+        Each page is downloaded and parsed at most once per call.
+        """
+        statuses = {}
+
+        def find_on_page(action, additional_params=''):
+            page = self._download_page(contest_id, action, additional_params)
+            with self.metrics.timer('parse_time'):
+                index = self._parse_runs_page(page)
+            for submit_id in runs.keys() - statuses.keys():
+                if submit_id in index:
+                    statuses[submit_id] = index[submit_id]
+
+        # Look at total submissions page first: it contains latest runs
+        # for all problems
+        find_on_page(self.VIEW_SUBMISSIONS_ACTION)
+
+        # Then look at problems' pages, but only for runs not found yet
+        for problem_id in sorted({runs[submit_id] for submit_id in runs.keys() - statuses.keys()}):
+            find_on_page(self.PROBLEM_PAGE_ACTION, f'prob_id={problem_id}')
+
+        # Look at "all_runs" submissions page (can be very slow)
+        if runs.keys() - statuses.keys():
+            find_on_page(self.VIEW_SUBMISSIONS_ACTION, 'all_runs=1')
+
+        for submit_id, (result, failed_test, _) in sorted(statuses.items()):
+            self.stdout.write(self.style.SUCCESS(
+                'Found status of submission %d: %r (test %r)' % (submit_id, result, failed_test)
+            ))
+        return statuses
+
+    def get_run_report(self, contest_id, submit_id):
+        page = self._download_page(
+            contest_id, self.REPORT_ACTION, 'run_id=%d' % (submit_id, )
+        )
+        soup = BeautifulSoup(page)
+        pres = soup.find_all('pre')
+        if len(pres) < 1:
+            return ''
+
+        return pres[0].get_text()
@@ -0,0 +1,320 @@
+"""
+Local stand-in for ejudge's `new-client` interface. Implements only what
+modules.ejudge.client.EjudgeClient uses: login with SID redirect, submitting
+(action_40), runs tables (actions 139 and 140) and reports (action 37).
+Runs are "judged" after a random delay with a random verdict.
+
+Used for benchmarking and testing the submitter without a live ejudge,
+see `run_fake_ejudge` and `benchmark_submitter` management commands.
+"""
+
+import email.parser
+import html
+import http.server
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+
+
+class FakeRun:
+    def __init__(self, run_id, contest_id, problem_id, language_id, size, result,
+                 failed_test, score, judged_at):
+        self.run_id = run_id
+        self.contest_id = contest_id
+        self.problem_id = problem_id
+        self.language_id = language_id
+        self.size = size
+        self.result = result
+        self.failed_test = failed_test
+        self.score = score
+        self.submitted_at = time.time()
+        self.judged_at = judged_at
+
+    @property
+    def is_judged(self):
+        return time.time() >= self.judged_at
+
+    def get_status(self):
+        if not self.is_judged:
+            return 'Running...', None, None
+        return self.result, self.failed_test, self.score
+
+
+class FakeEjudge:
+    """
+    State of the fake ejudge server. Thread-safe.
+
+    :param verdicts: dict {ejudge status: weight}
+    :param min_judging_delay, max_judging_delay: judging delay of each run is
+        chosen uniformly from this range, in seconds
+    :param sid_lifetime: SIDs stop working after this number of seconds,
+        None means forever
+    :param runs_on_page: number of latest runs shown on the submissions page
+        without `all_runs=1` and on the problem page
+    """
+
+    DEFAULT_VERDICTS = {
+        'OK': 60,
+        'Wrong answer': 20,
+        'Time-limit exceeded': 5,
+        'Run-time error': 5,
+        'Compilation error': 5,
+        'Partial solution': 5,
+    }
+
+    def __init__(self, verdicts=None, min_judging_delay=1, max_judging_delay=3,
+                 sid_lifetime=None, runs_on_page=50, seed=None):
+        self.verdicts = dict(self.DEFAULT_VERDICTS if verdicts is None else verdicts)
+        self.min_judging_delay = min_judging_delay
+        self.max_judging_delay = max_judging_delay
+        self.sid_lifetime = sid_lifetime
+        self.runs_on_page = runs_on_page
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sessions = {}  # SID -> (contest_id, created_at)
+        self._runs = {}  # contest_id -> list of FakeRun
+        self._next_run_id = 1
+
+    def login(self, contest_id):
+        sid = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._sessions[sid] = (contest_id, time.time())
+        return sid
+
+    def get_contest_id(self, sid):
+        """
+        :return: contest id for the valid SID, None for unknown or expired one
+        """
+        with self._lock:
+            if sid not in self._sessions:
+                return None
+            contest_id, created_at = self._sessions[sid]
+            if self.sid_lifetime is not None and time.time() - created_at > self.sid_lifetime:
+                del self._sessions[sid]
+                return None
+            return contest_id
+
+    def submit(self, contest_id, problem_id, language_id, size):
+        with self._lock:
+            result = self._random.choices(
+                list(self.verdicts.keys()), list(self.verdicts.values())
+            )[0]
+            failed_test = None
+            score = None
+            if result == 'Partial solution':
+                failed_test = self._random.randint(2, 20)
+                score = self._random.randint(1, 99)
+            elif result not in ('OK', 'Compilation error'):
+                failed_test = self._random.randint(1, 20)
+            judging_delay = self._random.uniform(self.min_judging_delay, self.max_judging_delay)
+
+            run = FakeRun(
+                self._next_run_id, contest_id, problem_id, language_id, size,
+                result, failed_test, score, time.time() + judging_delay,
+            )
+            self._next_run_id += 1
+            self._runs.setdefault(contest_id, []).append(run)
+            return run
+
+    def get_runs(self, contest_id, problem_id=None, all_runs=False):
+        """
+        :return: runs of the contest, newest first
+        """
+        with self._lock:
+            runs = list(reversed(self._runs.get(contest_id, [])))
+        if problem_id is not None:
+            runs = [run for run in runs if run.problem_id == problem_id]
+        if not all_runs:
+            runs = runs[:self.runs_on_page]
+        return runs
+
+    def get_run(self, contest_id, run_id):
+        with self._lock:
+            for run in self._runs.get(contest_id, []):
+                if run.run_id == run_id:
+                    return run
+        return None
+
+
+def _render_page(body):
+    return '<html><head><title>ejudge</title></head><body>%s</body></html>' % body
+
+
+def _render_runs_table(runs):
+    rows = ['<tr><th>Run ID</th><th>Time</th><th>Size</th><th>Problem</th>'
+            '<th>Language</th><th>Result</th><th>Failed test</th><th>Score</th></tr>']
+    for run in runs:
+        result, failed_test, score = run.get_status()
+        rows.append(
+            '<tr><td>%d</td><td>%s</td><td>%d</td><td>%d</td><td>%s</td>'
+            '<td>%s</td><td>%s</td><td>%s</td></tr>' % (
+                run.run_id,
+                time.strftime('%H:%M:%S', time.gmtime(run.submitted_at)),
+                run.size,
+                run.problem_id,
+                run.language_id,
+                html.escape(result),
+                '' if failed_test is None else failed_test,
+                '' if score is None else score,
+            )
+        )
+    return '<table class="table">%s</table>' % ''.join(rows)
+
+
+class FakeEjudgeRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Set by FakeEjudgeServer
+    ejudge = None
+    quiet = True
+
+    CLIENT_PATH = '/cgi-bin/new-client'
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send_page(self, body, status=200):
+        content = _render_page(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _redirect(self, location):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _read_form(self):
+        """
+        Parses url-encoded or multipart form.
+        :return: dict {name: str value} and dict {name: bytes} for files
+        """
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/form-data'):
+            params = urllib.parse.parse_qs(body.decode('utf-8'), keep_blank_values=True)
+            return {name: values[0] for name, values in params.items()}, {}
+
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode('ascii') + b'\r\n\r\n' + body
+        )
+        fields = {}
+        files = {}
+        for part in message.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            if part.get_param('filename', header='content-disposition') is not None:
+                files[name] = payload
+            else:
+                fields[name] = payload.decode('utf-8')
+        return fields, files
+
+    def _get_contest_id_or_fail(self, sid):
+        contest_id = self.ejudge.get_contest_id(sid)
+        if contest_id is None:
+            self._send_page('<p>Error: Invalid session</p>')
+        return contest_id
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != self.CLIENT_PATH:
+            self.send_error(404)
+            return
+        params = {name: values[0] for name, values in urllib.parse.parse_qs(url.query).items()}
+
+        contest_id = self._get_contest_id_or_fail(params.get('SID', ''))
+        if contest_id is None:
+            return
+
+        action = int(params.get('action', 0))
+        if action == 140:
+            runs = self.ejudge.get_runs(contest_id, all_runs=params.get('all_runs') == '1')
+            self._send_page('<h2>Submissions</h2>' + _render_runs_table(runs))
+        elif action == 139:
+            problem_id = int(params.get('prob_id', 0))
+            runs = self.ejudge.get_runs(contest_id, problem_id=problem_id)
+            self._send_page('<h2>Problem %d</h2>%s' % (problem_id, _render_runs_table(runs)))
+        elif action == 37:
+            run = self.ejudge.get_run(contest_id, int(params.get('run_id', 0)))
+            if run is None:
+                self._send_page('<p>Error: Invalid run_id</p>')
+                return
+            result, failed_test, _ = run.get_status()
+            self._send_page('<pre>Run %d: %s%s</pre>' % (
+                run.run_id,
+                html.escape(result),
+                '' if failed_test is None else ' on test %d' % failed_test,
+            ))
+        else:
+            # Main page of the contest
+            self._send_page('<h2>Contest %d</h2>' % contest_id)
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != self.CLIENT_PATH:
+            self.send_error(404)
+            return
+        fields, files = self._read_form()
+
+        if 'login' in fields:
+            contest_id = int(fields.get('contest_id', 0))
+            sid = self.ejudge.login(contest_id)
+            self._redirect('%s?SID=%s&action=2' % (self.CLIENT_PATH, sid))
+            return
+
+        if 'action_40' in fields:
+            contest_id = self._get_contest_id_or_fail(fields.get('SID', ''))
+            if contest_id is None:
+                return
+            if 'file' not in files or not files['file']:
+                self._send_page('<p>Error: Empty submission<br></p>')
+                return
+            run = self.ejudge.submit(
+                contest_id,
+                int(fields.get('prob_id', 0)),
+                fields.get('lang_id', ''),
+                len(files['file']),
+            )
+            self._send_page('<table><tr><td class="b1">%d</td></tr></table>' % run.run_id)
+            return
+
+        self.send_error(400)
+
+
+class FakeEjudgeServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, ejudge, quiet=True):
+        handler = type('Handler', (FakeEjudgeRequestHandler, ), {
+            'ejudge': ejudge,
+            'quiet': quiet,
+        })
+        super().__init__(address, handler)
+        self.ejudge = ejudge
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def parse_verdicts(value):
+    """
+    Parses verdicts mix like "OK:70,Wrong answer:20,Compilation error:10"
+    """
+    verdicts = {}
+    for item in value.split(','):
+        status, _, weight = item.rpartition(':')
+        verdicts[status.strip()] = float(weight)
+    return verdicts
@@ -0,0 +1,212 @@
+import math
+import os
+import tempfile
+import threading
+import time
+
+from constance import config
+from django.conf import settings
+from django.core import management
+from django.core.management.base import BaseCommand, CommandError
+
+from modules.ejudge import fake_server, models, queue
+from modules.ejudge.management.commands import run_submitter
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Enqueue many solutions to ejudge queue, wait until they are checked '
+        'and report throughput and verdict latency of the submitter. '
+        'By default starts fake ejudge and the submitter in this process. '
+        'Solutions are added to the queue of the configured database, so run '
+        'it with DEBUG = True on a separate database'
+    )
+
+    PROGRESS_INTERVAL = 1  # in seconds
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count', type=int, default=1000,
+            help='Number of queue elements to enqueue. Default is 1000',
+        )
+        parser.add_argument('--contest-id', type=int, default=1)
+        parser.add_argument(
+            '--problems', type=int, default=5,
+            help='Solutions are spread between this number of problems',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=run_submitter.Command.DEFAULT_WORKERS_COUNT,
+        )
+        parser.add_argument(
+            '--poll-budget', type=int, default=run_submitter.Command.DEFAULT_POLL_BUDGET,
+        )
+        parser.add_argument(
+            '--backend-address', default=None,
+            help='Use real ejudge server instead of the fake one. '
+                 'Be careful: all solutions are really submitted',
+        )
+        parser.add_argument(
+            '--external-submitter', action='store_true',
+            help="Don't start the submitter in this process, wait for "
+                 'already running one',
+        )
+        parser.add_argument('--min-judging-delay', type=float, default=1)
+        parser.add_argument('--max-judging-delay', type=float, default=3)
+        parser.add_argument(
+            '--verdicts', default=None,
+            help='Verdicts mix of the fake ejudge, i.e. '
+                 '"OK:70,Wrong answer:20,Compilation error:10"',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=600,
+            help='Stop waiting after this number of seconds. Default is 600',
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help="Don't remove created queue elements after the benchmark",
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Run even if DEBUG is False. Submitters running with '
+                 'the same database can take the benchmark solutions and send '
+                 'them to their ejudge',
+        )
+
+    def _start_fake_ejudge(self, options):
+        verdicts = None
+        if options['verdicts']:
+            verdicts = fake_server.parse_verdicts(options['verdicts'])
+        ejudge = fake_server.FakeEjudge(
+            verdicts=verdicts,
+            min_judging_delay=options['min_judging_delay'],
+            max_judging_delay=options['max_judging_delay'],
+        )
+        server = fake_server.FakeEjudgeServer(('127.0.0.1', 0), ejudge)
+        server.start_in_thread()
+        self.stdout.write('Fake ejudge is listening on %s' % (server.url, ))
+        return server.url
+
+    def _start_submitter(self, backend_address, file_name, options):
+        # Submitter's own log is too verbose for the benchmark
+        devnull = open(os.devnull, 'w')
+        submitter = run_submitter.Command(stdout=devnull)
+        thread = threading.Thread(
+            target=management.call_command,
+            args=(submitter, ),
+            kwargs={
+                'workers': options['workers'],
+                'poll_budget': options['poll_budget'],
+                'backend_address': backend_address,
+                'submitter_id': 'benchmark:%d' % os.getpid(),
+                # Real solutions from the queue are left to real submitters
+                'file_name_prefix': file_name,
+            },
+            daemon=True,
+        )
+        thread.start()
+        return submitter
+
+    def _enqueue(self, file_name, options):
+        elements = [
+            models.QueueElement(
+                ejudge_contest_id=options['contest_id'],
+                ejudge_problem_id=1 + i % options['problems'],
+                language=None,
+                file_name=file_name,
+            )
+            for i in range(options['count'])
+        ]
+        models.QueueElement.objects.bulk_create(elements)
+
+    def _wait(self, elements, timeout):
+        pending_statuses = [
+            models.QueueElement.Status.NOT_FETCHED,
+            models.QueueElement.Status.SUBMITTED,
+        ]
+        started_at = time.monotonic()
+        while True:
+            pending = elements.filter(status__in=pending_statuses).count()
+            elapsed = time.monotonic() - started_at
+            self.stdout.write('%6.1f s: %d solutions are not checked yet' % (
+                elapsed, pending
+            ))
+            if pending == 0:
+                return elapsed
+            if elapsed > timeout:
+                raise CommandError('Timeout: %d elements are not checked' % pending)
+            time.sleep(self.PROGRESS_INTERVAL)
+
+    def _report(self, elements, elapsed):
+        count = elements.count()
+        latencies = sorted(
+            (updated_at - created_at).total_seconds()
+            for created_at, updated_at in elements.filter(
+                status=models.QueueElement.Status.CHECKED
+            ).values_list('created_at', 'updated_at')
+        )
+        wont_check = elements.filter(status=models.QueueElement.Status.WONT_CHECK).count()
+
+        self.stdout.write(self.style.SUCCESS('Checked %d solutions in %.1f s' % (count, elapsed)))
+        self.stdout.write('Throughput: %.2f solutions/s' % (count / elapsed if elapsed > 0 else 0))
+        self.stdout.write('Not submitted (WONT_CHECK): %d' % wont_check)
+        for q in [50, 95, 99]:
+            value = _percentile(latencies, q)
+            self.stdout.write('Verdict latency p%d: %s' % (
+                q, '-' if value is None else '%.2f s' % value
+            ))
+
+    def _cleanup(self, elements):
+        models.SolutionCheckingResult.objects.filter(
+            submission__queueelement__in=elements
+        ).delete()
+        # Queue elements are removed by cascade
+        models.Submission.objects.filter(queueelement__in=elements).delete()
+        elements.delete()
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['problems'] < 1:
+            raise CommandError('Count and number of problems should be positive')
+
+        if not settings.DEBUG and not options['force']:
+            raise CommandError(
+                'DEBUG is False, so it looks like a production database. '
+                'Run the benchmark on a separate database or pass --force'
+            )
+
+        backend_address = options['backend_address']
+        if backend_address is None:
+            if options['external_submitter']:
+                backend_address = config.SISTEMA_EJUDGE_BACKEND_ADDRESS
+            else:
+                backend_address = self._start_fake_ejudge(options)
+
+        with tempfile.NamedTemporaryFile(
+                mode='w', prefix='benchmark-submitter-', suffix='.cpp', delete=False) as solution:
+            solution.write('int main() { return 0; }\n')
+
+        submitter = None
+        if not options['external_submitter']:
+            submitter = self._start_submitter(backend_address, solution.name, options)
+
+        elements = models.QueueElement.objects.filter(file_name=solution.name)
+        try:
+            self._enqueue(solution.name, options)
+            if submitter is None:
+                queue.notify_submitter()
+            else:
+                # Other submitters on this host are not woken up
+                submitter._submit_wakeup.wake()
+            self.stdout.write('Enqueued %d solutions' % options['count'])
+            elapsed = self._wait(elements, options['timeout'])
+            self._report(elements, elapsed)
+        finally:
+            if not options['keep']:
+                self._cleanup(elements)
+            os.remove(solution.name)
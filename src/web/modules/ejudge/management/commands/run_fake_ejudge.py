@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from modules.ejudge import fake_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Run local fake ejudge server for testing and benchmarking '
+        'the submitter. Run submitter with '
+        '`run_submitter --backend-address http://<host>:<port>`'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8800)
+        parser.add_argument(
+            '--min-judging-delay', type=float, default=1,
+            help='Minimal judging time of one run in seconds. Default is 1',
+        )
+        parser.add_argument(
+            '--max-judging-delay', type=float, default=3,
+            help='Maximal judging time of one run in seconds. Default is 3',
+        )
+        parser.add_argument(
+            '--verdicts', default=None,
+            help='Verdicts mix with weights, i.e. '
+                 '"OK:70,Wrong answer:20,Compilation error:10"',
+        )
+        parser.add_argument(
+            '--sid-lifetime', type=float, default=None,
+            help='SID expires after this number of seconds. '
+                 'Default is never',
+        )
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--verbose-requests', action='store_true')
+
+    def handle(self, *args, **options):
+        verdicts = None
+        if options['verdicts']:
+            verdicts = fake_server.parse_verdicts(options['verdicts'])
+        ejudge = fake_server.FakeEjudge(
+            verdicts=verdicts,
+            min_judging_delay=options['min_judging_delay'],
+            max_judging_delay=options['max_judging_delay'],
+            sid_lifetime=options['sid_lifetime'],
+            seed=options['seed'],
+        )
+        server = fake_server.FakeEjudgeServer(
+            (options['host'], options['port']),
+            ejudge,
+            quiet=not options['verbose_requests'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Fake ejudge is listening on %s' % (server.url, )
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,347 +1,461 @@
+import collections
+import concurrent.futures
+import datetime
+import os
+import socket
+import threading
 import time
 import traceback
-import urllib.parse
-from bs4 import BeautifulSoup
-import requests
 
-from django.core.management.base import BaseCommand
+from django import db
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from constance import config
 
 from modules.ejudge import models
+from modules.ejudge.metrics import SubmitterMetrics
+from modules.ejudge.queue import SubmitterWakeup
+from modules.ejudge.client import EjudgeClient, CantSubmitEjudgeException
 
 
 # Assume that ejudge's contest has option `prev_runs_to_show = 50` in serve.cfg for all problems
 EJUDGE_SUBMISSIONS_LIMIT = 40
 
 
-class EjudgeException(Exception):
-    pass
-
-
-class CantSubmitEjudgeException(EjudgeException):
-    pass
-
-
 class Command(BaseCommand):
     help = 'Run ejudge submitter for submitted solutions by users'
     TIME_INTERVAL = 0.5  # in seconds
+    # Idle stage doubles its sleeping interval up to this value. Submitter is
+    # woken up earlier when new solutions are added on the same host
+    MAX_IDLE_TIME_INTERVAL = 5  # in seconds
+    DEFAULT_WORKERS_COUNT = 4
+    # Queue elements claimed by a crashed submitter are picked up by others
+    # after this timeout
+    LEASE_DURATION = datetime.timedelta(minutes=5)
+    # Delay before the next status check of a run grows exponentially with
+    # the number of checks: 0.5, 1, 2, 4, ... seconds. So runs stuck in
+    # ejudge don't consume the scraping capacity
+    POLL_BACKOFF_BASE = 0.5  # in seconds
+    MAX_POLL_DELAY = 30  # in seconds
+    DEFAULT_POLL_BUDGET = 20
+    METRICS_SAVE_INTERVAL = 10  # in seconds
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.backend_address = config.SISTEMA_EJUDGE_BACKEND_ADDRESS
-        self.ejudge_login = config.SISTEMA_EJUDGE_USER
-        self.ejudge_password = config.SISTEMA_EJUDGE_PASSWORD
-        self.session = requests.session()
-
-    @staticmethod
-    def _find_between(text, pre, post):
-        start_pos = text.find(pre)
-        finish_pos = text.find(post, start_pos)
-        if finish_pos < 0:
-            finish_pos = len(text)
-        return text[start_pos+len(pre):finish_pos]
-
-    def _build_client_url(self, sid='', action=0, additional_params=''):
-        params = ''
-        if sid != '':
-            params += '&SID=%s' % (sid, )
-        if action > 0:
-            params += '&action=%d' % (action, )
-        if additional_params != '':
-            params += '&%s' % (additional_params, )
-        if params.startswith('&'):
-            params = '?' + params[1:]
-
-        # TODO (andgein): build address with library functions
-        return '%s/cgi-bin/new-client%s' % (self.backend_address, params)
-
-    # TODO (andgein): extract to EjudgeApi
-    def _login(self, contest_id):
-        self.stdout.write(
-            'Try to authorize in ejudge with login %s and password %s' % (
-                self.ejudge_login, '*' * len(self.ejudge_password)
-            )
+        self.submitter_id = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.workers_count = self.DEFAULT_WORKERS_COUNT
+        self.poll_budget = self.DEFAULT_POLL_BUDGET
+        self.file_name_prefix = ''
+
+        self.metrics = SubmitterMetrics()
+        self.started_at = timezone.now()
+        self._metrics_lock = threading.Lock()
+        self._metrics_saved_at = time.monotonic()
+        self._pages_fetched_before_tick = 0
+
+        self.client = EjudgeClient(
+            config.SISTEMA_EJUDGE_BACKEND_ADDRESS,
+            config.SISTEMA_EJUDGE_USER,
+            config.SISTEMA_EJUDGE_PASSWORD,
+            self.stdout,
+            self.style,
+            metrics=self.metrics,
         )
-        login_url = self._build_client_url()
-        login_data = {'contest_id': contest_id,
-                      'role': 0,
-                      'prob_name': '',
-                      'login': self.ejudge_login,
-                      'password': self.ejudge_password,
-                      'locale_id': 0}
-        r = self.session.post(login_url, login_data)
-        if r.status_code != 200:
-            raise EjudgeException('Invalid http status code: %d' % r.status_code)
-
-        self.stdout.write('Success: current url is %s' % r.url)
-        new_url = urllib.parse.urlparse(r.url)
-        qs = urllib.parse.parse_qs(new_url.query)
-        if 'SID' not in qs:
-            raise EjudgeException('Can\'t find param SID in url: %s' % r.url)
-        sid = qs['SID'][0]
-        self.stdout.write('Current SID is %s' % sid)
-        return sid
-
-    def _submit_to_ejudge(self, sid, problem_id, language_id, file_name):
-        submit_url = self._build_client_url()
-        submit_data = {'SID': sid,
-                       'prob_id': problem_id,
-                       'lang_id': language_id,
-                       'action_40': True,
-                       }
-        with open(file_name, 'rb') as opened_file:
-            files = {'file': opened_file}
-            r = self.session.post(submit_url, submit_data, files=files)
-
-        if r.status_code != 200:
-            raise EjudgeException('Bad http status code: %d' % r.status_code)
-
-        error_string = 'Error: '
-        if error_string in r.text:
-            error_message = self._find_between(r.text, error_string, '<')
-            raise CantSubmitEjudgeException(error_message)
-
-        # TODO: use bs4?
-        run_id_pre = '<td class="b1">'
-        run_id_post = '</td>'
-        run_id = self._find_between(r.text, run_id_pre, run_id_post)
-        try:
-            run_id = int(run_id)
-        except ValueError as e:
-            raise EjudgeException('Invalid non-numeric run_id: %s' % run_id) from e
 
-        return run_id
+        # Ids of queue elements which are being submitted and ids of contests
+        # which are being polled by workers right now. They are skipped by
+        # the stages until the worker finishes
+        self._submitting_ids = set()
+        self._polling_contest_ids = set()
+        self._in_progress_lock = threading.Lock()
+
+        self._submit_wakeup = SubmitterWakeup()
+        self._poll_wakeup = SubmitterWakeup(watch_queue=False)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=self.DEFAULT_WORKERS_COUNT,
+            help='Number of concurrent connections to ejudge for each stage '
+                 '(submitting and polling). Default is %d' % self.DEFAULT_WORKERS_COUNT,
+        )
+        parser.add_argument(
+            '--poll-budget',
+            type=int,
+            default=self.DEFAULT_POLL_BUDGET,
+            help='Maximum number of runs whose statuses are checked in ejudge '
+                 'per tick. Default is %d' % self.DEFAULT_POLL_BUDGET,
+        )
+        parser.add_argument(
+            '--backend-address',
+            default=None,
+            help='Address of ejudge server, i.e. http://localhost:8800. '
+                 'Default is SISTEMA_EJUDGE_BACKEND_ADDRESS from the config',
+        )
+        parser.add_argument(
+            '--submitter-id',
+            default=self.submitter_id,
+            help='Unique name of this submitter process, used for claiming '
+                 'queue elements. Default is <hostname>:<pid>',
+        )
+        parser.add_argument(
+            '--file-name-prefix',
+            default='',
+            help='Process only queue elements whose file name starts with '
+                 'this prefix. Used by benchmark_submitter to leave real '
+                 'solutions to the real submitters',
+        )
 
-    def _get_ejudge_run_status_from_url(self, runs_url, submit_id):
-        self.stdout.write(self.style.WARNING(
-            'Download runs page from %s' % (runs_url,)
+    def _run_in_worker(self, func, key, in_progress_keys, *args):
+        # Each worker thread has its own database connection, so it should
+        # take care of the stale ones
+        db.close_old_connections()
+        try:
+            func(*args)
+        except Exception as e:
+            self.metrics.inc('errors')
+            self.stdout.write(self.style.ERROR(
+                'Exception in %s for %s: %s' % (func.__name__, key, e)
+            ))
+            traceback.print_exc()
+        finally:
+            # The key is removed from in-progress set only after new statuses
+            # have been saved to the database. Otherwise stages could process
+            # the same queue elements twice.
+            with self._in_progress_lock:
+                in_progress_keys.discard(key)
+            db.close_old_connections()
+
+    def _dispatch(self, executor, func, key, in_progress_keys, *args):
+        with self._in_progress_lock:
+            if key in in_progress_keys:
+                return
+            in_progress_keys.add(key)
+        executor.submit(self._run_in_worker, func, key, in_progress_keys, *args)
+
+    def _submit_queue_element(self, queue_element):
+        try:
+            self._do_submit_queue_element(queue_element)
+        except Exception:
+            # Let this or another submitter retry without waiting for
+            # the lease expiration
+            models.QueueElement.release_claims([queue_element.id], self.submitter_id)
+            raise
+
+    def _is_still_claimed(self, queue_element):
+        if queue_element.is_claimed_by(self.submitter_id):
+            return True
+        self.stdout.write(self.style.ERROR(
+            'Lease for queue element #%d has expired and it has been '
+            'taken by another submitter' % (queue_element.id, )
+        ))
+        return False
+
+    def _do_submit_queue_element(self, queue_element):
+        self.stdout.write(self.style.SUCCESS(
+            'Found new submission #%d in queue: '
+            'to contest %d, problem %d, created at %s, file %s' % (
+                queue_element.id,
+                queue_element.ejudge_contest_id,
+                queue_element.ejudge_problem_id,
+                queue_element.created_at,
+                queue_element.file_name)
         ))
-        r = self.session.get(runs_url)
-        if r.status_code != 200:
-            raise EjudgeException('Bad http status code: %d' % r.status_code)
-
-        parsed = BeautifulSoup(r.text)
-        table = parsed.find(attrs={'class': 'table'})
-        for tr in table.find_all('tr')[1:]:
-            tds = tr.find_all('td')
-            # Run_id, Time, Size, Problem, Language, Result, Failed Test, Report
-            run_id = tds[0].get_text()
-            if run_id == str(submit_id):
-                result = tds[5].get_text()
-                failed_test = tds[6].get_text()
-                try:
-                    failed_test = int(failed_test)
-                except Exception:
-                    failed_test = None
-
-                score = None
-                if result == 'Partial solution':
-                    try:
-                        score = int(tds[7].get_text())
-                    except Exception:
-                        pass
-
-                self.stdout.write(self.style.SUCCESS(
-                    'Found status of submission %d: %r (test %r)' % (submit_id, result, failed_test)
-                ))
-                return result, failed_test, score
 
-        return None, None, None
+        language = queue_element.language
+        try:
+            ejudge_submit_id = self.client.submit(
+                queue_element.ejudge_contest_id,
+                queue_element.ejudge_problem_id,
+                None if language is None else language.ejudge_id,
+                queue_element.file_name
+            )
+        except CantSubmitEjudgeException as e:
+            self.stdout.write('Can\'t submit: %s' % (e, ))
+            with transaction.atomic():
+                if not self._is_still_claimed(queue_element):
+                    return
+                queue_element.status = models.QueueElement.Status.WONT_CHECK
+                queue_element.wont_check_message = str(e)
+                queue_element.release_claim()
+                queue_element.save()
+            return
+
+        with transaction.atomic():
+            if not self._is_still_claimed(queue_element):
+                return
+            self.stdout.write(
+                'Set status for queue element %d to SUBMITTED' % (
+                    queue_element.id,
+                )
+            )
+            submission = models.Submission(
+                ejudge_contest_id=queue_element.ejudge_contest_id,
+                ejudge_submit_id=ejudge_submit_id
+            )
+            submission.save()
+
+            queue_element.status = models.QueueElement.Status.SUBMITTED
+            queue_element.submission = submission
+            queue_element.release_claim()
+            queue_element.save()
 
-    def _get_ejudge_run_status(self, contest_id, submit_id, problem_id):
-        view_submissions = 140
-        problem_page = 139
+        self.metrics.inc('submitted')
+        self.metrics.observe(
+            'waiting_for_submit_time',
+            (timezone.now() - queue_element.created_at).total_seconds(),
+        )
+        self._poll_wakeup.wake()
 
-        ejudge_sid = self._login(contest_id)
+    def _save_checking_result(self, queue_element, ejudge_result, failed_test, score):
+        contest_id = queue_element.submission.ejudge_contest_id
+        submit_id = queue_element.submission.ejudge_submit_id
+        report = self.client.get_run_report(contest_id, submit_id)
 
-        # Look at problem's page first
-        problem_page_url = self._build_client_url(ejudge_sid, problem_page, f'prob_id={problem_id}')
-        result, failed_test, score = self._get_ejudge_run_status_from_url(
-            problem_page_url,
-            submit_id
+        self.stdout.write(
+            'Submission has been checked: '
+            'result is %s' % ejudge_result
         )
-        if result is not None:
-            return result, failed_test, score
-
-        # Look at total submissions page
-        runs_url = self._build_client_url(ejudge_sid, view_submissions)
-        result, failed_test, score = self._get_ejudge_run_status_from_url(
-            runs_url,
-            submit_id
+        result = models.CheckingResult.Result.from_ejudge_status(
+            ejudge_result
         )
-        if result is not None:
-            return result, failed_test, score
-
-        # Look at "all_runs" submissions page (can be very slow)
-        runs_url = self._build_client_url(ejudge_sid, view_submissions, 'all_runs=1')
-        return self._get_ejudge_run_status_from_url(
-            runs_url,
-            submit_id
+        with transaction.atomic():
+            if not self._is_still_claimed(queue_element):
+                return
+            checking_result = models.SolutionCheckingResult(
+                result=result,
+                failed_test=failed_test,
+                score=score,
+                report=report,
+            )
+            checking_result.save()
+            queue_element.submission.result = checking_result
+            queue_element.submission.save()
+
+            queue_element.status = models.QueueElement.Status.CHECKED
+            queue_element.release_claim()
+            queue_element.save()
+
+        self.metrics.inc('checked')
+        self.metrics.observe(
+            'checking_time',
+            (timezone.now() - queue_element.submission.created_at).total_seconds(),
         )
+        # One more run can be submitted to ejudge now
+        self._submit_wakeup.wake()
+
+    def _poll_contest(self, contest_id, queue_elements):
+        """
+        Checks statuses of all submitted runs of one contest using one set
+        of downloaded ejudge pages.
+        """
+        try:
+            self._do_poll_contest(contest_id, queue_elements)
+        finally:
+            # Not checked yet runs will be claimed again after the delay.
+            # Checked ones are not claimed anymore, so they are not touched
+            self._postpone_polls(queue_elements)
+            models.QueueElement.release_claims(
+                [queue_element.id for queue_element in queue_elements],
+                self.submitter_id,
+            )
 
-    def _get_ejudge_run_report(self, contest_id, submit_id):
-        ejudge_sid = self._login(contest_id)
-        report_url = self._build_client_url(
-            ejudge_sid, 37, 'run_id=%d' % (submit_id, )
+    def _do_poll_contest(self, contest_id, queue_elements):
+        self.stdout.write(
+            'Checking status of %d submission(s) in ejudge contest %d' % (
+                len(queue_elements), contest_id
+            )
         )
-        self.stdout.write('Try to get report for submission from url: %s' % (
-            report_url,
-        ))
+        statuses = self.client.get_runs_statuses(contest_id, {
+            queue_element.submission.ejudge_submit_id: queue_element.ejudge_problem_id
+            for queue_element in queue_elements
+        })
 
-        r = self.session.get(report_url)
-        if r.status_code != 200:
-            raise EjudgeException('Bad http status code: %d' % r.status_code)
-
-        soup = BeautifulSoup(r.text)
-        pres = soup.find_all('pre')
-        if len(pres) < 1:
-            return ''
-
-        return pres[0].get_text()
-
-    def _submit_solution(self, contest_id, problem_id, language, file_name):
-        ejudge_sid = self._login(contest_id)
-        language_ejudge_id = None if language is None else language.ejudge_id
-        ejudge_submit_id = self._submit_to_ejudge(
-            ejudge_sid,
-            problem_id,
-            language_ejudge_id,
-            file_name
-        )
+        for queue_element in queue_elements:
+            submit_id = queue_element.submission.ejudge_submit_id
+            if submit_id not in statuses:
+                self.stdout.write(
+                    'Hmmm, it\'s very strange... '
+                    'I can\'t found run %d in ejudge: queue element #%d' %
+                    (submit_id, queue_element.id)
+                )
+                continue
 
-        return ejudge_submit_id
+            ejudge_result, failed_test, score = statuses[submit_id]
+            if ejudge_result in ['Running...', 'Waiting...',
+                                 'Compiling...', 'Compiled']:
+                self.stdout.write(
+                    'Submission %d has not been checked yet: '
+                    'status is %s' % (submit_id, ejudge_result))
+                continue
 
-    def _process_not_submitted(self):
-        submitted_count = len(models.QueueElement.objects.filter(
-            status=models.QueueElement.Status.SUBMITTED
-        ))
-        limit = max(0, EJUDGE_SUBMISSIONS_LIMIT - submitted_count)
-        not_fetched = (
-            models.QueueElement.objects
-            .filter(status=models.QueueElement.Status.NOT_FETCHED)
-            .select_related('language')
-        )[:limit]
-        for queue_element in not_fetched:
             try:
-                self.stdout.write(self.style.SUCCESS(
-                    'Found new submission #%d in queue: '
-                    'to contest %d, problem %d, created at %s, file %s' % (
-                        queue_element.id,
-                        queue_element.ejudge_contest_id,
-                        queue_element.ejudge_problem_id,
-                        queue_element.created_at,
-                        queue_element.file_name)
-                ))
-
-                try:
-                    ejudge_submit_id = self._submit_solution(
-                        queue_element.ejudge_contest_id,
-                        queue_element.ejudge_problem_id,
-                        queue_element.language,
-                        queue_element.file_name
-                    )
-                except CantSubmitEjudgeException as e:
-                    self.stdout.write('Can\'t submit: %s' % (e, ))
-                    queue_element.status = models.QueueElement.Status.WONT_CHECK
-                    queue_element.wont_check_message = str(e)
-                    queue_element.save()
-                    continue
-
-                with transaction.atomic():
-                    self.stdout.write(
-                        'Set status for queue element %d to SUBMITTED' % (
-                            queue_element.id,
-                        )
-                    )
-                    submission = models.Submission(
-                        ejudge_contest_id=queue_element.ejudge_contest_id,
-                        ejudge_submit_id=ejudge_submit_id
-                    )
-                    submission.save()
-
-                    queue_element.status = models.QueueElement.Status.SUBMITTED
-                    queue_element.submission = submission
-                    queue_element.save()
+                self._save_checking_result(queue_element, ejudge_result, failed_test, score)
             except Exception as e:
                 self.stdout.write(self.style.ERROR(
-                    'Exception while submitting solution to ejudge: %s' % e
+                    'Exception while saving result of queue element #%d: %s' %
+                    (queue_element.id, e)
                 ))
                 traceback.print_exc()
 
-    def _process_submitted(self):
-        submitted = models.QueueElement.objects.filter(
-            status=models.QueueElement.Status.SUBMITTED
+    @property
+    def _queue_condition(self):
+        """ Q object for queue elements which this submitter can claim """
+        if not self.file_name_prefix:
+            return Q()
+        return Q(file_name__startswith=self.file_name_prefix)
+
+    def _process_not_submitted(self, executor):
+        # Solutions which are being submitted right now by any submitter are
+        # also counted as in-flight runs in ejudge.
+        # Several submitter processes can compute the limit simultaneously,
+        # so each of them claims at most `workers_count` elements per tick
+        # to keep the possible overflow small.
+        in_flight_count = (
+            models.QueueElement.objects
+            .filter(status=models.QueueElement.Status.SUBMITTED)
+            .count() +
+            models.QueueElement.get_claimed(models.QueueElement.Status.NOT_FETCHED)
+            .count()
+        )
+        limit = min(
+            self.workers_count,
+            max(0, EJUDGE_SUBMISSIONS_LIMIT - in_flight_count),
         )
-        for queue_element in submitted:
-            contest_id = queue_element.submission.ejudge_contest_id
-            submit_id = queue_element.submission.ejudge_submit_id
 
-            try:
-                self.stdout.write(
-                    'Checking submission status in ejudge: '
-                    'contest %d, run %d' % (contest_id, submit_id)
-                )
+        not_fetched = models.QueueElement.claim(
+            models.QueueElement.Status.NOT_FETCHED,
+            self.submitter_id,
+            limit,
+            self.LEASE_DURATION,
+            condition=self._queue_condition,
+        )
+        for queue_element in not_fetched:
+            self._dispatch(
+                executor, self._submit_queue_element,
+                queue_element.id, self._submitting_ids, queue_element,
+            )
+        return len(not_fetched) > 0
+
+    def _get_next_poll_delay(self, poll_attempts):
+        seconds = self.POLL_BACKOFF_BASE * 2 ** min(poll_attempts, 16)
+        return datetime.timedelta(seconds=min(seconds, self.MAX_POLL_DELAY))
+
+    def _postpone_polls(self, queue_elements):
+        now = timezone.now()
+        ids_by_poll_attempts = collections.defaultdict(list)
+        for queue_element in queue_elements:
+            ids_by_poll_attempts[queue_element.poll_attempts].append(queue_element.id)
+
+        for poll_attempts, ids in ids_by_poll_attempts.items():
+            models.QueueElement.objects.filter(
+                id__in=ids, claimed_by=self.submitter_id,
+            ).update(
+                poll_attempts=poll_attempts + 1,
+                next_poll_at=now + self._get_next_poll_delay(poll_attempts),
+            )
 
-                ejudge_result, failed_test, score = self._get_ejudge_run_status(
-                    contest_id, submit_id, queue_element.ejudge_problem_id,
+    def _process_submitted(self, executor):
+        # Pages fetched by the workers dispatched on the previous tick
+        pages_fetched = self.metrics.get('pages_fetched')
+        if pages_fetched > self._pages_fetched_before_tick:
+            self.metrics.observe(
+                'pages_fetched_per_tick',
+                pages_fetched - self._pages_fetched_before_tick,
+            )
+            self._pages_fetched_before_tick = pages_fetched
+
+        # Fresh runs are checked first: they have fewer poll attempts
+        # and bigger ids
+        submitted = models.QueueElement.claim(
+            models.QueueElement.Status.SUBMITTED,
+            self.submitter_id,
+            self.poll_budget,
+            self.LEASE_DURATION,
+            condition=(
+                (Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=timezone.now())) &
+                self._queue_condition
+            ),
+            order_by=('poll_attempts', '-id'),
+        )
+        by_contest = collections.defaultdict(list)
+        for queue_element in submitted:
+            by_contest[queue_element.submission.ejudge_contest_id].append(queue_element)
+
+        for contest_id, queue_elements in by_contest.items():
+            with self._in_progress_lock:
+                is_contest_polled = contest_id in self._polling_contest_ids
+            if is_contest_polled:
+                # This contest will be polled again after the current worker
+                # finishes, so don't hold these elements
+                models.QueueElement.release_claims(
+                    [queue_element.id for queue_element in queue_elements],
+                    self.submitter_id,
                 )
-                if ejudge_result is None:
-                    self.stdout.write(
-                        'Hmmm, it\'s very strange... '
-                        'I can\'t found run in ejudge: queue element #%d' %
-                        (queue_element.id, )
-                    )
-                    continue
-
-                if ejudge_result in ['Running...', 'Waiting...',
-                                     'Compiling...', 'Compiled']:
-                    self.stdout.write(
-                        'Submission has not been checked yet: '
-                        'status is %s' % (ejudge_result, ))
-                    continue
-
-                report = self._get_ejudge_run_report(contest_id, submit_id)
+                continue
 
-                self.stdout.write(
-                    'Submission has been checked: '
-                    'result is %s' % ejudge_result
-                )
-                result = models.CheckingResult.Result.from_ejudge_status(
-                    ejudge_result
-                )
-                with transaction.atomic():
-                    checking_result = models.SolutionCheckingResult(
-                        result=result,
-                        failed_test=failed_test,
-                        score=score,
-                        report=report,
-                    )
-                    checking_result.save()
-                    queue_element.submission.result = checking_result
-                    queue_element.submission.save()
-
-                    queue_element.status = models.QueueElement.Status.CHECKED
-                    queue_element.save()
+            self._dispatch(
+                executor, self._poll_contest,
+                contest_id, self._polling_contest_ids, contest_id, queue_elements,
+            )
+        return len(submitted) > 0
+
+    def _save_metrics_periodically(self):
+        with self._metrics_lock:
+            if time.monotonic() - self._metrics_saved_at < self.METRICS_SAVE_INTERVAL:
+                return
+            self._metrics_saved_at = time.monotonic()
+        self.metrics.save(self.submitter_id, self.started_at)
+
+    def _run_stage(self, process, wakeup):
+        """
+        Calls `process(executor)` in a loop. `process` returns whether it has
+        found any work. If it hasn't, the stage backs off exponentially
+        until `wakeup` is triggered.
+        """
+        time_interval = self.TIME_INTERVAL
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers_count) as executor:
+            while True:
+                try:
+                    has_work = process(executor)
+                    self._save_metrics_periodically()
+                except Exception as e:
+                    self.stdout.write('Some strange exception: %s' % e)
+                    traceback.print_exc()
+                    has_work = False
 
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(
-                    'Exception while checking submission status in ejudge: %s' %
-                    (e, )
-                ))
-                traceback.print_exc()
+                if has_work:
+                    time_interval = self.TIME_INTERVAL
+                else:
+                    time_interval = min(2 * time_interval, self.MAX_IDLE_TIME_INTERVAL)
 
-    def _one_step(self):
-        try:
-            self._process_not_submitted()
-            self._process_submitted()
-        except Exception as e:
-            self.stdout.write('Some strange exception: %s' % e)
-            traceback.print_exc()
+                if wakeup.wait(time_interval):
+                    time_interval = self.TIME_INTERVAL
 
     def handle(self, *args, **options):
-        self.stdout.write('Starting ejudge submitter')
-        while True:
-            self._one_step()
-            time.sleep(self.TIME_INTERVAL)
+        self.workers_count = options['workers']
+        if self.workers_count < 1:
+            raise CommandError('Number of workers should be positive')
+        self.submitter_id = options['submitter_id']
+        self.file_name_prefix = options['file_name_prefix']
+        self.poll_budget = options['poll_budget']
+        if self.poll_budget < 1:
+            raise CommandError('Poll budget should be positive')
+        if options['backend_address'] is not None:
+            self.client.backend_address = options['backend_address']
+
+        self.stdout.write('Starting ejudge submitter %s with %d workers' % (
+            self.submitter_id, self.workers_count
+        ))
+        # Submitting and polling are independent stages running in parallel
+        poll_stage = threading.Thread(
+            target=self._run_stage,
+            args=(self._process_submitted, self._poll_wakeup),
+            daemon=True,
+        )
+        poll_stage.start()
+        self._run_stage(self._process_not_submitted, self._submit_wakeup)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from modules.ejudge import metrics
+
+
+def _format_value(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '%.3f' % value
+    return str(value)
+
+
+class Command(BaseCommand):
+    help = 'Show ejudge queue depth and metrics of running ejudge submitters'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Queue depth'))
+        for status, count in metrics.get_queue_depth().items():
+            self.stdout.write('  %-15s %d' % (status, count))
+
+        for submitter in metrics.get_submitters_stats():
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(
+                'Submitter %s (started at %s, updated at %s)' % (
+                    submitter['submitter_id'],
+                    submitter['started_at'],
+                    submitter['updated_at'],
+                )
+            ))
+            for description, value in submitter['counters']:
+                self.stdout.write('  %s: %d' % (description, value))
+            for histogram in submitter['histograms']:
+                self.stdout.write('  %s: count %d, mean %s, p50 %s, p95 %s, p99 %s' % (
+                    histogram['name'],
+                    histogram['count'],
+                    _format_value(histogram['mean']),
+                    _format_value(histogram['p50']),
+                    _format_value(histogram['p95']),
+                    _format_value(histogram['p99']),
+                ))
@@ -0,0 +1,183 @@
+import bisect
+import contextlib
+import threading
+import time
+
+from django.db.models import Count
+
+from . import models
+
+
+# Upper bounds of histogram buckets, in seconds (or in pieces for counts)
+DEFAULT_BUCKETS = [
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+    1000,
+]
+
+
+class Histogram:
+    def __init__(self, buckets=None, counts=None, total=0, count=0):
+        self.buckets = list(DEFAULT_BUCKETS if buckets is None else buckets)
+        # The last counter is for values greater than all bucket bounds
+        self.counts = [0] * (len(self.buckets) + 1) if counts is None else list(counts)
+        self.total = total
+        self.count = count
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def percentile(self, q):
+        """
+        Returns upper bound of the bucket containing q-th percentile
+        (0 < q <= 100). Values greater than the last bound are reported as
+        infinity.
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100 * self.count
+        accumulated = 0
+        for index, bucket_count in enumerate(self.counts):
+            accumulated += bucket_count
+            if accumulated >= rank:
+                break
+        if index < len(self.buckets):
+            return self.buckets[index]
+        return float('inf')
+
+    def to_dict(self):
+        return {
+            'buckets': self.buckets,
+            'counts': self.counts,
+            'total': self.total,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class SubmitterMetrics:
+    """
+    Thread-safe collection of counters and histograms of one submitter
+    process. Values are accumulated since the submitter start.
+    """
+
+    # Human-readable descriptions, also define the order on the staff page
+    COUNTERS = {
+        'logins': 'Логинов в еджадж',
+        'pages_fetched': 'Скачано страниц из еджаджа',
+        'submitted': 'Отправлено посылок',
+        'checked': 'Проверено посылок',
+        'errors': 'Ошибок',
+    }
+
+    HISTOGRAMS = {
+        'submit_time': 'Время отправки посылки в еджадж, с',
+        'waiting_for_submit_time': 'Время от добавления в очередь до отправки, с',
+        'checking_time': 'Время от отправки до получения вердикта, с',
+        'pages_fetched_per_tick': 'Скачано страниц за один тик опроса',
+        'parse_time': 'Время разбора страницы со списком посылок, с',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {name: 0 for name in self.COUNTERS}
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def get(self, name):
+        with self._lock:
+            return self.counters[name]
+
+    def observe(self, name, value):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started_at)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    def save(self, submitter_id, started_at):
+        models.SubmitterMetricsSnapshot.objects.update_or_create(
+            submitter_id=submitter_id,
+            defaults={'started_at': started_at, 'data': self.to_dict()},
+        )
+
+
+def get_queue_depth():
+    """
+    :return: dict {status label: number of queue elements with this status}
+    """
+    counts = dict(
+        models.QueueElement.objects
+        .values_list('status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return {
+        label: counts.get(status, 0)
+        for status, label in models.QueueElement.Status.values.items()
+    }
+
+
+def get_submitters_stats():
+    """
+    :return: list of dicts with counters and histogram summaries from
+    the latest snapshots of all submitter processes, newest first
+    """
+    result = []
+    snapshots = models.SubmitterMetricsSnapshot.objects.order_by('-updated_at')
+    for snapshot in snapshots:
+        counters = snapshot.data.get('counters', {})
+        histograms = {
+            name: Histogram.from_dict(data)
+            for name, data in snapshot.data.get('histograms', {}).items()
+        }
+        result.append({
+            'submitter_id': snapshot.submitter_id,
+            'started_at': snapshot.started_at,
+            'updated_at': snapshot.updated_at,
+            'counters': [
+                (description, counters.get(name, 0))
+                for name, description in SubmitterMetrics.COUNTERS.items()
+            ],
+            'histograms': [
+                {
+                    'name': description,
+                    'count': histograms[name].count,
+                    'mean': histograms[name].mean,
+                    'p50': histograms[name].percentile(50),
+                    'p95': histograms[name].percentile(95),
+                    'p99': histograms[name].percentile(99),
+                }
+                for name, description in SubmitterMetrics.HISTOGRAMS.items()
+                if name in histograms
+            ],
+        })
+    return result
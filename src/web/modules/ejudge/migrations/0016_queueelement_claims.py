@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ejudge', '0015_auto_20211229_1503'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queueelement',
+            name='claimed_by',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Идентификатор процесса сабмиттера, который сейчас обрабатывает этот элемент очереди', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='queueelement',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, help_text='После этого момента элемент очереди может забрать другой процесс сабмиттера', null=True),
+        ),
+    ]
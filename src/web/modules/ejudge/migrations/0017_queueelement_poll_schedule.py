@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ejudge', '0016_queueelement_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queueelement',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, help_text='Не проверять статус посылки в еджадже до этого момента', null=True),
+        ),
+        migrations.AddField(
+            model_name='queueelement',
+            name='poll_attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Сколько раз сабмиттер проверял статус посылки в еджадже'),
+        ),
+    ]
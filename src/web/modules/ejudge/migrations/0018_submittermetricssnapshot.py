@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ejudge', '0017_queueelement_poll_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmitterMetricsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submitter_id', models.CharField(max_length=200, unique=True)),
+                ('started_at', models.DateTimeField()),
+                ('data', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
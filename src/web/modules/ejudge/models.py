@@ -1,5 +1,7 @@
 import djchoices
-from django.db import models, IntegrityError
+from django.db import models, transaction, connection, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
 
 
 class ProgrammingLanguage(models.Model):
@@ -176,10 +178,156 @@ class QueueElement(models.Model):
 
     wont_check_message = models.TextField(blank=True, default='')
 
+    claimed_by = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        db_index=True,
+        help_text='Идентификатор процесса сабмиттера, который сейчас '
+                  'обрабатывает этот элемент очереди',
+    )
+
+    lease_expires_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        default=None,
+        db_index=True,
+        help_text='После этого момента элемент очереди может забрать '
+                  'другой процесс сабмиттера',
+    )
+
+    poll_attempts = models.PositiveIntegerField(
+        default=0,
+        help_text='Сколько раз сабмиттер проверял статус посылки в еджадже',
+    )
+
+    next_poll_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        default=None,
+        db_index=True,
+        help_text='Не проверять статус посылки в еджадже до этого момента',
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     updated_at = models.DateTimeField(auto_now=True)
 
+    @classmethod
+    def get_unclaimed(cls, status):
+        """
+        :return: QuerySet of queue elements with given status which are not
+        claimed by any submitter or whose lease has expired
+        """
+        return cls.objects.filter(status=status).filter(
+            Q(claimed_by='') | Q(lease_expires_at__lt=timezone.now())
+        )
+
+    @classmethod
+    def get_claimed(cls, status):
+        """
+        :return: QuerySet of queue elements with given status which are being
+        processed by some submitter right now
+        """
+        return cls.objects.filter(
+            status=status,
+            lease_expires_at__gte=timezone.now(),
+        ).exclude(claimed_by='')
+
+    @classmethod
+    def claim(cls, status, claimed_by, limit, lease_duration,
+              condition=None, order_by=('id',)):
+        """
+        Atomically claims at most `limit` unclaimed queue elements with given
+        status for the submitter `claimed_by`. Expired leases of other
+        submitters are taken over. Different submitters never get the same
+        queue element until its lease expires.
+
+        :param condition: optional Q object for additional filtering
+        :param order_by: elements are claimed in this order
+        :return: list of claimed queue elements
+        """
+        if limit <= 0:
+            return []
+
+        lease_expires_at = timezone.now() + lease_duration
+        available = cls.get_unclaimed(status)
+        if condition is not None:
+            available = available.filter(condition)
+        available = available.order_by(*order_by)
+
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                ids = list(
+                    available
+                    .select_for_update(skip_locked=True)
+                    .values_list('id', flat=True)[:limit]
+                )
+                cls.objects.filter(id__in=ids).update(
+                    claimed_by=claimed_by, lease_expires_at=lease_expires_at,
+                )
+        else:
+            candidates = list(available.values_list(
+                'id', 'claimed_by', 'lease_expires_at'
+            )[:limit])
+            ids = cls._claim_candidates(candidates, status, claimed_by, lease_expires_at)
+
+        return list(
+            cls.objects
+            .filter(id__in=ids, claimed_by=claimed_by)
+            .select_related('language', 'submission')
+            .order_by(*order_by)
+        )
+
+    @classmethod
+    def _claim_candidates(cls, candidates, status, claimed_by, lease_expires_at):
+        """
+        Without SKIP LOCKED each candidate is claimed by a conditional
+        update: it succeeds only if nobody has claimed the element since
+        the candidate has been read.
+
+        :param candidates: list of (id, claimed_by, lease_expires_at)
+        :return: ids of claimed queue elements
+        """
+        ids = []
+        for element_id, old_claimed_by, old_lease_expires_at in candidates:
+            updated = cls.objects.filter(
+                id=element_id,
+                status=status,
+                claimed_by=old_claimed_by,
+                lease_expires_at=old_lease_expires_at,
+            ).update(
+                claimed_by=claimed_by, lease_expires_at=lease_expires_at,
+            )
+            if updated > 0:
+                ids.append(element_id)
+        return ids
+
+    @classmethod
+    def release_claims(cls, ids, claimed_by):
+        cls.objects.filter(id__in=ids, claimed_by=claimed_by).update(
+            claimed_by='', lease_expires_at=None,
+        )
+
+    def is_claimed_by(self, claimed_by):
+        """
+        Checks in the database that the lease of this queue element still
+        belongs to `claimed_by`. Should be called inside a transaction.
+        The check is a conditional UPDATE rather than SELECT ... FOR UPDATE,
+        so the row stays locked until the transaction ends on all databases
+        and SQLite doesn't need to upgrade a read lock to a write one.
+        """
+        now = timezone.now()
+        return QueueElement.objects.filter(
+            id=self.id,
+            claimed_by=claimed_by,
+            lease_expires_at__gte=now,
+        ).update(updated_at=now) > 0
+
+    def release_claim(self):
+        self.claimed_by = ''
+        self.lease_expires_at = None
+
     def save(self, *args, **kwargs):
         if (self.status == QueueElement.Status.CHECKED and
                 self.submission is None):
@@ -200,3 +348,20 @@ class QueueElement(models.Model):
 
     def __str__(self):
         return '#%d. (%s)' % (self.id, QueueElement.Status.values[self.status])
+
+
+class SubmitterMetricsSnapshot(models.Model):
+    """
+    Latest metrics of one ejudge submitter process, see
+    modules.ejudge.metrics.SubmitterMetrics
+    """
+    submitter_id = models.CharField(max_length=200, unique=True)
+
+    started_at = models.DateTimeField()
+
+    data = models.JSONField(default=dict)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return 'Метрики сабмиттера %s' % (self.submitter_id, )
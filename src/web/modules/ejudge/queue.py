@@ -1,6 +1,81 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
 from . import models
 
 
+def _touch_wakeup_file():
+    path = settings.SISTEMA_EJUDGE_SUBMITTER_WAKEUP_FILE
+    try:
+        with open(path, 'a'):
+            pass
+        # Set the exact time explicitly: file systems can round
+        # the modification time, and then two notifications would be
+        # indistinguishable
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+    except OSError:
+        # Submitter will find the new element anyway after its idle timeout
+        pass
+
+
+def notify_submitter():
+    """
+    Wakes up ejudge submitters running on this host. Notification is sent
+    after the current transaction commits, so the submitter sees new elements.
+    """
+    transaction.on_commit(_touch_wakeup_file)
+
+
+class SubmitterWakeup:
+    """
+    Lets ejudge submitter sleep until it's woken up by `wake()` from another
+    thread or, if `watch_queue` is True, until `notify_submitter()` is called
+    in any process on this host. Checks only the modification time of
+    the wakeup file, so waiting doesn't touch the database.
+    """
+    CHECK_INTERVAL = 0.05  # in seconds
+
+    def __init__(self, watch_queue=True):
+        self.watch_queue = watch_queue
+        self._event = threading.Event()
+        self._last_seen = self._get_modification_time()
+
+    def wake(self):
+        self._event.set()
+
+    @staticmethod
+    def _get_modification_time():
+        try:
+            return os.stat(settings.SISTEMA_EJUDGE_SUBMITTER_WAKEUP_FILE).st_mtime_ns
+        except OSError:
+            return None
+
+    def wait(self, timeout):
+        """
+        Waits at most `timeout` seconds for the notification.
+        :return: True if the notification has been received, False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.watch_queue:
+                modification_time = self._get_modification_time()
+                if modification_time != self._last_seen:
+                    self._last_seen = modification_time
+                    return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._event.wait(min(self.CHECK_INTERVAL, remaining)):
+                self._event.clear()
+                return True
+
+
 def add_from_file(ejudge_contest_id, ejudge_problem_id,
                   language, file_name):
     element = models.QueueElement(
@@ -10,4 +85,5 @@ def add_from_file(ejudge_contest_id, ejudge_problem_id,
         file_name=file_name
     )
     element.save()
+    notify_submitter()
     return element
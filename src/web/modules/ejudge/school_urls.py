@@ -7,4 +7,5 @@ app_name = 'ejudge'
 
 urlpatterns = [
     path('stats/', staff_views.show_ejudge_stats, name='show_ejudge_stats'),
+    path('submitter/', staff_views.show_submitter_metrics, name='show_submitter_metrics'),
 ]
@@ -4,6 +4,7 @@ import django.shortcuts
 from django.db.models import F, Count
 
 import sistema.staff
+import modules.ejudge.metrics as ejudge_metrics
 import modules.ejudge.models as ejudge_models
 import modules.entrance.models as entrance_models
 
@@ -79,3 +80,15 @@ def show_ejudge_stats(request):
             'results': results,
         }
     )
+
+
+@sistema.staff.only_staff
+def show_submitter_metrics(request):
+    return django.shortcuts.render(
+        request,
+        'ejudge/staff/submitter_metrics.html',
+        {
+            'queue_depth': ejudge_metrics.get_queue_depth(),
+            'submitters': ejudge_metrics.get_submitters_stats(),
+        }
+    )
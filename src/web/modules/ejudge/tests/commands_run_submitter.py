@@ -0,0 +1,125 @@
+"""Tests for the ejudge submitter"""
+
+import datetime
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+
+from modules.ejudge import fake_server, models, queue
+from modules.ejudge.management.commands import run_submitter
+
+
+class StolenLeaseTestCase(TestCase):
+    LEASE_DURATION = datetime.timedelta(minutes=5)
+
+    def setUp(self):
+        self.submitter = run_submitter.Command(stdout=io.StringIO())
+        self.submitter.submitter_id = 'first'
+        self.submitter.client = mock.Mock()
+        self.submitter.client.submit.return_value = 42
+        self.submitter.client.get_run_report.return_value = 'Report'
+        self.submitter.client.get_runs_statuses.return_value = {42: ('OK', None, None)}
+
+    def _create_and_steal(self, status, submission=None):
+        models.QueueElement.objects.create(
+            ejudge_contest_id=1, ejudge_problem_id=1, file_name='solution.cpp',
+            status=status, submission=submission,
+        )
+        [queue_element] = models.QueueElement.claim(status, 'first', 1, self.LEASE_DURATION)
+
+        # Lease of the first submitter has expired while it was waiting for
+        # ejudge, and another submitter has claimed the element
+        models.QueueElement.objects.filter(id=queue_element.id).update(claimed_by='second')
+        return queue_element
+
+    def _assert_not_changed(self, queue_element, status, submission):
+        queue_element.refresh_from_db()
+        self.assertEqual(queue_element.status, status)
+        self.assertEqual(queue_element.submission, submission)
+        self.assertEqual(queue_element.claimed_by, 'second')
+        self.assertEqual(queue_element.poll_attempts, 0)
+
+    def test_submitted_element_is_not_overwritten(self):
+        queue_element = self._create_and_steal(models.QueueElement.Status.NOT_FETCHED)
+
+        self.submitter._submit_queue_element(queue_element)
+        self._assert_not_changed(queue_element, models.QueueElement.Status.NOT_FETCHED, None)
+        self.assertFalse(models.Submission.objects.exists())
+
+    def test_checked_element_is_not_overwritten(self):
+        submission = models.Submission.objects.create(ejudge_contest_id=1, ejudge_submit_id=42)
+        queue_element = self._create_and_steal(models.QueueElement.Status.SUBMITTED, submission)
+
+        self.submitter._poll_contest(1, [queue_element])
+        self._assert_not_changed(queue_element, models.QueueElement.Status.SUBMITTED, submission)
+        submission.refresh_from_db()
+        self.assertIsNone(submission.result)
+        self.assertFalse(models.SolutionCheckingResult.objects.exists())
+
+
+class _ImmediateExecutor:
+    """ Runs the submitted tasks right away in the test's thread and transaction """
+    def submit(self, func, *args):
+        func(*args)
+
+
+class FakeEjudgeSubmitterTestCase(TestCase):
+    CONTEST_ID = 1
+
+    def setUp(self):
+        self.ejudge = fake_server.FakeEjudge(min_judging_delay=0, max_judging_delay=0, seed=0)
+        server = fake_server.FakeEjudgeServer(('127.0.0.1', 0), self.ejudge)
+        server.start_in_thread()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.solution_file = os.path.join(directory.name, 'benchmark-solution.cpp')
+        with open(self.solution_file, 'w') as f:
+            f.write('int main() { return 0; }\n')
+
+        self.submitter = run_submitter.Command(stdout=io.StringIO())
+        self.submitter.submitter_id = 'benchmark'
+        self.submitter.file_name_prefix = self.solution_file
+        self.submitter.client.backend_address = server.url
+
+    def _run_submitter(self, max_ticks=10):
+        executor = _ImmediateExecutor()
+        # Workers close connections, but here they share the test's one
+        with mock.patch('django.db.close_old_connections'):
+            for _ in range(max_ticks):
+                self.submitter._process_not_submitted(executor)
+                self.submitter._process_submitted(executor)
+                if not models.QueueElement.objects.filter(
+                        file_name=self.solution_file
+                ).exclude(status=models.QueueElement.Status.CHECKED).exists():
+                    return
+        self.fail('Solutions are not checked after %d ticks' % max_ticks)
+
+    def test_solutions_are_checked(self):
+        queue_elements = [
+            queue.add_from_file(self.CONTEST_ID, problem_id, None, self.solution_file)
+            for problem_id in [1, 1, 2, 2, 2, 3]
+        ]
+        other_queue_element = queue.add_from_file(self.CONTEST_ID, 1, None, '/tmp/other-solution.cpp')
+
+        self._run_submitter()
+
+        for queue_element in queue_elements:
+            queue_element.refresh_from_db()
+            run = self.ejudge.get_run(self.CONTEST_ID, queue_element.submission.ejudge_submit_id)
+            self.assertEqual(run.problem_id, queue_element.ejudge_problem_id)
+            result = queue_element.submission.result
+            self.assertEqual(result.result, models.CheckingResult.Result.from_ejudge_status(run.result))
+            self.assertEqual(result.failed_test, run.failed_test)
+        # Each solution is submitted exactly once
+        self.assertEqual(len(self.ejudge.get_runs(self.CONTEST_ID, all_runs=True)), len(queue_elements))
+
+        # Solutions outside of the file name prefix are left to other submitters
+        other_queue_element.refresh_from_db()
+        self.assertEqual(other_queue_element.status, models.QueueElement.Status.NOT_FETCHED)
+        self.assertEqual(other_queue_element.claimed_by, '')
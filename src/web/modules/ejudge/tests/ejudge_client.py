@@ -0,0 +1,68 @@
+"""Tests for the ejudge client against the fake ejudge server"""
+
+import io
+import threading
+from unittest import mock
+
+from django.core.management.color import no_style
+from django.test import SimpleTestCase
+
+from modules.ejudge import fake_server
+from modules.ejudge.client import EjudgeClient
+
+CONTEST_ID = 1
+
+
+class EjudgeClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.ejudge = fake_server.FakeEjudge(min_judging_delay=0, max_judging_delay=0, runs_on_page=2, seed=0)
+        server = fake_server.FakeEjudgeServer(('127.0.0.1', 0), self.ejudge)
+        server.start_in_thread()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.client = EjudgeClient(server.url, 'login', 'password', io.StringIO(), no_style())
+
+    def test_threads_share_sid_but_not_http_sessions(self):
+        http_sessions = {}
+
+        def download_page(thread_index):
+            self.client._download_page(CONTEST_ID, EjudgeClient.VIEW_SUBMISSIONS_ACTION)
+            http_sessions[thread_index] = self.client._get_contest_session(CONTEST_ID).http
+
+        threads = [threading.Thread(target=download_page, args=(i, )) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.client.metrics.get('logins'), 1)
+        self.assertEqual(len({id(http) for http in http_sessions.values()}), 3)
+
+    def _get_downloaded_pages(self, runs):
+        with mock.patch.object(self.client, '_download_page', wraps=self.client._download_page) as download_page:
+            statuses = self.client.get_runs_statuses(CONTEST_ID, runs)
+        return statuses, [call.args[1:] for call in download_page.call_args_list]
+
+    def test_runs_statuses_are_found_on_few_pages(self):
+        # Pages show only two latest runs, see FakeEjudge.runs_on_page
+        runs = [self.ejudge.submit(CONTEST_ID, problem_id, 'g++', 10) for problem_id in [1, 1, 1, 2, 2]]
+        unknown_run_id = 999
+
+        statuses, pages = self._get_downloaded_pages({
+            runs[0].run_id: 1, runs[1].run_id: 1, runs[3].run_id: 2, runs[4].run_id: 2, unknown_run_id: 1,
+        })
+        self.assertEqual(statuses, {
+            run.run_id: run.get_status() for run in [runs[0], runs[1], runs[3], runs[4]]
+        })
+        # Two runs of the problem 2 are found on the submissions page, the run
+        # of the problem 1 is found on the problem's page, and the oldest one
+        # only on the page with all runs
+        self.assertEqual(pages, [
+            (EjudgeClient.VIEW_SUBMISSIONS_ACTION, ''),
+            (EjudgeClient.PROBLEM_PAGE_ACTION, 'prob_id=1'),
+            (EjudgeClient.VIEW_SUBMISSIONS_ACTION, 'all_runs=1'),
+        ])
+
+        statuses, pages = self._get_downloaded_pages({runs[3].run_id: 2, runs[4].run_id: 2})
+        self.assertEqual(set(statuses), {runs[3].run_id, runs[4].run_id})
+        self.assertEqual(pages, [(EjudgeClient.VIEW_SUBMISSIONS_ACTION, '')])
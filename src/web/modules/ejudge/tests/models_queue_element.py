@@ -0,0 +1,82 @@
+"""Tests for claiming of ejudge queue elements by several submitters"""
+
+import datetime
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from modules.ejudge import models
+
+NOT_FETCHED = models.QueueElement.Status.NOT_FETCHED
+
+
+class QueueElementClaimTestCase(TestCase):
+    LEASE_DURATION = datetime.timedelta(minutes=5)
+
+    def setUp(self):
+        for i in range(5):
+            models.QueueElement.objects.create(
+                ejudge_contest_id=1, ejudge_problem_id=1, file_name='solution-%d.cpp' % i,
+            )
+
+    def _claim(self, claimed_by, limit=2):
+        return models.QueueElement.claim(NOT_FETCHED, claimed_by, limit, self.LEASE_DURATION)
+
+    def _assert_claimers_get_different_elements(self):
+        first = self._claim('first')
+        second = self._claim('second')
+        third = self._claim('third')
+        claimed_ids = [element.id for element in first + second + third]
+
+        self.assertEqual([len(first), len(second), len(third)], [2, 2, 1])
+        self.assertEqual(len(set(claimed_ids)), 5)
+        self.assertEqual(self._claim('fourth'), [])
+        for claimed_by, elements in [('first', first), ('second', second), ('third', third)]:
+            for element in elements:
+                self.assertTrue(element.is_claimed_by(claimed_by))
+
+    def test_claimers_get_different_elements_with_skip_locked(self):
+        # SQLite doesn't lock rows, so here only the claiming by SELECT ...
+        # FOR UPDATE SKIP LOCKED and following UPDATE is checked
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True):
+            self._assert_claimers_get_different_elements()
+
+    def test_claimers_get_different_elements_with_conditional_updates(self):
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False):
+            self._assert_claimers_get_different_elements()
+
+    def test_conditional_update_loses_race(self):
+        # The second submitter reads the same candidates as the first one,
+        # but updates them after the first one has claimed them
+        candidates = list(
+            models.QueueElement.get_unclaimed(NOT_FETCHED)
+            .order_by('id')
+            .values_list('id', 'claimed_by', 'lease_expires_at')[:3]
+        )
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False):
+            first = self._claim('first')
+
+        lease_expires_at = timezone.now() + self.LEASE_DURATION
+        claimed_ids = models.QueueElement._claim_candidates(candidates, NOT_FETCHED, 'second', lease_expires_at)
+        self.assertEqual(claimed_ids, [candidates[2][0]])
+        for element in first:
+            self.assertTrue(element.is_claimed_by('first'))
+            self.assertFalse(element.is_claimed_by('second'))
+
+    def test_expired_lease_is_claimed_again(self):
+        [element] = self._claim('first', limit=1)
+        self.assertNotIn(element.id, [other.id for other in self._claim('second', limit=10)])
+
+        # The first submitter has died
+        models.QueueElement.objects.filter(id=element.id).update(
+            lease_expires_at=timezone.now() - datetime.timedelta(seconds=1),
+        )
+        self.assertFalse(element.is_claimed_by('first'))
+        [reclaimed] = self._claim('third', limit=10)
+        self.assertEqual(reclaimed.id, element.id)
+
+        # The first submitter can't release the lease which isn't its own anymore
+        models.QueueElement.release_claims([element.id], 'first')
+        self.assertTrue(reclaimed.is_claimed_by('third'))
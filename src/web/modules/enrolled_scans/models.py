@@ -1,5 +1,6 @@
 from django.db import models
 
+import groups.materialized
 import groups.models
 import schools.models
 import users.models
@@ -119,3 +120,9 @@ class UploadedEnrolledScanGroup(groups.models.AbstractGroup):
     @property
     def user_ids(self):
         return self.requirement.scans.values_list('user_id', flat=True)
+
+
+groups.materialized.register_dependency(
+    EnrolledScan,
+    lambda scan: UploadedEnrolledScanGroup.objects.filter(requirement_id=scan.requirement_id)
+)
@@ -206,8 +206,8 @@ class CheckingGroupAdmin(admin.ModelAdmin):
     search_fields = ('school__name', 'name')
 
 
-@admin.register(models.CheckingLock)
-class CheckingLockAdmin(admin.ModelAdmin):
+@admin.register(models.CheckingQueueElement)
+class CheckingQueueElementAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'task', 'locked_by', 'locked_until')
     list_filter = (('locked_by', admin.RelatedOnlyFieldListFilter), )
     autocomplete_fields = ('user', 'task', 'locked_by')
@@ -32,3 +32,11 @@ class EntranceConfig(AppConfig):
             }
         }
     }
+
+    def ready(self):
+        # Signal handlers of these modules refer to models of several apps,
+        # so they are connected here, when all models are loaded
+        from modules.entrance import cache_tags, checking_queue, metric_values
+        cache_tags.connect_signals()
+        checking_queue.connect_signals()
+        metric_values.connect_signals()
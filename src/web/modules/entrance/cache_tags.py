@@ -0,0 +1,183 @@
+"""
+Dependency tags of cached entrance data (see sistema.cache).
+
+Tags are invalidated by model signals, so results depending on them can be
+cached for a long time.
+"""
+
+from django.apps import apps
+from django.db.models.signals import post_save, post_delete
+
+from sistema.cache import invalidate_tags
+
+
+def user_solutions(user_id):
+    """User's solutions of entrance exam tasks and their checking results"""
+    return 'entrance.user_solutions:%s' % user_id
+
+
+def school_levels(school_id):
+    """Entrance levels of the school and settings of its level limiters"""
+    return 'entrance.school_levels:%s' % school_id
+
+
+def user_levels(user_id):
+    """User's data which limits the user's entrance level"""
+    return 'entrance.user_levels:%s' % user_id
+
+
+def school_steps(school_id):
+    """Entrance steps of the school and the school's data shown in them"""
+    return 'entrance.school_steps:%s' % school_id
+
+
+def user_steps(user_id):
+    """User's data shown in the entrance steps, i.e. entrance status"""
+    return 'entrance.user_steps:%s' % user_id
+
+
+def _on_solution_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(user_solutions(instance.user_id))
+
+
+def _on_queue_element_saved(instance, raw, created, **kwargs):
+    # New queue element doesn't have any solutions yet
+    if raw or created:
+        return
+    # It's here to avoid cyclic imports
+    from modules.entrance import models
+
+    user_ids = set()
+    for solution_class in (models.ProgramEntranceExamTaskSolution, models.OutputOnlyEntranceExamTaskSolution):
+        user_ids.update(
+            solution_class.objects
+            .filter(ejudge_queue_element_id=instance.id)
+            .values_list('user_id', flat=True)
+        )
+    invalidate_tags(*[user_solutions(user_id) for user_id in user_ids])
+
+
+def _on_school_levels_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(school_levels(instance.school_id))
+
+
+def _on_limiter_limit_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(school_levels(instance.limiter.school_id))
+
+
+def _on_user_levels_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(user_levels(instance.user_id))
+
+
+def _on_school_steps_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(school_steps(instance.school_id))
+
+
+def _on_school_changed(instance, raw=False, **kwargs):
+    # School's year is used by AgeEntranceLevelLimiter if there are no sessions
+    if not raw:
+        invalidate_tags(school_steps(instance.id), school_levels(instance.id))
+
+
+def _on_enrollment_type_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(school_steps(instance.step.school_id))
+
+
+def _on_task_category_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(school_steps(instance.exam.school_id))
+
+
+def _on_questionnaire_changed(instance, raw=False, **kwargs):
+    if raw:
+        return
+    # It's here to avoid cyclic imports
+    from modules.entrance import models
+
+    # Questionnaire without school can be used in steps of any school
+    school_ids = set(
+        models.FillQuestionnaireEntranceStep.objects
+        .filter(questionnaire_id=instance.id)
+        .values_list('school_id', flat=True)
+    )
+    invalidate_tags(*[school_steps(school_id) for school_id in school_ids])
+
+
+def _on_user_steps_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(user_steps(instance.user_id))
+
+
+def _on_enrolled_to_session_and_parallel_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(user_steps(instance.entrance_status.user_id))
+
+
+def _connect_to_save_and_delete(receiver, model):
+    post_save.connect(receiver, sender=model)
+    post_delete.connect(receiver, sender=model)
+
+
+def connect_signals():
+    from modules.entrance import models
+
+    for model in (
+        models.TestEntranceExamTaskSolution,
+        models.FileEntranceExamTaskSolution,
+        models.ProgramEntranceExamTaskSolution,
+        models.OutputOnlyEntranceExamTaskSolution,
+    ):
+        _connect_to_save_and_delete(_on_solution_changed, model)
+    post_save.connect(_on_queue_element_saved, sender=apps.get_model('ejudge', 'QueueElement'))
+
+    _connect_to_save_and_delete(_on_school_levels_changed, models.EntranceLevel)
+    for model in apps.get_models():
+        if issubclass(model, models.EntranceLevelLimiter):
+            _connect_to_save_and_delete(_on_school_levels_changed, model)
+    _connect_to_save_and_delete(_on_limiter_limit_changed, models.AlreadyWasEntranceLevelLimiterForParallel)
+    _connect_to_save_and_delete(_on_limiter_limit_changed, models.AgeEntranceLevelLimiterForClass)
+    # Start date of the school's first session defines the class of the user
+    # in AgeEntranceLevelLimiter
+    _connect_to_save_and_delete(_on_school_levels_changed, apps.get_model('schools', 'Session'))
+
+    for model in (
+        models.EntranceLevelOverride,
+        models.SelectedEnrollmentType,
+        apps.get_model('schools', 'SchoolParticipant'),
+        apps.get_model('users', 'UserProfile'),
+        # Level from the topics questionnaire depends on the user's marks,
+        # and it's stored when the user finishes the questionnaire
+        apps.get_model('topics', 'UserQuestionnaireStatus'),
+        apps.get_model('topics', 'UserMark'),
+        apps.get_model('topics', 'TopicsEntranceLevelLimit'),
+    ):
+        _connect_to_save_and_delete(_on_user_levels_changed, model)
+
+    for model in apps.get_models():
+        if issubclass(model, models.AbstractEntranceStep):
+            _connect_to_save_and_delete(_on_school_steps_changed, model)
+    for model in (apps.get_model('schools', 'Session'), apps.get_model('schools', 'Parallel')):
+        _connect_to_save_and_delete(_on_school_steps_changed, model)
+    _connect_to_save_and_delete(_on_school_changed, apps.get_model('schools', 'School'))
+    _connect_to_save_and_delete(_on_enrollment_type_changed, models.EnrollmentType)
+    _connect_to_save_and_delete(_on_task_category_changed, models.EntranceExamTaskCategory)
+    _connect_to_save_and_delete(_on_questionnaire_changed, apps.get_model('questionnaire', 'Questionnaire'))
+
+    for model in apps.get_models():
+        if issubclass(model, models.AbstractAbsenceReason):
+            _connect_to_save_and_delete(_on_user_steps_changed, model)
+    for model in (
+        models.EntranceStatus,
+        models.SelectedEnrollmentType,
+        models.SelectedEntranceLevel,
+        models.EntranceLevelUpgrade,
+        models.UserParticipatedInSchoolEntranceStepException,
+    ):
+        _connect_to_save_and_delete(_on_user_steps_changed, model)
+    _connect_to_save_and_delete(_on_enrolled_to_session_and_parallel_changed, models.EnrolledToSessionAndParallel)
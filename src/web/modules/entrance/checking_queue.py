@@ -0,0 +1,62 @@
+"""
+Incremental maintenance of the checking queue (models.CheckingQueueElement).
+
+User's solutions of the task are waiting for checking while none of them
+is checked. So the element is added when the user sends a solution of the
+file task, removed when any of the user's solutions of the task is checked
+or all of them are deleted, and added again if all checks have been deleted.
+Initially the queue is filled by migration 0100_checkingqueueelement.
+"""
+
+from django.db.models.signals import post_save, post_delete
+
+from modules.entrance import models
+
+
+def _is_checked(task_id, user_id):
+    return models.CheckedSolution.objects.filter(
+        solution__task_id=task_id, solution__user_id=user_id,
+    ).exists()
+
+
+def enqueue(task_id, user_id):
+    if not _is_checked(task_id, user_id):
+        models.CheckingQueueElement.objects.get_or_create(task_id=task_id, user_id=user_id)
+
+
+def _on_solution_saved(instance, created, raw, **kwargs):
+    if created and not raw:
+        enqueue(instance.task_id, instance.user_id)
+
+
+def _on_check_saved(instance, raw, **kwargs):
+    if raw:
+        return
+    solution = instance.solution
+    models.CheckingQueueElement.objects.filter(
+        task_id=solution.task_id, user_id=solution.user_id,
+    ).delete()
+
+
+def _on_solution_deleted(instance, **kwargs):
+    has_other_solutions = models.FileEntranceExamTaskSolution.objects.filter(
+        task_id=instance.task_id, user_id=instance.user_id,
+    ).exists()
+    if not has_other_solutions:
+        models.CheckingQueueElement.objects.filter(
+            task_id=instance.task_id, user_id=instance.user_id,
+        ).delete()
+
+
+def _on_check_deleted(instance, **kwargs):
+    solution = models.FileEntranceExamTaskSolution.objects.filter(id=instance.solution_id).first()
+    # Solution can be deleted together with its checks
+    if solution is not None:
+        enqueue(solution.task_id, solution.user_id)
+
+
+def connect_signals():
+    post_save.connect(_on_solution_saved, sender=models.FileEntranceExamTaskSolution)
+    post_delete.connect(_on_solution_deleted, sender=models.FileEntranceExamTaskSolution)
+    post_save.connect(_on_check_saved, sender=models.CheckedSolution)
+    post_delete.connect(_on_check_deleted, sender=models.CheckedSolution)
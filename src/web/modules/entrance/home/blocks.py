@@ -1,12 +1,25 @@
+import hashlib
+
+from django.core.cache import cache as djcache
 from django.db.models import Q
+from django.middleware.csrf import get_token
 from django.template.loader import render_to_string
 from htmlmin.minify import html_minify
 
 import home.models
+from modules.entrance import cache_tags
+from sistema.cache import get_tags_version
 from sistema.helpers import nested_query_list
+from sistema.middleware import add_minified_fragment
 
 __all__ = ['EntranceStepsHomePageBlock']
 
+STEP_BLOCK_CACHE_SECONDS = 3600
+
+# {% csrf_token %} is rendered with this value in the cached blocks and
+# replaced by the request's token when the block is shown
+CSRF_TOKEN_PLACEHOLDER = 'entrance-step-block-csrf-token'
+
 
 class EntranceStepsHomePageBlock(home.models.AbstractHomePageBlock):
     ENTRANCE_STEPS_TEMPLATES_FOLDER = 'entrance/steps'
@@ -19,7 +32,11 @@ class EntranceStepsHomePageBlock(home.models.AbstractHomePageBlock):
         # It's here to avoid cyclic imports
         import modules.entrance.models as entrance_models
 
-        steps = self._get_entrance_steps_for_user(request.user)
+        # All steps with their states are loaded once: visible steps and
+        # their predecessors share the instances and the memoized states
+        steps_states = entrance_models.EntranceStepsStates(self.school, request.user)
+        step_ids = self._get_entrance_steps_for_user(request.user).values_list('id', flat=True)
+        steps = [steps_states.get_step(step_id) for step_id in step_ids]
 
         blocks = []
 
@@ -41,29 +58,66 @@ class EntranceStepsHomePageBlock(home.models.AbstractHomePageBlock):
         #     steps = new_steps
         ### End of Optimization Hack
 
+        built_blocks = []
         for step in steps:
+            if step.is_visible_memoized(request.user):
+                # Resolves states of the step's predecessors
+                steps_states.get_state(step)
             block = step.build(request.user, request)
 
             if block is not None:
-                template_file = '%s/%s' % (self.ENTRANCE_STEPS_TEMPLATES_FOLDER,
-                                           step.template_file)
-                rendered_block = render_to_string(template_file, {
-                    'entrance_block': block,
-                    'EntranceStepState': entrance_models.EntranceStepState
-                }, request=request)
-
-                # Minifying rendered block by removing spaces and newlines.
-                # Use 'html.parser' instead of 'html5lib' because html5lib adds
-                # DOCTYPE, <html> and <body> tags to the output
-                rendered_block = html_minify(
-                    rendered_block,
-                    parser='html.parser'
-                )
-
-                blocks.append(rendered_block)
+                built_blocks.append((step, block))
+
+        # Rendered blocks are cached already minified
+        tags_version = get_tags_version([
+            cache_tags.school_steps(self.school_id),
+            cache_tags.school_levels(self.school_id),
+            cache_tags.user_steps(request.user.id),
+            cache_tags.user_levels(request.user.id),
+        ])
+        cache_keys = [
+            self._get_block_cache_key(step, block, request, tags_version)
+            for step, block in built_blocks
+        ]
+        cached_blocks = djcache.get_many(cache_keys)
+        new_cached_blocks = {}
+        for cache_key, (step, block) in zip(cache_keys, built_blocks):
+            rendered_block = cached_blocks.get(cache_key)
+            if rendered_block is None:
+                rendered_block = self._render_block(step, block, request)
+                new_cached_blocks[cache_key] = rendered_block
+
+            if CSRF_TOKEN_PLACEHOLDER in rendered_block:
+                rendered_block = rendered_block.replace(CSRF_TOKEN_PLACEHOLDER, get_token(request))
+            blocks.append(add_minified_fragment(request, rendered_block))
+        djcache.set_many(new_cached_blocks, STEP_BLOCK_CACHE_SECONDS)
 
         self.blocks = blocks
 
+    def _get_block_cache_key(self, step, block, request, tags_version):
+        key = repr([tags_version] + step.get_block_cache_key(block, request))
+        return 'entrance.step_block:%d:%s:%s' % (
+            step.id, request.user.id, hashlib.md5(key.encode()).hexdigest(),
+        )
+
+    def _render_block(self, step, block, request):
+        # It's here to avoid cyclic imports
+        import modules.entrance.models as entrance_models
+
+        template_file = '%s/%s' % (self.ENTRANCE_STEPS_TEMPLATES_FOLDER,
+                                   step.template_file)
+        rendered_block = render_to_string(template_file, {
+            'entrance_block': block,
+            'EntranceStepState': entrance_models.EntranceStepState,
+            # Cached block can be shown to the user after the CSRF token rotation
+            'csrf_token': CSRF_TOKEN_PLACEHOLDER,
+        }, request=request)
+
+        # Minifying rendered block by removing spaces and newlines.
+        # Use 'html.parser' instead of 'html5lib' because html5lib adds
+        # DOCTYPE, <html> and <body> tags to the output
+        return html_minify(rendered_block, parser='html.parser')
+
     def _get_entrance_steps_for_user(self, user):
         # It's here to avoid cyclic imports
         import modules.entrance.models as entrance_models
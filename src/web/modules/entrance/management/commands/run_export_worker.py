@@ -0,0 +1,97 @@
+import datetime
+import os
+import os.path
+import socket
+import time
+import traceback
+
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from modules.entrance import models
+from modules.entrance.staff import export
+
+
+class Command(BaseCommand):
+    help = 'Builds complete enrolling tables requested by staff'
+
+    IDLE_TIME_INTERVAL = 2  # in seconds
+    # Progress is reported every ExportCompleteEnrollingTable.PROGRESS_INTERVAL
+    # rows, but collecting data for the columns takes a long time on big schools
+    LEASE_DURATION = datetime.timedelta(minutes=30)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process all queued jobs and exit',
+        )
+        parser.add_argument(
+            '--worker-id', default='%s:%d' % (socket.gethostname(), os.getpid()),
+            help='Unique identifier of this worker. Default is hostname:pid',
+        )
+
+    def _get_output_file_name(self, job):
+        os.makedirs(settings.SISTEMA_ENROLLING_EXPORTS_DIR, exist_ok=True)
+        return os.path.join(
+            settings.SISTEMA_ENROLLING_EXPORTS_DIR,
+            'enrolling-%s-%d.xlsx' % (job.school.short_name, job.id)
+        )
+
+    def _process_job(self, job):
+        self.stdout.write('Building enrolling table for %s (job %d, attempt %d)' % (
+            job.school, job.id, job.attempts
+        ))
+
+        def on_progress(message, progress, progress_total):
+            if not job.update_progress(message, progress, progress_total, self.LEASE_DURATION):
+                raise RuntimeError('Job %d has been taken over by another worker' % job.id)
+
+        # Fingerprint is taken before reading the data: if the data changes
+        # while the table is building, the table will not be reused
+        data_fingerprint = export.get_enrolling_data_fingerprint(job.school)
+        output_file_name = self._get_output_file_name(job)
+        try:
+            export.ExportCompleteEnrollingTable().build(job, output_file_name, on_progress)
+        except Exception:
+            self.stdout.write(self.style.ERROR(
+                'Can\'t build table for job %d:\n%s' % (job.id, traceback.format_exc())
+            ))
+            job.finish(models.EnrollingTableExportJob.Status.FAILED, error=traceback.format_exc())
+            return
+
+        if job.finish(
+            models.EnrollingTableExportJob.Status.DONE,
+            file_name=output_file_name,
+            data_fingerprint=data_fingerprint,
+        ):
+            self.stdout.write(self.style.SUCCESS(
+                'Table for job %d is saved to %s' % (job.id, output_file_name)
+            ))
+            self._remove_old_files(job)
+
+    def _remove_old_files(self, job):
+        old_jobs = models.EnrollingTableExportJob.objects.filter(
+            school=job.school,
+            plain_header=job.plain_header,
+            status=models.EnrollingTableExportJob.Status.DONE,
+            created_at__lt=job.created_at,
+        ).exclude(file_name='')
+        for old_job in old_jobs:
+            if os.path.isfile(old_job.file_name):
+                os.remove(old_job.file_name)
+        old_jobs.update(file_name='')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id']
+        self.stdout.write('Export worker %s has been started' % worker_id)
+        while True:
+            db.close_old_connections()
+            job = models.EnrollingTableExportJob.claim_next(worker_id, self.LEASE_DURATION)
+            if job is not None:
+                self._process_job(job)
+                continue
+
+            if options['once']:
+                break
+            time.sleep(self.IDLE_TIME_INTERVAL)
@@ -0,0 +1,84 @@
+"""
+Invalidation of stored metric values (models.EntranceUserMetricValue).
+
+Values of the user are invalidated when the inputs of ParallelScoreEntranceUserMetric
+change for this user: a file solution is checked or a program solution
+gets the verdict from ejudge. Values of all users are invalidated when the
+metric's settings change. Invalidated values are recomputed on the next read
+only for these users, see EntranceUserMetric.values_for_users().
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.utils import timezone
+
+import modules.ejudge.models
+from modules.entrance import models
+
+
+def _invalidate_for_solutions(solutions):
+    for user_id, exam_id in solutions.non_polymorphic().values_list('user_id', 'task__exam_id'):
+        models.EntranceUserMetric.invalidate(exam_id, [user_id])
+
+
+def _on_check_changed(instance, raw=False, **kwargs):
+    if raw:
+        return
+    _invalidate_for_solutions(
+        models.EntranceExamTaskSolution.objects.filter(id=instance.solution_id)
+    )
+
+
+def _on_queue_element_saved(instance, raw, **kwargs):
+    if raw or instance.status != modules.ejudge.models.QueueElement.Status.CHECKED:
+        return
+    _invalidate_for_solutions(
+        models.ProgramEntranceExamTaskSolution.objects.filter(ejudge_queue_element_id=instance.id)
+    )
+
+
+def _invalidate_metric(metric_id):
+    models.EntranceUserMetricValue.objects.filter(metric_id=metric_id).update(
+        is_actual=False, version=F('version') + 1, updated_at=timezone.now(),
+    )
+
+
+def _on_metric_changed(instance, raw=False, **kwargs):
+    if not raw:
+        _invalidate_metric(instance.id)
+
+
+def _on_metric_entry_changed(instance, raw=False, **kwargs):
+    if not raw:
+        _invalidate_metric(instance.parallel_score_metric_id)
+
+
+def _on_replacing_tasks_changed(instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Instance is a task, all metrics which use it are affected
+        metric_ids = models.ParallelScoreEntranceUserMetric.objects.filter(
+            replacing_program_tasks=instance
+        ).values_list('id', flat=True)
+    else:
+        metric_ids = [instance.id]
+    for metric_id in metric_ids:
+        _invalidate_metric(metric_id)
+
+
+def connect_signals():
+    # Deleted solution of the check is still available in pre_delete
+    post_save.connect(_on_check_changed, sender=models.CheckedSolution)
+    pre_delete.connect(_on_check_changed, sender=models.CheckedSolution)
+    post_save.connect(_on_queue_element_saved, sender=modules.ejudge.models.QueueElement)
+
+    post_save.connect(_on_metric_changed, sender=models.ParallelScoreEntranceUserMetric)
+    for entry_model in (models.ParallelScoreEntranceUserMetricFileTaskEntry,
+                        models.ParallelScoreEntranceUserMetricProgramTaskEntry):
+        post_save.connect(_on_metric_entry_changed, sender=entry_model)
+        post_delete.connect(_on_metric_entry_changed, sender=entry_model)
+    m2m_changed.connect(
+        _on_replacing_tasks_changed,
+        sender=models.ParallelScoreEntranceUserMetric.replacing_program_tasks.through,
+    )
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import djchoices.choices
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0020_alter_school_short_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entrance', '0097_alter_abstractabsencereason_polymorphic_ctype_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollingTableExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plain_header', models.BooleanField(default=True, help_text='Однострочный заголовок таблицы')),
+                ('base_url', models.CharField(help_text='Адрес сайта, используется для построения ссылок в таблице', max_length=200)),
+                ('status', models.PositiveIntegerField(choices=[(1, 'В очереди'), (2, 'Строится'), (3, 'Готово'), (4, 'Ошибка')], db_index=True, default=1, validators=[djchoices.choices.ChoicesValidator({1: 'В очереди', 2: 'Строится', 3: 'Готово', 4: 'Ошибка'})])),
+                ('data_fingerprint', models.CharField(blank=True, help_text='Отпечаток данных поступления, по которым построена таблица. Пока он не изменился, готовая таблица используется повторно', max_length=64)),
+                ('progress_message', models.CharField(blank=True, max_length=200)),
+                ('progress', models.PositiveIntegerField(default=0, help_text='Сколько столбцов таблицы уже записано')),
+                ('progress_total', models.PositiveIntegerField(blank=True, help_text='Сколько всего столбцов в таблице. None, пока неизвестно', null=True)),
+                ('file_name', models.TextField(blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('worker_id', models.CharField(blank=True, max_length=200)),
+                ('lease_expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='schools.school')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrance', '0098_enrollingtableexportjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='enrollingtableexportjob',
+            name='progress',
+            field=models.PositiveIntegerField(default=0, help_text='Сколько строк таблицы уже записано'),
+        ),
+        migrations.AlterField(
+            model_name='enrollingtableexportjob',
+            name='progress_total',
+            field=models.PositiveIntegerField(blank=True, help_text='Сколько всего строк в таблице. None, пока неизвестно', null=True),
+        ),
+    ]
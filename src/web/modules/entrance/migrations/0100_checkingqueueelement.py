@@ -0,0 +1,60 @@
+# Generated by Django 4.0.10 on 2026-10-18 19:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import modules.entrance.models.checking
+
+
+def fill_checking_queue(apps, schema_editor):
+    FileEntranceExamTaskSolution = apps.get_model('entrance', 'FileEntranceExamTaskSolution')
+    CheckedSolution = apps.get_model('entrance', 'CheckedSolution')
+    CheckingQueueElement = apps.get_model('entrance', 'CheckingQueueElement')
+
+    checked = set(CheckedSolution.objects.values_list('solution__task_id', 'solution__user_id'))
+    unchecked = (
+        set(FileEntranceExamTaskSolution.objects.values_list('task_id', 'user_id')) - checked
+    )
+    CheckingQueueElement.objects.bulk_create([
+        CheckingQueueElement(task_id=task_id, user_id=user_id)
+        for task_id, user_id in unchecked
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entrance', '0099_export_job_progress_in_rows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckingQueueElement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('random_key', models.PositiveIntegerField(default=modules.entrance.models.checking._get_random_key, help_text='Решения выдаются проверяющим в порядке этого ключа, то есть в случайном порядке')),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('locked_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entrance_checking_leases', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='entrance.entranceexamtask')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='CheckingLock',
+        ),
+        migrations.AddIndex(
+            model_name='checkingqueueelement',
+            index=models.Index(fields=['task', 'random_key'], name='entrance_ch_task_id_41dc33_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkingqueueelement',
+            index=models.Index(fields=['locked_by', 'locked_until'], name='entrance_ch_locked__710a57_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='checkingqueueelement',
+            unique_together={('task', 'user')},
+        ),
+        migrations.RunPython(fill_checking_queue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.10 on 2026-10-18 20:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('entrance', '0100_checkingqueueelement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntranceUserMetricValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.JSONField(blank=True, null=True)),
+                ('is_actual', models.BooleanField(default=False, help_text='Пересчитано ли значение после последнего изменения входных данных метрики')),
+                ('version', models.PositiveIntegerField(default=0, help_text='Увеличивается при каждой инвалидации. Нужна, чтобы не пометить актуальным значение, изменившееся во время пересчёта')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('metric', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='values', to='entrance.entranceusermetric')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('metric', 'user')},
+            },
+        ),
+    ]
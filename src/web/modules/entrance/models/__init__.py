@@ -5,3 +5,4 @@ from .steps import *
 from .checking import *
 from .groups import *
 from .levels import *
+from .export import *
@@ -1,5 +1,10 @@
+import random
+
 from constance import config
 from django.db import models, IntegrityError
+from django.db.models import F, Q, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
 import schools.models
@@ -52,30 +57,131 @@ def get_locked_timeout():
             timezone.timedelta(minutes=config.SISTEMA_ENTRANCE_CHECKING_TIMEOUT))
 
 
-class CheckingLock(models.Model):
-    user = models.ForeignKey(
-        users.models.User,
-        related_name='entrance_checking_locks',
-        on_delete=models.CASCADE,
-    )
+def _get_random_key():
+    return random.randint(0, 2 ** 31 - 1)
+
 
+class CheckingQueueElement(models.Model):
+    """
+    Solution of the task which is waiting for checking. Elements are added when
+    user sends a solution and removed when the solution is checked (see
+    modules.entrance.checking_queue). Checker takes an element by `claim()` and
+    holds its lease until `locked_until`, so expired leases need no cleanup.
+    """
     task = models.ForeignKey(
         main_models.EntranceExamTask,
         related_name='+',
         on_delete=models.CASCADE,
     )
 
-    locked_by = models.ForeignKey(
+    user = models.ForeignKey(
         users.models.User,
-        related_name='entrance_checking_locks_by_user',
+        related_name='+',
         on_delete=models.CASCADE,
     )
 
-    locked_until = models.DateTimeField(
-        default=get_locked_timeout,
-        db_index=True
+    random_key = models.PositiveIntegerField(
+        default=_get_random_key,
+        help_text='Решения выдаются проверяющим в порядке этого ключа, '
+                  'то есть в случайном порядке',
     )
 
+    locked_by = models.ForeignKey(
+        users.models.User,
+        related_name='entrance_checking_leases',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Number of the first free elements one of which is claimed.
+    # Concurrent checkers don't compete for the same element this way
+    CLAIM_CANDIDATES_COUNT = 10
+
+    class Meta:
+        unique_together = ('task', 'user')
+        indexes = [
+            models.Index(fields=['task', 'random_key']),
+            models.Index(fields=['locked_by', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return 'Решение %s задачи %s в очереди проверки' % (self.user, self.task)
+
+    @classmethod
+    def _free(cls):
+        return cls.objects.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=timezone.now())
+        )
+
+    @classmethod
+    def get_lease(cls, checker):
+        """
+        :return: element which is being checked by `checker` now or None
+        """
+        return cls.objects.filter(
+            locked_by=checker, locked_until__gte=timezone.now(),
+        ).first()
+
+    @classmethod
+    def claim(cls, task, user_ids, checker):
+        """
+        Leases a random free solution of the task for `checker`.
+        :param user_ids: only solutions of these users are considered,
+        QuerySet or list
+        :return: claimed element or None if all solutions are checked or leased
+        """
+        while True:
+            candidates = list(
+                cls._free()
+                    .filter(task=task, user_id__in=user_ids)
+                    .order_by('random_key')
+                    .values_list('id', 'locked_until')[:cls.CLAIM_CANDIDATES_COUNT]
+            )
+            random.shuffle(candidates)
+            for element_id, locked_until in candidates:
+                # Conditional update: succeeds only if nobody has claimed
+                # the element since we have read it
+                updated = cls.objects.filter(id=element_id, locked_until=locked_until).update(
+                    locked_by=checker,
+                    locked_until=get_locked_timeout(),
+                )
+                if updated > 0:
+                    return cls.objects.get(id=element_id)
+
+            # If all candidates have been claimed by other checkers,
+            # there can be more free elements
+            if len(candidates) < cls.CLAIM_CANDIDATES_COUNT:
+                return None
+
+    def lease(self, checker):
+        """
+        Leases the element for `checker` if it's not leased by somebody else.
+        :return: True if the element is leased by `checker` now
+        """
+        now = timezone.now()
+        self.locked_until = get_locked_timeout()
+        updated = CheckingQueueElement.objects.filter(
+            Q(locked_by=checker) | Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+            id=self.id,
+        ).update(
+            locked_by=checker,
+            locked_until=self.locked_until,
+        )
+        if updated > 0:
+            self.locked_by = checker
+        return updated > 0
+
+    def release(self, checker):
+        CheckingQueueElement.objects.filter(id=self.id, locked_by=checker).update(
+            locked_by=None,
+            locked_until=None,
+        )
+
 
 class CheckedSolution(models.Model):
     solution = models.ForeignKey(
@@ -102,6 +208,40 @@ class CheckedSolution(models.Model):
         db_index=True,
     )
 
+    @classmethod
+    def get_last_checks_by_task(cls, tasks, user_ids, count):
+        """
+        Loads the last `count` checks of every task by one query.
+        :param user_ids: only solutions of these users are considered,
+        QuerySet or list
+        :return: dict {task_id: list of checks, the newest first}
+        """
+        numbered_checks = cls.objects.filter(
+            solution__task__in=tasks,
+            solution__user_id__in=user_ids,
+        ).annotate(
+            number_in_task=Window(
+                expression=RowNumber(),
+                partition_by=F('solution__task_id'),
+                order_by=F('created_at').desc(),
+            )
+        ).order_by().values('id', 'number_in_task')
+
+        # Django can't filter by window functions, so the numbered checks
+        # are filtered in the outer query
+        sql, params = numbered_checks.query.sql_with_params()
+        last_checks = cls.objects.filter(id__in=RawSQL(
+            'SELECT id FROM (%s) numbered_checks WHERE number_in_task <= %%s' % sql,
+            params + (count, ),
+        )).select_related(
+            'solution__user__profile', 'checked_by__profile',
+        ).order_by('-created_at')
+
+        checks_by_task = {}
+        for check in last_checks:
+            checks_by_task.setdefault(check.solution.task_id, []).append(check)
+        return checks_by_task
+
 
 class CheckingComment(models.Model):
     school = models.ForeignKey(
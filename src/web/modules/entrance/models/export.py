@@ -0,0 +1,212 @@
+import os.path
+
+import djchoices
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+import schools.models
+
+__all__ = ['EnrollingTableExportJob']
+
+
+class EnrollingTableExportJob(models.Model):
+    """
+    Request for building the complete enrolling table in background.
+    Jobs are processed by `run_export_worker` management command.
+    If the worker dies, its lease expires and the job is started again
+    by another worker (at most MAX_ATTEMPTS times).
+    """
+    class Status(djchoices.DjangoChoices):
+        QUEUED = djchoices.ChoiceItem(1, 'В очереди')
+        RUNNING = djchoices.ChoiceItem(2, 'Строится')
+        DONE = djchoices.ChoiceItem(3, 'Готово')
+        FAILED = djchoices.ChoiceItem(4, 'Ошибка')
+
+    MAX_ATTEMPTS = 3
+
+    school = models.ForeignKey(
+        schools.models.School,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True,
+    )
+
+    plain_header = models.BooleanField(
+        default=True,
+        help_text='Однострочный заголовок таблицы',
+    )
+
+    base_url = models.CharField(
+        max_length=200,
+        help_text='Адрес сайта, используется для построения ссылок в таблице',
+    )
+
+    status = models.PositiveIntegerField(
+        choices=Status.choices,
+        validators=[Status.validator],
+        default=Status.QUEUED,
+        db_index=True,
+    )
+
+    data_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text='Отпечаток данных поступления, по которым построена таблица. '
+                  'Пока он не изменился, готовая таблица используется повторно',
+    )
+
+    progress_message = models.CharField(max_length=200, blank=True)
+
+    progress = models.PositiveIntegerField(
+        default=0,
+        help_text='Сколько строк таблицы уже записано',
+    )
+
+    progress_total = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Сколько всего строк в таблице. None, пока неизвестно',
+    )
+
+    file_name = models.TextField(blank=True)
+
+    error = models.TextField(blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+
+    worker_id = models.CharField(max_length=200, blank=True)
+
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    started_at = models.DateTimeField(null=True, blank=True)
+
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('-created_at', )
+
+    def __str__(self):
+        return 'Выгрузка поступления %s от %s' % (self.school, self.created_at)
+
+    @property
+    def is_running(self):
+        return self.status == self.Status.RUNNING
+
+    @property
+    def is_failed(self):
+        return self.status == self.Status.FAILED
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.DONE, self.Status.FAILED)
+
+    @property
+    def is_file_available(self):
+        return (self.status == self.Status.DONE and
+                self.file_name != '' and
+                os.path.isfile(self.file_name))
+
+    @classmethod
+    def find_reusable(cls, school, plain_header, data_fingerprint):
+        """
+        Returns a job which can be used instead of creating new one:
+        unfinished job or finished one built from the same data.
+        """
+        jobs = cls.objects.filter(school=school, plain_header=plain_header)
+        unfinished_job = jobs.filter(
+            status__in=[cls.Status.QUEUED, cls.Status.RUNNING]
+        ).first()
+        if unfinished_job is not None:
+            return unfinished_job
+
+        for job in jobs.filter(status=cls.Status.DONE, data_fingerprint=data_fingerprint):
+            if job.is_file_available:
+                return job
+        return None
+
+    @classmethod
+    def claim_next(cls, worker_id, lease_duration):
+        """
+        Claims the oldest queued job or the job whose worker has died.
+        :return: claimed job or None if there are no jobs
+        """
+        now = timezone.now()
+        candidates = cls.objects.filter(
+            Q(status=cls.Status.QUEUED) |
+            Q(status=cls.Status.RUNNING, lease_expires_at__lt=now)
+        ).order_by('created_at').values_list('id', 'status', 'attempts')
+
+        for job_id, status, attempts in candidates:
+            if attempts >= cls.MAX_ATTEMPTS:
+                cls.objects.filter(id=job_id, status=status, attempts=attempts).update(
+                    status=cls.Status.FAILED,
+                    error='Превышено количество попыток построить таблицу',
+                    finished_at=now,
+                )
+                continue
+
+            # Conditional update: succeeds only if nobody has claimed
+            # the job since we have read it
+            updated = cls.objects.filter(id=job_id, status=status, attempts=attempts).update(
+                status=cls.Status.RUNNING,
+                attempts=attempts + 1,
+                worker_id=worker_id,
+                lease_expires_at=now + lease_duration,
+                started_at=now,
+                progress=0,
+                progress_total=None,
+            )
+            if updated > 0:
+                return cls.objects.get(id=job_id)
+        return None
+
+    def update_progress(self, message, progress, progress_total, lease_duration):
+        """
+        Saves progress and extends the lease of the worker.
+        :return: False if the job has been taken over by another worker
+        """
+        self.progress_message = message
+        self.progress = progress
+        self.progress_total = progress_total
+        self.lease_expires_at = timezone.now() + lease_duration
+        return EnrollingTableExportJob.objects.filter(
+            id=self.id, worker_id=self.worker_id, status=self.Status.RUNNING,
+        ).update(
+            progress_message=self.progress_message,
+            progress=self.progress,
+            progress_total=self.progress_total,
+            lease_expires_at=self.lease_expires_at,
+        ) > 0
+
+    def finish(self, status, file_name='', error='', data_fingerprint=None):
+        """
+        :return: False if the job has been taken over by another worker
+        """
+        self.status = status
+        self.file_name = file_name
+        self.error = error
+        if data_fingerprint is not None:
+            self.data_fingerprint = data_fingerprint
+        self.finished_at = timezone.now()
+        self.lease_expires_at = None
+        return EnrollingTableExportJob.objects.filter(
+            id=self.id, worker_id=self.worker_id, status=self.Status.RUNNING,
+        ).update(
+            status=self.status,
+            file_name=self.file_name,
+            error=self.error,
+            data_fingerprint=self.data_fingerprint,
+            finished_at=self.finished_at,
+            lease_expires_at=None,
+        ) > 0
@@ -2,9 +2,12 @@ import multiselectfield
 from django.db import models, IntegrityError
 from django.db.models import Q
 
+import groups.materialized
 import groups.models
+import schools.models
 import users.models
-from .main import EntranceStatus, AbstractAbsenceReason
+from .main import EntranceStatus, AbstractAbsenceReason, EnrolledToSessionAndParallel
+from .steps import SelectedEnrollmentType
 
 
 class EntranceStatusGroup(groups.models.AbstractGroup):
@@ -261,3 +264,41 @@ class SelectedEnrollmentTypeGroup(groups.models.AbstractGroup):
         super().save(*args, **kwargs)
 
 
+groups.materialized.register_dependency(
+    EntranceStatus,
+    lambda status: groups.models.AbstractGroup.objects.instance_of(
+        EntranceStatusGroup,
+        EntranceStatusesGroup,
+        EnrollmentApprovingStatusGroup,
+        EnrolledUsersGroup,
+    ).filter(school_id=status.school_id)
+)
+groups.materialized.register_dependency(
+    AbstractAbsenceReason,
+    lambda reason: groups.models.AbstractGroup.objects.instance_of(
+        EnrollmentApprovingStatusGroup,
+        EnrolledUsersGroup,
+    ).filter(school_id=reason.school_id)
+)
+groups.materialized.register_dependency(
+    EnrolledToSessionAndParallel,
+    # Entrance status can be already deleted here, so don't use
+    # enrolled.entrance_status.school_id
+    lambda enrolled: EnrolledUsersGroup.objects.filter(
+        school_id__in=EntranceStatus.objects.filter(
+            id=enrolled.entrance_status_id
+        ).values('school_id')
+    )
+)
+groups.materialized.register_dependency(
+    schools.models.SchoolParticipant,
+    lambda participant: UsersParticipatedInSchoolGroup.objects.filter(
+        school_to_check_participation_id=participant.school_id
+    )
+)
+groups.materialized.register_dependency(
+    SelectedEnrollmentType,
+    lambda selection: SelectedEnrollmentTypeGroup.objects.filter(
+        enrollment_type_id=selection.enrollment_type_id
+    )
+)
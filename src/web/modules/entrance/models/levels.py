@@ -6,6 +6,7 @@ from django.db import models, IntegrityError
 import polymorphic.models
 
 import schools.models
+from modules.entrance import cache_tags
 from sistema.cache import cache
 
 
@@ -204,6 +205,14 @@ class EntranceLevelLimiter(polymorphic.models.PolymorphicModel):
             '%s should implement get_limit()' % (self.__class__.__name__, )
         )
 
+    def get_limits_for_users(self, users):
+        """
+        Returns limits for many users at once: dict {user_id: EntranceLevelLimit}.
+        By default calls get_limit() for each user. Override it in subclass
+        to compute limits with the constant number of queries.
+        """
+        return {user.id: self.get_limit(user) for user in users}
+
 
 class EntranceLevelLimit:
     def __init__(self, min_level):
@@ -223,9 +232,9 @@ class AlreadyWasEntranceLevelLimiter(EntranceLevelLimiter):
     def __str__(self):
         return 'Лимитер по прошлым посещениям школы'
 
-    @cache(60)
+    @cache(3600, tags=lambda self: [cache_tags.school_levels(self.school_id)])
     def _cached_limits_for_parallels(self):
-        return list(self.limits_for_parallels.all())
+        return list(self.limits_for_parallels.select_related('level'))
 
     def _limits_for_parallels_filter(self, key: str, value_list: list):
         return [item for item in self._cached_limits_for_parallels() if getattr(item, key) in value_list]
@@ -257,6 +266,23 @@ class AlreadyWasEntranceLevelLimiter(EntranceLevelLimiter):
 
         return current_limit
 
+    def get_limits_for_users(self, users):
+        minimal_level = self._find_minimal_level()
+        limits = {user.id: EntranceLevelLimit(minimal_level) for user in users}
+
+        limits_for_parallels = self._cached_limits_for_parallels()
+        participations = schools.models.SchoolParticipant.objects.filter(
+            user_id__in=limits.keys()
+        ).values_list('user_id', 'parallel_id', 'parallel__short_name')
+        for user_id, parallel_id, parallel_short_name in participations:
+            for limit_for_parallel in limits_for_parallels:
+                if (limit_for_parallel.previous_parallel_id == parallel_id or
+                        limit_for_parallel.previous_parallel_short_name == parallel_short_name):
+                    limits[user_id].update_with_other(
+                        EntranceLevelLimit(limit_for_parallel.level)
+                    )
+        return limits
+
 
 class AlreadyWasEntranceLevelLimiterForParallel(models.Model):
     limiter = models.ForeignKey(
@@ -307,21 +333,22 @@ class AgeEntranceLevelLimiter(EntranceLevelLimiter):
     def __str__(self):
         return 'Лимитер по классу'
 
-    def get_limit(self, user):
-        if not hasattr(user, 'profile'):
-            return EntranceLevelLimit(self._find_minimal_level())
-
+    def _get_date_for_class(self):
         # Let's try to find out class in the right year
         if self.school.sessions.exists():
-            date = self.school.sessions.first().start_date
-        elif self.school.year:
+            return self.school.sessions.first().start_date
+        if self.school.year:
             try:
-                date = datetime.date(year=int(self.school.year), month=1, day=1)
+                return datetime.date(year=int(self.school.year), month=1, day=1)
             except ValueError:
-                date = None
-        else:
-            date = None
+                return None
+        return None
 
+    def get_limit(self, user):
+        if not hasattr(user, 'profile'):
+            return EntranceLevelLimit(self._find_minimal_level())
+
+        date = self._get_date_for_class()
         current_class = user.profile.get_class(date=date)
         if current_class is None:
             return EntranceLevelLimit(self._find_minimal_level())
@@ -337,6 +364,33 @@ class AgeEntranceLevelLimiter(EntranceLevelLimiter):
 
         return EntranceLevelLimit(self._find_minimal_level())
 
+    def get_limits_for_users(self, users):
+        # It's here to avoid cyclic imports
+        from users.models import UserProfile
+
+        minimal_level = self._find_minimal_level()
+        date = self._get_date_for_class()
+        limits_for_classes = list(
+            self.limits_for_classes.order_by('-current_class').select_related('level')
+        )
+        profiles = {
+            profile.user_id: profile
+            for profile in UserProfile.objects.filter(user_id__in=[user.id for user in users])
+        }
+
+        limits = {}
+        for user in users:
+            level = minimal_level
+            profile = profiles.get(user.id)
+            current_class = profile.get_class(date=date) if profile is not None else None
+            if current_class is not None:
+                for limit in limits_for_classes:
+                    if limit.current_class <= current_class:
+                        level = limit.level
+                        break
+            limits[user.id] = EntranceLevelLimit(level)
+        return limits
+
 
 class AgeEntranceLevelLimiterForClass(models.Model):
     limiter = models.ForeignKey(
@@ -385,3 +439,22 @@ class EnrollmentTypeEntranceLevelLimiter(EntranceLevelLimiter):
                 current_limit.update_with_other(EntranceLevelLimit(entrance_level))
 
         return current_limit
+
+    def get_limits_for_users(self, users):
+        # It's here to avoid cyclic imports
+        from modules.entrance.models.steps import SelectedEnrollmentType
+        limits = {user.id: EntranceLevelLimit(None) for user in users}
+        school_levels = list(EntranceLevel.objects.filter(school=self.school).order_by('order'))
+        selected_enrollment_types = SelectedEnrollmentType.objects.filter(
+            user_id__in=limits.keys(),
+            step__school=self.school,
+            is_moderated=True,
+            is_approved=True,
+        ).select_related('step__school', 'accepted_entrance_level', 'entrance_level')
+        for selected_enrollment_type in selected_enrollment_types:
+            if selected_enrollment_type.has_entrance_level():
+                entrance_level = selected_enrollment_type.get_entrance_level(school_levels)
+                limits[selected_enrollment_type.user_id].update_with_other(
+                    EntranceLevelLimit(entrance_level)
+                )
+        return limits
@@ -1,4 +1,5 @@
-import functools
+import collections
+import datetime
 import re
 
 import django.utils.timezone
@@ -8,6 +9,7 @@ import sizefield.models
 from cached_property import cached_property
 from django.conf import settings
 from django.db import models, transaction, IntegrityError
+from django.db.models import Count, Max
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
@@ -15,9 +17,11 @@ from django.utils.translation import gettext_lazy as _
 import dates.models
 import groups.models
 import modules.ejudge.models
-from modules.entrance import forms
+from modules.entrance import cache_tags, forms
 from sistema.cache import cache
 
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
 
 class EntranceExam(models.Model):
     school = models.OneToOneField(
@@ -225,6 +229,48 @@ class EntranceExamTask(polymorphic.models.PolymorphicModel):
         # Always not solved by default. Override when subclassing.
         return False
 
+    def is_accepted_by_solutions(self, solutions):
+        """
+        Same as is_accepted_for_user(), but for already loaded user's
+        solutions of this task ordered from the newest to the oldest
+        """
+        return False
+
+    def is_solved_by_solutions(self, solutions):
+        """
+        Same as is_solved_by_user(), but for already loaded user's
+        solutions of this task ordered from the newest to the oldest
+        """
+        return False
+
+    @classmethod
+    def load_user_solutions(cls, tasks, user):
+        """
+        Loads user's solutions for all the tasks with their checking results
+        by one query for each type of tasks and sets task.user_solutions
+        (from the newest to the oldest), task.is_accepted and task.is_solved
+        """
+        tasks_by_solution_class = collections.defaultdict(list)
+        for task in tasks:
+            tasks_by_solution_class[task.solution_class].append(task)
+
+        solutions_by_task_id = collections.defaultdict(list)
+        for solution_class, class_tasks in tasks_by_solution_class.items():
+            solutions = solution_class.objects.filter(
+                user=user, task__in=class_tasks,
+            ).order_by('-created_at')
+            if issubclass(solution_class, EjudgeEntranceExamTaskSolution):
+                solutions = solutions.select_related('ejudge_queue_element__submission__result')
+            if issubclass(solution_class, ProgramEntranceExamTaskSolution):
+                solutions = solutions.select_related('language')
+            for solution in solutions:
+                solutions_by_task_id[solution.task_id].append(solution)
+
+        for task in tasks:
+            task.user_solutions = solutions_by_task_id[task.id]
+            task.is_accepted = task.is_accepted_by_solutions(task.user_solutions)
+            task.is_solved = task.is_solved_by_solutions(task.user_solutions)
+
     @property
     def template_file(self):
         """
@@ -273,23 +319,31 @@ class TestEntranceExamTask(EntranceExamTask):
     def is_solution_correct(self, solution):
         return re.fullmatch(self.correct_answer_re, solution) is not None
 
+    def _get_last_solution(self, user):
+        # Use solutions loaded by load_user_solutions() if they are here
+        if hasattr(self, 'user_solutions'):
+            return self.user_solutions[0] if self.user_solutions else None
+        return self.solutions.filter(user=user).order_by('-created_at').first()
+
     def is_accepted_for_user(self, user):
-        last_solution = self.solutions.filter(user=user).last()
+        last_solution = self._get_last_solution(user)
         return (last_solution is not None and
                 self.is_solution_valid(last_solution.solution))
 
     def is_solved_by_user(self, user):
-        last_solution = self.solutions.filter(user=user).last()
+        last_solution = self._get_last_solution(user)
         return (last_solution is not None and
                 self.is_solution_correct(last_solution.solution))
 
+    def is_accepted_by_solutions(self, solutions):
+        return len(solutions) > 0 and self.is_solution_valid(solutions[0].solution)
+
+    def is_solved_by_solutions(self, solutions):
+        return len(solutions) > 0 and self.is_solution_correct(solutions[0].solution)
+
     def get_form_for_user(self, user, *args, **kwargs):
         initial = {}
-        last_solution = (
-            self.solutions
-            .filter(user=user)
-            .order_by('-created_at')
-            .first())
+        last_solution = self._get_last_solution(user)
         if last_solution is not None:
             initial['solution'] = last_solution.solution
         form = forms.TestEntranceTaskForm(
@@ -318,10 +372,13 @@ class FileEntranceExamTask(EntranceExamTask):
                   'Поддерживается Markdown',
     )
 
-    @functools.lru_cache(maxsize=None)
+    @cache(3600, tags=lambda self, user: [cache_tags.user_solutions(user.id)])
     def is_accepted_for_user(self, user):
         return self.solutions.filter(user=user).exists()
 
+    def is_accepted_by_solutions(self, solutions):
+        return len(solutions) > 0
+
     def get_form_for_user(self, user, *args, **kwargs):
         return forms.FileEntranceTaskForm(self, *args, **kwargs)
 
@@ -344,17 +401,35 @@ class EjudgeEntranceExamTask(EntranceExamTask):
     def is_accepted_for_user(self, user):
         return self.is_solved_by_user(user)
 
-    @cache(1)
+    @cache(3600, tags=lambda self, user: [cache_tags.user_solutions(user.id)])
     def is_solved_by_user(self, user):
         user_solutions = self.solution_class.objects.filter(
             user=user,
             task=self
         ).select_related('ejudge_queue_element__submission__result')
-        task_has_ok = any(filter(
-            lambda s: s.is_checked and s.result.is_success,
-            user_solutions
-        ))
-        return task_has_ok
+        return self.is_solved_by_solutions(user_solutions)
+
+    def is_accepted_by_solutions(self, solutions):
+        return self.is_solved_by_solutions(solutions)
+
+    def is_solved_by_solutions(self, solutions):
+        return any(s.is_checked and s.result.is_success for s in solutions)
+
+    def get_user_solutions_version(self, user):
+        """
+        Returns a string which changes when the user sends a new solution of
+        this task and when the checking status of any of the user's solutions
+        changes. It's made by one aggregate query, so it's cheap to poll.
+        Version has format "<solutions count>-<last change in microseconds>"
+        """
+        state = self.solution_class.objects.filter(task=self, user=user).aggregate(
+            count=Count('id'),
+            last_change=Max('ejudge_queue_element__updated_at'),
+        )
+        last_change = 0
+        if state['last_change'] is not None:
+            last_change = (state['last_change'] - _EPOCH) // datetime.timedelta(microseconds=1)
+        return '%d-%d' % (state['count'], last_change)
 
     @property
     def solutions_template_file(self):
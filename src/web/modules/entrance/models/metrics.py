@@ -1,17 +1,17 @@
 import collections
 import itertools
 
-from django.core.cache import cache
 from django.db import models, IntegrityError
-from django.utils.functional import cached_property
+from django.db.models import F
+from django.utils import timezone
 
 import polymorphic.models
 
 import modules.ejudge.models
+import users.models
 
 from . import checking as checking_models
 from . import main as main_models
-from modules.entrance import utils
 
 
 class EntranceUserMetric(polymorphic.models.PolymorphicModel):
@@ -26,61 +26,87 @@ class EntranceUserMetric(polymorphic.models.PolymorphicModel):
         related_name='metrics',
     )
 
-    # Should the metric be cached? Use for heavy metrics
+    # Should the metric values be stored in EntranceUserMetricValue?
+    # Use for heavy metrics. Inputs of such metrics should be registered
+    # in modules.entrance.metric_values, so the values are recomputed when
+    # the inputs change
     enable_cache = False
 
-    # Cache timeout for the metric in seconds
-    cache_timeout = 300
-
     class Meta:
         unique_together = ('name', 'exam')
 
     def __str__(self):
         return 'Метрика {} для {}'.format(self.name, self.exam)
 
-    @cached_property
-    def cache_key(self):
-        local_key = '-'.join(str(x) for x in (self.pk, self.exam.pk))
-        return 'entrance.EntranceUserMetric-' + local_key
-
     def values_for_users(self, users):
         """
         Return a list of metric values for given users.
 
         This method contains only the caching logic. Actual metric retrieval is
-        done in _values_for_users method.
+        done in _values_for_users method. Only values of the users which have
+        not been computed yet or whose inputs have changed are computed here.
         """
         if not self.enable_cache:
-            return self._values_for_users(users)
-
-        cached_value_by_user_id = cache.get(self.cache_key)
-        if cached_value_by_user_id is None:
-            users_to_cache = utils.get_enrolling_users(self.exam.school)
-            cached_value_by_user_id = {
-                user.id: value
-                for user, value in zip(users_to_cache,
-                                       self._values_for_users(users_to_cache))
-            }
-            cache.set(self.cache_key,
-                      cached_value_by_user_id,
-                      timeout=self.cache_timeout)
-
-        values = []
-        missing_users = []
-        missing_indices = []
-        for i, user in enumerate(users):
-            cached_value = cached_value_by_user_id.get(user.id)
-            values.append(cached_value)
-            if cached_value is None:
-                missing_users.append(user)
-                missing_indices.append(i)
-
-        if missing_users:
-            missing_values = self._values_for_users(missing_users)
-            for i, value in zip(missing_indices, missing_values):
-                values[i] = value
-
-        return values
+            return list(self._values_for_users(users))
+
+        users = list(users)
+        stored_values = EntranceUserMetricValue.objects.filter(metric=self, user__in=users)
+        value_by_user_id = {}
+        outdated_users = []
+        for stored_value in stored_values:
+            if stored_value.is_actual:
+                value_by_user_id[stored_value.user_id] = stored_value.value
+        for user in users:
+            if user.id not in value_by_user_id:
+                outdated_users.append(user)
+
+        if outdated_users:
+            value_by_user_id.update(self._update_stored_values(outdated_users))
+
+        return [value_by_user_id[user.id] for user in users]
+
+    def _update_stored_values(self, users):
+        """
+        Computes and stores values for given users.
+        :return: dict {user_id: value}
+        """
+        # Rows are created before the computation, so changes of the inputs
+        # during the computation increase their versions (see invalidate())
+        EntranceUserMetricValue.objects.bulk_create([
+            EntranceUserMetricValue(metric=self, user=user, is_actual=False)
+            for user in users
+        ], ignore_conflicts=True)
+        version_by_user_id = dict(
+            EntranceUserMetricValue.objects
+                .filter(metric=self, user__in=users)
+                .values_list('user_id', 'version')
+        )
+
+        value_by_user_id = {}
+        user_ids_by_value_and_version = collections.defaultdict(list)
+        for user, value in zip(users, self._values_for_users(users)):
+            value_by_user_id[user.id] = value
+            user_ids_by_value_and_version[value, version_by_user_id[user.id]].append(user.id)
+
+        # There are few different values, so values are saved by groups.
+        # Values whose inputs have changed during the computation stay not actual
+        for (value, version), user_ids in user_ids_by_value_and_version.items():
+            EntranceUserMetricValue.objects.filter(
+                metric=self, user_id__in=user_ids, version=version,
+            ).update(value=value, is_actual=True, updated_at=timezone.now())
+
+        return value_by_user_id
+
+    @classmethod
+    def invalidate(cls, exam_id, user_ids=None):
+        """
+        Marks stored values of the exam's metrics as not actual. If `user_ids`
+        is None, values of all users are invalidated.
+        """
+        values = EntranceUserMetricValue.objects.filter(metric__exam_id=exam_id)
+        if user_ids is not None:
+            values = values.filter(user_id__in=user_ids)
+        values.update(is_actual=False, version=F('version') + 1, updated_at=timezone.now())
 
     def _values_for_users(self, users):
         """
@@ -196,6 +222,47 @@ class ParallelScoreEntranceUserMetric(EntranceUserMetric):
             yield round(theory_score + practice_score)
 
 
+class EntranceUserMetricValue(models.Model):
+    """
+    Stored value of the metric for the user, see EntranceUserMetric.enable_cache
+    """
+    metric = models.ForeignKey(
+        EntranceUserMetric,
+        on_delete=models.CASCADE,
+        related_name='values',
+    )
+
+    user = models.ForeignKey(
+        users.models.User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    # Metrics' values are numbers or strings
+    value = models.JSONField(null=True, blank=True)
+
+    is_actual = models.BooleanField(
+        default=False,
+        help_text='Пересчитано ли значение после последнего изменения входных данных метрики',
+    )
+
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text='Увеличивается при каждой инвалидации. Нужна, чтобы не '
+                  'пометить актуальным значение, изменившееся во время пересчёта',
+    )
+
+    # Values are written by QuerySet.update(), which doesn't touch auto_now
+    # fields, so all the updates set it explicitly
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('metric', 'user')
+
+    def __str__(self):
+        return '{}: {} для {}'.format(self.metric, self.value, self.user)
+
+
 class ParallelScoreEntranceUserMetricFileTaskEntry(models.Model):
     parallel_score_metric = models.ForeignKey(
         ParallelScoreEntranceUserMetric,
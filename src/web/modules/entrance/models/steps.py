@@ -48,8 +48,8 @@ class EntranceStepBlock:
         self.step_is_closed = step.is_closed(user)
 
         next_visible_step = step.get_next_visible_step(user)
-        self.step_is_last_passed_step = step.is_passed(user) and (
-            next_visible_step is None or not next_visible_step.is_passed(user)
+        self.step_is_last_passed_step = step.is_passed_memoized(user) and (
+            next_visible_step is None or not next_visible_step.is_passed_memoized(user)
         )
 
 
@@ -132,6 +132,12 @@ class AbstractEntranceStep(polymorphic_models.PolymorphicModel):
     """ Override to True in your subclass to keep your step always open """
     always_expanded = False
 
+    # Memoized results of is_passed(), is_visible() and get_state(),
+    # {(method name, user id): result}. It's set by EntranceStepsStates
+    # for the instances which live during one request, otherwise the results
+    # are not memoized
+    _memo = None
+
     @cached_property
     def _available_from_time(self):
         return self.available_from_time
@@ -160,6 +166,24 @@ class AbstractEntranceStep(polymorphic_models.PolymorphicModel):
         """
         return True
 
+    def _memoize(self, name, user, compute):
+        if self._memo is None:
+            return compute()
+        key = (name, user.id)
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def _set_memoized(self, name, user, value):
+        if self._memo is not None:
+            self._memo[(name, user.id)] = value
+
+    def is_passed_memoized(self, user):
+        return self._memoize('is_passed', user, lambda: self.is_passed(user))
+
+    def is_visible_memoized(self, user):
+        return self._memoize('is_visible', user, lambda: self.is_visible(user))
+
     def get_state(self, user):
         """
          Returns state of this step for user. You can override it in subclass,
@@ -172,6 +196,9 @@ class AbstractEntranceStep(polymorphic_models.PolymorphicModel):
           `get_state`, override `is_passed` instead of it.
          :returns EntranceStepState
         """
+        return self._memoize('get_state', user, lambda: self._get_state(user))
+
+    def _get_state(self, user):
         if not self.is_opened(user):
             return EntranceStepState.NOT_OPENED
 
@@ -179,7 +206,7 @@ class AbstractEntranceStep(polymorphic_models.PolymorphicModel):
             self.available_after_step.get_state(user) != EntranceStepState.PASSED):
             return EntranceStepState.WAITING_FOR_OTHER_STEP
 
-        if self.is_passed(user):
+        if self.is_passed_memoized(user):
             return EntranceStepState.PASSED
 
         if self.is_closed(user):
@@ -192,10 +219,26 @@ class AbstractEntranceStep(polymorphic_models.PolymorphicModel):
         You can override it in your subclass
         :returns EntranceStepBlock or None
         """
-        if not self.is_visible(user):
+        if not self.is_visible_memoized(user):
             return None
         return EntranceStepBlock(self, user, self.get_state(user))
 
+    def get_block_cache_key(self, block, request):
+        """
+        Rendered blocks are cached until the step's data or the user's
+        entrance data change (see cache_tags.school_steps() and
+        cache_tags.user_steps()). Returns the list of the block's values
+        which can change without it, i.e. with time. You should override it
+        in your subclass if the block has additional values of such kind
+        """
+        return [
+            block.state.name,
+            block.step_available_from_time,
+            block.step_available_to_time,
+            block.step_is_closed,
+            block.step_is_last_passed_step,
+        ]
+
     @property
     def template_file(self):
         """
@@ -232,16 +275,73 @@ class AbstractEntranceStep(polymorphic_models.PolymorphicModel):
             return False
         return self._available_to_time.passed_for_user(user)
 
-    @property
+    # EntranceStepsStates sets it to the loaded instance of the next step
+    @cached_property
     def next(self) -> Optional["AbstractEntranceStep"]:
         return self.school.entrance_steps.filter(order__gt=self.order).order_by("order").first()
 
     def get_next_visible_step(self, user) -> Optional["AbstractEntranceStep"]:
         next_step = self.next
-        while next_step is not None and not next_step.is_visible(user):
+        while next_step is not None and not next_step.is_visible_memoized(user):
             next_step = next_step.next
         return next_step
 
+    @classmethod
+    def prefetch_for_user(cls, steps, user):
+        """
+        Loads data needed for the steps of this class for the user at once.
+        Called by EntranceStepsStates, override it in your subclass
+        """
+        pass
+
+
+class EntranceStepsStates:
+    """
+    Entrance steps of the school with states computed for the user once per
+    request. All steps are loaded at once, links to the previous and the next
+    steps point to the loaded instances, and is_passed(), is_visible() and
+    get_state() are memoized for each step. States of the step's
+    predecessors are resolved from the first one, so number of queries
+    doesn't depend on the length of steps chain.
+    """
+    def __init__(self, school, user):
+        self.user = user
+        self.steps = list(
+            school.entrance_steps
+            .select_related('available_from_time', 'available_to_time', 'school')
+            .order_by('order')
+        )
+        self._steps_by_id = {step.id: step for step in self.steps}
+
+        for step, next_step in zip(self.steps, self.steps[1:] + [None]):
+            step._memo = {}
+            step.next = next_step
+            if step.available_after_step_id in self._steps_by_id:
+                step.available_after_step = self._steps_by_id[step.available_after_step_id]
+
+        steps_by_class = {}
+        for step in self.steps:
+            steps_by_class.setdefault(type(step), []).append(step)
+        for step_class, class_steps in steps_by_class.items():
+            step_class.prefetch_for_user(class_steps, user)
+
+    def get_step(self, step_id):
+        return self._steps_by_id[step_id]
+
+    def get_state(self, step):
+        # Resolve states of the predecessors from the first one to avoid
+        # deep recursion. Visited steps protect from the cycles
+        chain = []
+        visited = set()
+        current = step
+        while current is not None and current.id not in visited:
+            chain.append(current)
+            visited.add(current.id)
+            current = self._steps_by_id.get(current.available_after_step_id)
+        for predecessor in reversed(chain):
+            predecessor.get_state(self.user)
+        return step.get_state(self.user)
+
 
 class EntranceStepTextsMixIn(models.Model):
     """
@@ -347,6 +447,25 @@ class FillQuestionnaireEntranceStep(AbstractEntranceStep,
     def is_passed(self, user):
         return super().is_passed(user) and self.questionnaire.is_filled_by(user)
 
+    @classmethod
+    def prefetch_for_user(cls, steps, user):
+        questionnaire_ids = [step.questionnaire_id for step in steps]
+        questionnaires = (
+            questionnaire.models.Questionnaire.objects
+            .select_related('school', 'close_time')
+            .in_bulk(questionnaire_ids)
+        )
+        filled_questionnaire_ids = set(
+            questionnaire.models.UserQuestionnaireStatus.objects.filter(
+                user_id=user.id,
+                questionnaire_id__in=questionnaire_ids,
+                status=questionnaire.models.UserQuestionnaireStatus.Status.FILLED,
+            ).values_list('questionnaire_id', flat=True)
+        )
+        for step in steps:
+            step.questionnaire = questionnaires[step.questionnaire_id]
+            step._set_memoized('is_passed', user, step.questionnaire_id in filled_questionnaire_ids)
+
     def __str__(self):
         return 'Шаг заполнения анкеты «{}» для {}'.format(
             self.questionnaire,
@@ -384,13 +503,12 @@ class SolveExamEntranceStep(AbstractEntranceStep, EntranceStepTextsMixIn):
         # It's here to avoid cyclic imports
         import modules.entrance.views as entrance_views
         import modules.entrance.upgrades as entrance_upgrades
+        import modules.entrance.models.main as entrance_models
 
         block = super().build(user, request)
         level, tasks = entrance_views.get_entrance_level_and_tasks(self.school, user)
 
-        for task in tasks:
-            task.is_accepted = task.is_accepted_for_user(user)
-            task.is_solved = task.is_solved_by_user(user)
+        entrance_models.EntranceExamTask.load_user_solutions(tasks, user)
 
         categories = list(sorted(
             {task.category for task in tasks},
@@ -453,6 +571,22 @@ class SolveExamEntranceStep(AbstractEntranceStep, EntranceStepTextsMixIn):
 
         return block
 
+    def get_block_cache_key(self, block, request):
+        key = super().get_block_cache_key(block, request) + [
+            bool(request.GET.get('change_selected_entrance_level')),
+            getattr(block.level, 'id', None),
+            block.is_at_maximum_level,
+            [(stats['category'].id, stats['is_started'], stats['total_count'], stats['solved_count'])
+             for stats in block.task_category_stats],
+            block.can_select_entrance_level,
+        ]
+        if block.can_select_entrance_level:
+            key += [
+                getattr(block.selected_entrance_level, 'id', None),
+                getattr(block.recommended_entrance_level, 'id', None),
+            ]
+        return key
+
     def __str__(self):
         return 'Шаг вступительной работы {} для {}'.format(
             self.exam,
@@ -647,6 +781,10 @@ class UserParticipatedInSchoolEntranceStep(AbstractEntranceStep,
                 self.school_to_check_participation)
         return block
 
+    def get_block_cache_key(self, block, request):
+        # Name of another school doesn't invalidate steps of this one
+        return super().get_block_cache_key(block, request) + [self.school_to_check_participation.name]
+
 
 class UserParticipatedInSchoolEntranceStepException(models.Model):
     """
@@ -713,6 +851,9 @@ class UserIsMemberOfGroupEntranceStep(AbstractEntranceStep,
             block.group = self.group
         return block
 
+    def get_block_cache_key(self, block, request):
+        return super().get_block_cache_key(block, request) + [self.group.name]
+
 
 class MarkdownEntranceStep(AbstractEntranceStep, EntranceStepTextsMixIn):
     """
@@ -972,18 +1113,26 @@ class SelectedEnrollmentType(models.Model):
             not self.allow_pass_entrance_exam
         )
 
-    def get_entrance_level(self):
+    def get_entrance_level(self, school_levels=None):
         """
         Returns entrance level for participant.
+        :param school_levels: list of all entrance levels of the school ordered
+        by `order`. If passed, levels are not queried from the database.
         """
         if not self.allow_pass_entrance_exam:
             return levels_models.EntranceLevel.get_max_entrance_level(self.step.school)
 
         if self.accepted_entrance_level is not None:
-            entrance_level = levels_models.EntranceLevel.objects.filter(
-                school=self.step.school,
-                order__gt=self.accepted_entrance_level.order,
-            ).order_by('order').first()
+            if school_levels is not None:
+                entrance_level = next((
+                    level for level in school_levels
+                    if level.order > self.accepted_entrance_level.order
+                ), None)
+            else:
+                entrance_level = levels_models.EntranceLevel.objects.filter(
+                    school=self.step.school,
+                    order__gt=self.accepted_entrance_level.order,
+                ).order_by('order').first()
             if entrance_level is not None:
                 return entrance_level
             return levels_models.EntranceLevel.get_max_entrance_level(self.step.school)
@@ -15,12 +15,14 @@ class EntranceStaffInterface(sistema.staff.StaffInterface):
         self.is_entrance_admin = groups.is_user_in_group(
             request.user,
             entrance_groups.ADMINS,
-            request.school
+            request.school,
+            request=request,
         )
         self.can_check = groups.is_user_in_group(
             request.user,
             entrance_groups.CAN_CHECK,
-            request.school
+            request.school,
+            request=request,
         )
 
     def get_sidebar_menu(self):
@@ -60,12 +62,20 @@ class EntranceStaffInterface(sistema.staff.StaffInterface):
             frontend.icons.GlyphIcon('equalizer')
         )
 
+        submitter_metrics = sistema.staff.MenuItem(
+            self.request,
+            'Сабмиттер',
+            'school:ejudge:show_submitter_metrics',
+            frontend.icons.FaIcon('tachometer')
+        )
+
         exam = sistema.staff.MenuItem(
             self.request,
             'Вступительная',
             '',
             frontend.icons.FaIcon('columns'),
-            children=[exam_tasks, exam_checking, ejudge_stats, exam_results]
+            children=[exam_tasks, exam_checking, ejudge_stats, submitter_metrics,
+                      exam_results]
         )
 
         items = []
@@ -1,48 +1,289 @@
 import collections
 import datetime
-import itertools
+import hashlib
+import urllib.parse
 from typing import Union
 
 import django.views
 import xlsxwriter
-from django.db.models import Count, Q
-from django.http.response import HttpResponse
+from django.db.models import Count, Max, Prefetch, Q
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 
+import groups.models
 import modules.ejudge.models as ejudge_models
+import modules.poldnev.models as poldnev_models
 import modules.study_results.models as study_results_models
+import modules.topics.models as topics_models
 import questionnaire.models
 import schools.models
 import sistema.staff
 import users.models
 from modules.entrance import models
 from modules.entrance import upgrades
-from modules.entrance import views as entrance_views
-from sistema.export import ExcelMultiColumn, LinkExcelColumn, PlainExcelColumn
+from questionnaire.answers_matrix import QuestionnaireAnswersMatrix
+from sistema.export import ExcelMultiColumn, LinkExcelColumn, PlainExcelColumn, write_columns
+from sistema.helpers import respond_as_attachment
+
+
+def get_enrollees(school):
+    return (
+        users.models.User.objects
+        .filter(entrance_statuses__school=school)
+        .exclude(entrance_statuses__status=
+                 models.EntranceStatus.Status.NOT_PARTICIPATED)
+        .select_related('profile__poldnev_person')
+        .order_by('id')
+    )
+
+
+def _get_rows_stamp(queryset, field):
+    """
+    Number of rows and the latest value of `field`. Catches all changes only
+    if the rows are never edited or `field` is updated on each edit
+    """
+    return queryset.aggregate(count=Count('id'), last=Max(field))
+
+
+def _get_rows_hash(queryset, fields):
+    """ Hash of `fields` of all rows, for models edited in place without modification time """
+    rows_hash = hashlib.sha256()
+    for row in queryset.order_by('id').values_list('id', *fields).iterator():
+        rows_hash.update(repr(row).encode())
+    return rows_hash.hexdigest()
+
+
+def get_enrolling_data_fingerprint(school):
+    """
+    Returns a hash of the data shown in the enrolling table. If the
+    fingerprint is the same, the table built earlier can be reused.
+    """
+    enrollees_filter = Q(user__entrance_statuses__school=school)
+    exam_solutions = models.EntranceExamTaskSolution.objects.filter(task__exam__school=school)
+    checking_group_ids = models.CheckingGroup.objects.filter(school=school).values('group_id')
+    study_results = study_results_models.StudyResult.objects.filter(
+        school_participant__user__entrance_statuses__school=school
+    )
+
+    # (queryset, field which is changed on each edit or id for append-only rows)
+    stamped_sources = [
+        (models.EntranceStatus.objects.filter(school=school), 'updated_at'),
+        (users.models.UserProfile.objects.filter(enrollees_filter), 'updated_at'),
+        (exam_solutions, 'id'),
+        (ejudge_models.QueueElement.objects.filter(
+            Q(programentranceexamtasksolution__task__exam__school=school) |
+            Q(outputonlyentranceexamtasksolution__task__exam__school=school)
+        ), 'updated_at'),
+        (models.CheckingComment.objects.filter(school=school), 'id'),
+        (questionnaire.models.QuestionnaireAnswer.objects.filter(questionnaire__school=school), 'id'),
+        (models.SelectedEnrollmentType.objects.filter(step__school=school), 'reviewed_at'),
+        (models.SelectedEntranceLevel.objects.filter(school=school), 'id'),
+        (models.EntranceLevelUpgrade.objects.filter(upgraded_to__school=school), 'id'),
+    ]
+    # (queryset, fields) for rows which are edited in place
+    hashed_sources = [
+        (schools.models.SchoolParticipant.objects.filter(enrollees_filter),
+         ['school_id', 'user_id', 'parallel_id']),
+        (models.CheckedSolution.objects.filter(solution__task__exam__school=school),
+         ['solution_id', 'score', 'comment', 'checked_by_id']),
+        (models.EntranceLevelOverride.objects.filter(school=school),
+         ['user_id', 'entrance_level_id']),
+        (models.EnrolledToSessionAndParallel.objects.filter(entrance_status__school=school),
+         ['entrance_status_id', 'session_id', 'parallel_id', 'selected_by_user']),
+        (models.CheckingGroup.objects.filter(school=school), ['group_id']),
+        (groups.models.UserInGroupMembership.objects.filter(group_id__in=checking_group_ids),
+         ['group_id', 'member_id']),
+        (study_results, ['school_participant_id', 'theory', 'practice']),
+        (study_results_models.AbstractComment.objects.filter(study_result__in=study_results),
+         ['study_result_id', 'polymorphic_ctype_id', 'comment']),
+        (topics_models.UserMark.objects.filter(scale_in_topic__topic__questionnaire__school=school),
+         ['user_id', 'scale_in_topic_id', 'mark']),
+        (topics_models.TopicsEntranceLevelLimit.objects.filter(questionnaire__school=school),
+         ['user_id', 'level_id']),
+        (models.EntranceExamTask.objects.filter(exam__school=school),
+         ['title', 'order', 'max_score', 'category_id']),
+        # Stored values of the metrics are written by the build itself, so
+        # the metrics' settings are hashed instead of them
+        (models.EntranceUserMetric.objects.filter(exam__school=school),
+         ['name']),
+        (models.ParallelScoreEntranceUserMetric.objects.filter(exam__school=school),
+         ['max_possible_theory_score', 'max_possible_practice_score']),
+        (models.ParallelScoreEntranceUserMetricFileTaskEntry.objects.filter(
+            parallel_score_metric__exam__school=school
+        ), ['parallel_score_metric_id', 'task_id', 'max_score']),
+        (models.ParallelScoreEntranceUserMetricProgramTaskEntry.objects.filter(
+            parallel_score_metric__exam__school=school
+        ), ['parallel_score_metric_id', 'task_id', 'score']),
+        (models.ParallelScoreEntranceUserMetric.replacing_program_tasks.through.objects.filter(
+            parallelscoreentranceusermetric__exam__school=school
+        ), ['parallelscoreentranceusermetric_id', 'programentranceexamtask_id']),
+    ]
+    fingerprint = (
+        [_get_rows_stamp(queryset, field) for queryset, field in stamped_sources] +
+        [_get_rows_hash(queryset, fields) for queryset, fields in hashed_sources]
+    )
+    return hashlib.sha256(repr(fingerprint).encode()).hexdigest()
+
+
+class EnrollingTableData:
+    """
+    Data about enrollees needed by the columns of the enrolling table. Each
+    property is loaded for all enrollees at once, with the constant number
+    of queries, on the first access by a column. So the data is loaded only
+    if some column needs it. Per-user data is a dict keyed by user_id.
+    """
+    def __init__(self, school, enrollees):
+        self.school = school
+        self.enrollees = enrollees
+
+    @cached_property
+    def enrollment_type_step(self):
+        return (models.SelectEnrollmentTypeEntranceStep.objects
+                .filter(school=self.school)
+                .first())
+
+    @cached_property
+    def selected_enrollment_types(self):
+        """
+        Enrollment types selected in any step of the school:
+        {user_id: SelectedEnrollmentType}
+        """
+        selected_enrollment_types = {}
+        for enrollment in (
+            models.SelectedEnrollmentType.objects
+            .filter(step__school_id=self.school.id, user__in=self.enrollees)
+            .select_related('parallel', 'entrance_level')
+            .order_by('id')
+        ):
+            # The first one is used if the school has several steps
+            selected_enrollment_types.setdefault(enrollment.user_id, enrollment)
+        return selected_enrollment_types
+
+    @cached_property
+    def approved_enrollment_types(self):
+        """
+        Approved enrollment types selected in `enrollment_type_step`:
+        {user_id: SelectedEnrollmentType}
+        """
+        approved_enrollment_types = {}
+        for enrollment in (
+            models.SelectedEnrollmentType.objects
+            .filter(step_id=self.enrollment_type_step.id,
+                    user__in=self.enrollees,
+                    is_moderated=True, is_approved=True)
+            .select_related('enrollment_type', 'accepted_entrance_level')
+            .order_by('id')
+        ):
+            approved_enrollment_types.setdefault(enrollment.user_id, enrollment)
+        return approved_enrollment_types
+
+    @cached_property
+    def previous_schools(self):
+        return list(schools.models.School.objects.filter(
+            (Q(year=self.school.year) | Q(year=str(int(self.school.year) - 1))) & ~Q(id=self.school.id)
+        ).order_by('year', 'name'))
+
+    @cached_property
+    def parallels_in_previous_schools(self):
+        """ {(school_id, user_id): Parallel} """
+        parallels = {}
+        for participant in (
+            schools.models.SchoolParticipant.objects
+            .filter(school__in=self.previous_schools, user__in=self.enrollees)
+            .select_related('parallel')
+            .order_by('id')
+        ):
+            parallels.setdefault((participant.school_id, participant.user_id), participant.parallel)
+        return parallels
+
+    @cached_property
+    def topics_entrance_levels(self):
+        """ {user_id: EntranceLevel} """
+        return upgrades.get_topics_entrance_levels_for_users(self.school, self.enrollees)
+
+    @cached_property
+    def entrance_levels(self):
+        """ {user_id: upgrades.UserEntranceLevels} """
+        return upgrades.get_entrance_levels_for_users(self.school, self.enrollees)
+
+    @cached_property
+    def questionnaire_answers(self):
+        """ Answers to all questionnaires of the school, by one scan """
+        return QuestionnaireAnswersMatrix.for_school(self.school, self.enrollees)
+
+
+class _ExportRequest:
+    """
+    Replacement for the request object when the table is built outside of
+    the request (see run_export_worker). Provides only attributes used by
+    get_enrolling_columns().
+    """
+    def __init__(self, school, base_url):
+        self.school = school
+        self.base_url = base_url
+
+    def build_absolute_uri(self, location):
+        return urllib.parse.urljoin(self.base_url, location)
 
 
 class ExportCompleteEnrollingTable(django.views.View):
+    """
+    The table is built in background by `run_export_worker` management
+    command, this view only shows export jobs and creates new ones.
+    """
+    # Progress of the job is saved every PROGRESS_INTERVAL rows
+    PROGRESS_INTERVAL = 100
+
     @method_decorator(sistema.staff.only_staff)
     def dispatch(self, *args, **kwargs):
         return super().dispatch(*args, **kwargs)
 
     def get(self, request):
-        enrollees = (
-            users.models.User.objects
-            .filter(entrance_statuses__school=request.school)
-            .exclude(entrance_statuses__status=
-                     models.EntranceStatus.Status.NOT_PARTICIPATED)
-            .order_by('id')
-        )
+        jobs = models.EnrollingTableExportJob.objects.filter(
+            school=request.school
+        ).select_related('requested_by')[:10]
+        return render(request, 'entrance/staff/export_jobs.html', {
+            'jobs': jobs,
+            'has_unfinished_jobs': any(not job.is_finished for job in jobs),
+        })
 
+    def post(self, request):
+        plain_header = request.POST.get('plain_header') != 'false'
+        # Fingerprint can miss changes made bypassing the models (i.e. in the
+        # database console), so staff can ask to build the table anyway
+        force_rebuild = request.POST.get('force_rebuild') == 'true'
+        job = None
+        if not force_rebuild:
+            data_fingerprint = get_enrolling_data_fingerprint(request.school)
+            job = models.EnrollingTableExportJob.find_reusable(
+                request.school, plain_header, data_fingerprint
+            )
+        if job is None:
+            models.EnrollingTableExportJob.objects.create(
+                school=request.school,
+                requested_by=request.user,
+                plain_header=plain_header,
+                base_url=request.build_absolute_uri('/'),
+            )
+        return redirect('school:entrance:export_complete_enrolling_table',
+                        request.school.short_name)
+
+    def build(self, job, output_file_name, on_progress):
+        """
+        Builds the table for the job and writes it to `output_file_name`.
+        :param on_progress: function(message, progress, progress_total)
+        """
+        request = _ExportRequest(job.school, job.base_url)
+        enrollees = get_enrollees(job.school)
+
+        on_progress('Собираем данные', 0, None)
         columns = self.get_enrolling_columns(request, enrollees)
+        rows_count = len(enrollees)
 
-        ct = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        response = HttpResponse(content_type=ct)
-        response['Content-Disposition'] = "attachment; filename=enrolling.xlsx"
-
-        book = xlsxwriter.Workbook(response, {'in_memory': True})
+        # Rows are flushed to the disk as soon as they are written
+        book = xlsxwriter.Workbook(output_file_name, {'constant_memory': True})
         sheet = book.add_worksheet('Поступление в ЛКШ')
 
         header_fmt = book.add_format({
@@ -53,115 +294,101 @@ class ExportCompleteEnrollingTable(django.views.View):
         cell_fmt = book.add_format({
             'text_wrap': True,
         })
-        plain_header = (request.GET.get('plain_header') != 'false')
-        for column in columns:
-            column.header_format = header_fmt
-            column.cell_format = cell_fmt
-            column.plain_header = plain_header
-
-        # Write header
-        header_height = max(column.header_height for column in columns)
-        irow, icol = 0, 0
-        for column in columns:
-            column.write(sheet, irow, icol, header_height=header_height)
-            icol += column.width
-
-        sheet.freeze_panes(1 if plain_header else header_height, 3)
+        write_columns(
+            sheet,
+            columns,
+            plain_header=job.plain_header,
+            header_format=header_fmt,
+            cell_format=cell_fmt,
+            frozen_columns=3,
+            on_progress=lambda rows: on_progress('Записываем строки', rows, rows_count),
+            progress_interval=self.PROGRESS_INTERVAL,
+        )
         book.close()
-
-        return response
+        on_progress('Готово', rows_count, rows_count)
 
     def get_enrolling_columns(self, request, enrollees):
+        data = EnrollingTableData(request.school, enrollees)
         columns = []
 
         columns.append(LinkExcelColumn(
             name='id',
             cell_width=5,
-            data=[user.id for user in enrollees],
-            data_urls=[
+            data=(user.id for user in enrollees),
+            data_urls=(
                 request.build_absolute_uri(django.urls.reverse(
                     'school:entrance:enrolling_user',
                     args=(request.school.short_name, user.id)))
                 for user in enrollees
-            ],
+            ),
         ))
 
         columns.append(LinkExcelColumn(
             name='Фамилия',
-            data=[user.profile.last_name for user in enrollees],
-            data_urls=[getattr(user.profile.poldnev_person, 'url', '')
-                       for user in enrollees],
+            data=(user.profile.last_name for user in enrollees),
+            data_urls=(getattr(user.profile.poldnev_person, 'url', '')
+                       for user in enrollees),
         ))
 
         columns.append(PlainExcelColumn(
             name='Имя',
-            data=[user.profile.first_name for user in enrollees],
+            data=(user.profile.first_name for user in enrollees),
         ))
 
         columns.append(PlainExcelColumn(
             name='Отчество',
-            data=[user.profile.middle_name for user in enrollees],
+            data=(user.profile.middle_name for user in enrollees),
         ))
 
         columns.append(PlainExcelColumn(
             name='Пол',
-            data=['жм'[user.profile.sex == users.models.UserProfile.Sex.MALE]
-                  for user in enrollees],
+            data=('жм'[user.profile.sex == users.models.UserProfile.Sex.MALE]
+                  for user in enrollees),
         ))
 
         columns.append(PlainExcelColumn(
             name='Город',
-            data=[user.profile.city for user in enrollees],
+            data=(user.profile.city for user in enrollees),
         ))
 
         columns.append(PlainExcelColumn(
             name='Класс',
             cell_width=7,
-            data=[user.profile.get_class() for user in enrollees],
+            data=(user.profile.get_class() for user in enrollees),
         ))
 
         columns.append(PlainExcelColumn(
             name='Школа',
-            data=[user.profile.school_name for user in enrollees],
+            data=(user.profile.school_name for user in enrollees),
         ))
 
         columns.append(PlainExcelColumn(
             name='Емэйл',
-            data=[user.email for user in enrollees]
+            data=(user.email for user in enrollees),
         ))
 
-        enrollment_type_step = (
-            models.SelectEnrollmentTypeEntranceStep.objects
-            .filter(school=request.school)
-            .first())
-        if enrollment_type_step is not None:
+        if data.enrollment_type_step is not None:
             columns.append(PlainExcelColumn(
                 name='Основание для поступления',
-                data=[
-                    self.get_enrollment_type_for_user(
-                        enrollment_type_step, user)
-                    for user in enrollees]
+                data=self.get_enrollment_type_for_users(data, enrollees),
             ))
             columns.append(PlainExcelColumn(
                 name='Зачтённый уровень',
-                data=[
-                    self.get_accepted_entrance_level_from_approved_enrollment_type_for_user(
-                        enrollment_type_step, user)
-                    for user in enrollees]
+                data=self.get_accepted_entrance_level_from_approved_enrollment_type_for_users(
+                    data, enrollees),
             ))
-        elif self.question_exists(request.school, 'entrance_reason'):
+        elif self.question_exists(data, 'entrance_reason'):
             columns.append(PlainExcelColumn(
                 name='Основание для поступления',
-                data=self.get_choice_question_for_users(
-                    request.school, enrollees, 'entrance_reason'),
+                data=self.get_question_answers_for_users(data, 'entrance_reason'),
             ))
 
         # TODO(artemtab): create SchoolParticipant entries for all the users
         #                 and use them instead
-        if self.question_exists(request.school, 'previous_parallels'):
+        if self.question_exists(data, 'previous_parallels'):
             columns.append(PlainExcelColumn(
                 name='История',
-                data=self.get_history_for_users(request.school, enrollees),
+                data=self.get_history_for_users(data),
             ))
 
         columns.append(PlainExcelColumn(
@@ -169,49 +396,42 @@ class ExportCompleteEnrollingTable(django.views.View):
             data=self.get_poldnev_history_for_users(enrollees),
         ))
 
-        previous_schools = schools.models.School.objects.filter(
-            (Q(year=request.school.year) | Q(year=str(int(request.school.year) - 1))) & ~Q(id=request.school.id)
-        ).order_by('year', 'name')
+        previous_schools = data.previous_schools
 
         for previous_school in previous_schools:
             columns.append(PlainExcelColumn(
                 name=f'Параллель в {previous_school.name}',
-                data=self.get_real_parallel_for_users(enrollees, previous_school),
+                data=self.get_real_parallel_for_users(data, enrollees, previous_school),
             ))
 
-        if self.question_exists(request.school, 'main_language'):
+        if self.question_exists(data, 'main_language'):
             columns.append(PlainExcelColumn(
                 name='Язык (основной)',
-                data=self.get_text_question_for_users(
-                    request.school, enrollees, 'main_language'),
+                data=self.get_question_answers_for_users(data, 'main_language'),
             ))
 
-        if self.question_exists(request.school, 'travel_passport'):
+        if self.question_exists(data, 'travel_passport'):
             columns.append(PlainExcelColumn(
                 name='Загран',
-                data=self.get_choice_question_for_users(
-                    request.school, enrollees, 'travel_passport'),
+                data=self.get_question_answers_for_users(data, 'travel_passport'),
             ))
 
-        if self.question_exists(request.school, 'visa'):
+        if self.question_exists(data, 'visa'):
             columns.append(PlainExcelColumn(
                 name='Виза',
-                data=self.get_choice_question_for_users(
-                    request.school, enrollees, 'visa'),
+                data=self.get_question_answers_for_users(data, 'visa'),
             ))
 
-        if self.question_exists(request.school, 'visa_expiration'):
+        if self.question_exists(data, 'visa_expiration'):
             columns.append(PlainExcelColumn(
                 name='Срок действия визы',
-                data=self.get_text_question_for_users(
-                    request.school, enrollees, 'visa_expiration'),
+                data=self.get_question_answers_for_users(data, 'visa_expiration'),
             ))
 
-        if self.question_exists(request.school, 'fingerprints'):
+        if self.question_exists(data, 'fingerprints'):
             columns.append(PlainExcelColumn(
                 name='Отпечатки',
-                data=self.get_choice_question_for_users(
-                    request.school, enrollees, 'fingerprints'),
+                data=self.get_question_answers_for_users(data, 'fingerprints'),
             ))
 
         if hasattr(request.school, 'entrance_exam'):
@@ -234,11 +454,11 @@ class ExportCompleteEnrollingTable(django.views.View):
 
             columns.append(LinkExcelColumn(
                 name='ТА',
-                data=[
-                    upgrades.get_topics_entrance_level(request.school, user).name
+                data=(
+                    data.topics_entrance_levels[user.id].name
                     for user in enrollees
-                ],
-                data_urls=[
+                ),
+                data_urls=(
                     request.build_absolute_uri(
                         reverse('school:entrance:user_topics', kwargs={
                             'school_name': request.school.short_name,
@@ -246,32 +466,33 @@ class ExportCompleteEnrollingTable(django.views.View):
                         })
                     )
                     for user in enrollees
-                ]
+                )
             ))
 
+            entrance_levels = data.entrance_levels
             if entrance_exam.can_participant_select_entrance_level:
                 columns.append(PlainExcelColumn(
                     name='Минимальный уровень',
                     data=self.get_base_entrance_level_for_users(
-                        request.school, enrollees
+                        entrance_levels, enrollees
                     ),
                 ))
                 columns.append(PlainExcelColumn(
                     name='Рекомендованный уровень',
                     data=self.get_recommended_entrance_level_for_users(
-                        request.school, enrollees
+                        entrance_levels, enrollees
                     ),
                 ))
                 columns.append(PlainExcelColumn(
                     name='Выбранный уровень',
                     data=self.get_entrance_level_selected_by_users(
-                        request.school, enrollees
+                        entrance_levels, enrollees
                     ),
                 ))
             else:
                 columns.append(PlainExcelColumn(
                     name='Уровень',
-                    data=self.get_base_entrance_level_for_users(request.school,
+                    data=self.get_base_entrance_level_for_users(entrance_levels,
                                                                 enrollees),
                 ))
 
@@ -339,36 +560,31 @@ class ExportCompleteEnrollingTable(django.views.View):
                     PlainExcelColumn(
                         name=metric.name,
                         cell_width=5,
-                        data=list(metric.values_for_users(enrollees))
+                        data=metric.values_for_users(enrollees)
                     )
                     for metric in metrics
                 ]
                 columns.append(ExcelMultiColumn(name='Баллы',
                                                 subcolumns=subcolumns))
 
-            auto_parallels = [
-                self.get_auto_parallel_for_user(request.school, user)
-                for user in enrollees]
             columns.append(LinkExcelColumn(
                 name='Авто-зачисление',
                 cell_width=5,
-                data=auto_parallels,
-                data_urls=[
+                data=self.get_auto_parallel_for_users(data, enrollees),
+                data_urls=(
                     request.build_absolute_uri(reverse(
                         'school:entrance:enrollment_type_review_user',
                         kwargs={
                             'school_name': request.school.short_name,
                             'user_id': user.id,
                         }
-                    )) if parallel else ''
-                    for user, parallel in zip(enrollees, auto_parallels)
-                ]
+                    )) if user.id in data.selected_enrollment_types else ''
+                    for user in enrollees
+                )
             ))
 
         # 2018
-        if self.question_exists(request.school, 'want_to_session_2'):
-            answers = self.get_choice_question_for_users(
-                    request.school, enrollees, 'want_to_session_2')
+        if self.question_exists(data, 'want_to_session_2'):
             answer_mapping = {
                 "Хочу в августовскую, но могу и в июльскую": ("Август", "Да"),
                 "Хочу в июльскую, но могу и в августовскую": ("Июль", "Да"),
@@ -378,34 +594,33 @@ class ExportCompleteEnrollingTable(django.views.View):
             }
             columns.append(PlainExcelColumn(
                 name='Смена',
-                data=[answer_mapping[answer][0] for answer in answers],
+                data=(answer_mapping[answer][0]
+                      for answer in self.get_question_answers_for_users(data, 'want_to_session_2')),
             ))
             columns.append(PlainExcelColumn(
                 name='Другая смена',
-                data=[answer_mapping[answer][1] for answer in answers],
+                data=(answer_mapping[answer][1]
+                      for answer in self.get_question_answers_for_users(data, 'want_to_session_2')),
             ))
 
         # 2021
-        if self.question_exists(request.school, 'want_to_school'):
+        if self.question_exists(data, 'want_to_school'):
             columns.append(PlainExcelColumn(
                 name='Школа',
-                data=self.get_choice_question_for_users(
-                    request.school, enrollees, 'want_to_school'),
+                data=self.get_question_answers_for_users(data, 'want_to_school'),
             ))
 
         # 2016 & 2017, and after 2018
-        if self.question_exists(request.school, 'want_to_session'):
+        if self.question_exists(data, 'want_to_session'):
             columns.append(PlainExcelColumn(
                 name='Смена',
-                data=self.get_choice_question_for_users(
-                    request.school, enrollees, 'want_to_session'),
+                data=self.get_question_answers_for_users(data, 'want_to_session'),
             ))
 
-        if self.question_exists(request.school, 'other_session'):
+        if self.question_exists(data, 'other_session'):
             columns.append(PlainExcelColumn(
                 name='Другая смена',
-                data=self.get_other_session_for_users(request.school,
-                                                      enrollees),
+                data=self.get_other_session_for_users(data),
             ))
 
         entrance_status_by_user_id = self.get_entrance_status_by_user_id(
@@ -430,57 +645,59 @@ class ExportCompleteEnrollingTable(django.views.View):
                 PlainExcelColumn(
                     name='Параллель',
                     cell_width=8,
-                    data=[_get_parallels_list(entrance_status_by_user_id[user.id])
+                    data=(_get_parallels_list(entrance_status_by_user_id[user.id])
                           if user.id in entrance_status_by_user_id
                           else ""
-                          for user in enrollees],
+                          for user in enrollees),
                 ),
                 PlainExcelColumn(
                     name='Смена',
                     cell_width=7,
-                    data=[_get_sessions_list(entrance_status_by_user_id[user.id])
+                    data=(_get_sessions_list(entrance_status_by_user_id[user.id])
                           if user.id in entrance_status_by_user_id
                           else ""
-                          for user in enrollees],
+                          for user in enrollees),
                 ),
                 PlainExcelColumn(
                     name='Статус',
                     cell_width=5,
-                    data=[
+                    data=(
                         status_repr.get(entrance_status_by_user_id[user.id].status)
                         if user.id in entrance_status_by_user_id
                         else ""
                         for user in enrollees
-                    ],
+                    ),
                 ),
                 PlainExcelColumn(
                     name='Комментарий',
-                    data=[entrance_status_by_user_id[user.id].public_comment
+                    data=(entrance_status_by_user_id[user.id].public_comment
                           if user.id in entrance_status_by_user_id
                           else ""
-                          for user in enrollees],
+                          for user in enrollees),
                 ),
                 PlainExcelColumn(
                     name='Приватный комментарий',
-                    data=[entrance_status_by_user_id[user.id].private_comment
+                    data=(entrance_status_by_user_id[user.id].private_comment
                           if user.id in entrance_status_by_user_id
                           else ""
-                          for user in enrollees],
+                          for user in enrollees),
                 ),
             ],
         ))
 
-        columns.append(ExcelMultiColumn(
-            name='',
-            subcolumns=[
-                PlainExcelColumn(
-                    name=f'Оценки {previous_school.name}',
-                    cell_width=7,
-                    data=self.get_marks_for_users(previous_school.short_name, enrollees)
-                )
-                for previous_school in previous_schools
-            ],
-        ))
+        # The first school in the system has no previous schools
+        if previous_schools:
+            columns.append(ExcelMultiColumn(
+                name='',
+                subcolumns=[
+                    PlainExcelColumn(
+                        name=f'Оценки {previous_school.name}',
+                        cell_width=7,
+                        data=self.get_marks_for_users(previous_school.short_name, enrollees)
+                    )
+                    for previous_school in previous_schools
+                ],
+            ))
 
         columns.append(PlainExcelColumn(
             name='Комментарии из системы',
@@ -494,143 +711,112 @@ class ExportCompleteEnrollingTable(django.views.View):
                 data=self.get_study_comments_for_users(previous_school.short_name, enrollees),
             ))
 
-        if (self.question_exists(request.school, 'informatics_olympiads') and
-                self.question_exists(request.school, 'math_olympiads') and
-                self.question_exists(request.school, 'informatics_olympiads_select')):
+        if (self.question_exists(data, 'informatics_olympiads') and
+                self.question_exists(data, 'math_olympiads') and
+                self.question_exists(data, 'informatics_olympiads_select')):
             columns.append(ExcelMultiColumn(
                 name='Олимпиады',
                 subcolumns=[
                     PlainExcelColumn(
                         name='Информатика',
                         cell_width=30,
-                        data=self.get_text_question_for_users(
-                            request.school, enrollees, 'informatics_olympiads'
-                        ),
+                        data=self.get_question_answers_for_users(data, 'informatics_olympiads'),
                     ),
                     PlainExcelColumn(
                         name='Олимпиады по информатике',
                         cell_width=50,
-                        data=self.get_choice_question_for_users(
-                            request.school, enrollees, 'informatics_olympiads_select',
-                        )
+                        data=self.get_question_answers_for_users(data, 'informatics_olympiads_select')
                     ),
                     PlainExcelColumn(
                         name='Математика',
                         cell_width=30,
-                        data=self.get_text_question_for_users(
-                            request.school, enrollees, 'math_olympiads'
-                        ),
+                        data=self.get_question_answers_for_users(data, 'math_olympiads'),
                     ),
                 ],
             ))
 
         # 2021
-        if self.question_exists(request.school, 'innopolis_open_winner'):
+        if self.question_exists(data, 'innopolis_open_winner'):
             columns.append(PlainExcelColumn(
                 name='Innopolis Open 2021',
                 cell_width=50,
-                data=self.get_choice_question_for_users(
-                    request.school, enrollees, 'innopolis_open_winner'),
+                data=self.get_question_answers_for_users(data, 'innopolis_open_winner'),
             ))
 
         return columns
 
-    def get_auto_parallel_for_user(self, school, user):
-        enrollment = (
-            models.SelectedEnrollmentType.objects
-            .filter(step__school_id=school.id, user_id=user.id)
-            .select_related('parallel')
-            .first())
-        if enrollment is None:
-            return ''
-        if enrollment.parallel is not None:
-            return enrollment.parallel.name
-        if enrollment.entrance_level is not None:
-            return enrollment.entrance_level.name
-        return '✓'
-
-    def get_enrollment_type_for_user(self, step, user):
-        enrollment = (
-            models.SelectedEnrollmentType.objects
-            .filter(
-                step_id=step.id, user_id=user.id,
-                is_moderated=True, is_approved=True
-            )
-            .select_related('enrollment_type')
-            .first()
+    def get_auto_parallel_for_users(self, data, enrollees):
+        def get_auto_parallel(enrollment):
+            if enrollment is None:
+                return ''
+            if enrollment.parallel is not None:
+                return enrollment.parallel.name
+            if enrollment.entrance_level is not None:
+                return enrollment.entrance_level.name
+            return '✓'
+
+        return (get_auto_parallel(data.selected_enrollment_types.get(user.id))
+                for user in enrollees)
+
+    def get_enrollment_type_for_users(self, data, enrollees):
+        return (
+            enrollment.enrollment_type.text if enrollment is not None else ''
+            for enrollment in (data.approved_enrollment_types.get(user.id)
+                               for user in enrollees)
         )
-        if enrollment is None:
-            return ''
-        return enrollment.enrollment_type.text
 
-    def get_accepted_entrance_level_from_approved_enrollment_type_for_user(
-        self, step, user
+    def get_accepted_entrance_level_from_approved_enrollment_type_for_users(
+        self, data, enrollees
     ):
-        enrollment = (
-            models.SelectedEnrollmentType.objects
-            .filter(
-                step_id=step.id, user_id=user.id,
-                is_moderated=True, is_approved=True
-            )
-            .select_related('accepted_entrance_level')
-            .first()
+        return (
+            '' if enrollment is None or enrollment.accepted_entrance_level is None
+            else enrollment.accepted_entrance_level.name
+            for enrollment in (data.approved_enrollment_types.get(user.id)
+                               for user in enrollees)
         )
-        if enrollment is None or enrollment.accepted_entrance_level is None:
-            return ''
-        return enrollment.accepted_entrance_level.name
 
-    def get_history_for_users(self, school, enrollees):
-        previous_parallel_answers = (
-            questionnaire.models.QuestionnaireAnswer.objects
-            .filter(user__in=enrollees,
-                    questionnaire__school=school,
-                    question_short_name='previous_parallels')
-            .order_by('user__id', 'answer')
-        )
-        answer_variant_by_id = self.get_answer_variant_by_id(school)
-        history_by_user = {
-            user: ', '.join(answer_variant_by_id[ans.answer].text
-                            for ans in answers)
-            for user, answers in itertools.groupby(previous_parallel_answers,
-                                                   lambda ans: ans.user)
-        }
-        return [history_by_user.get(user, '') for user in enrollees]
+    def get_history_for_users(self, data):
+        return data.questionnaire_answers.iter_column('previous_parallels')
 
     def get_poldnev_history_for_users(self, enrollees):
-        enrollees_with_history = enrollees.prefetch_related(
-            'profile__poldnev_person__history_entries__study_group__parallel')
+        # Ordering of the prefetched entries is set here, because .order_by()
+        # on the related manager would make a query for each user
+        enrollees_with_history = enrollees.prefetch_related(Prefetch(
+            'profile__poldnev_person__history_entries',
+            queryset=(
+                poldnev_models.HistoryEntry.objects
+                .filter(study_group__isnull=False, role='')  # Students
+                .select_related('study_group__parallel')
+                .order_by('session__name')
+            ),
+        ))
         history_by_user = {}
         for user in enrollees_with_history:
             if not user.profile or not user.profile.poldnev_person:
                 continue
             history_by_user[user] = ', '.join(
                 entry.study_group.parallel.name
-                for entry in user.profile.poldnev_person.history_entries.all().order_by('session__name')
-                if entry.study_group
-                if not entry.role  # Student
+                for entry in user.profile.poldnev_person.history_entries.all()
             )
-        return [history_by_user.get(user, '') for user in enrollees]
+        return (history_by_user.get(user, '') for user in enrollees)
 
-    def get_real_parallel_for_users(self, enrollees, school):
-        real_parallels = []
-        for user in enrollees:
-            participation = (user.school_participations
-                             .filter(school=school)
-                             .first())
-            real_parallels.append('' if participation is None
-                                  else participation.parallel.name)
-        return real_parallels
+    def get_real_parallel_for_users(self, data, enrollees, school):
+        parallels = data.parallels_in_previous_schools
+        return (
+            parallels[(school.id, user.id)].name
+            if (school.id, user.id) in parallels else ''
+            for user in enrollees
+        )
 
-    def get_base_entrance_level_for_users(self, school, enrollees):
-        return [upgrades.get_base_entrance_level(school, user).name for user in enrollees]
+    def get_base_entrance_level_for_users(self, entrance_levels, enrollees):
+        return (entrance_levels[user.id].base.name for user in enrollees)
 
-    def get_recommended_entrance_level_for_users(self, school, enrollees):
-        return [upgrades.get_recommended_entrance_level(school, user).name for user in enrollees]
+    def get_recommended_entrance_level_for_users(self, entrance_levels, enrollees):
+        return (entrance_levels[user.id].recommended.name for user in enrollees)
 
-    def get_entrance_level_selected_by_users(self, school, enrollees):
+    def get_entrance_level_selected_by_users(self, entrance_levels, enrollees):
         for user in enrollees:
-            base_level = upgrades.get_base_entrance_level(school, user)
-            level = entrance_views.get_entrance_level_selected_by_user(school, user.id, base_level)
+            level = entrance_levels[user.id].selected
             if level is None:
                 yield "не выбран"
             else:
@@ -642,35 +828,30 @@ class ExportCompleteEnrollingTable(django.views.View):
             .filter(user__in=enrollees,
                     upgraded_to__school=school)
             .order_by('upgraded_to__order')
+            .select_related('upgraded_to')
         )
-        max_level_by_user = {upgrade.user: upgrade.upgraded_to.name
-                             for upgrade in issued_upgrades}
-        return [max_level_by_user.get(user, '') for user in enrollees]
-
-    def get_other_session_for_users(self, school, enrollees):
-        other_session_answers = (
-            questionnaire.models.QuestionnaireAnswer.objects
-            .filter(user__in=enrollees,
-                    questionnaire__school=school,
-                    question_short_name='other_session')
+        max_level_by_user_id = {upgrade.user_id: upgrade.upgraded_to.name
+                                for upgrade in issued_upgrades}
+        return (max_level_by_user_id.get(user.id, '') for user in enrollees)
+
+    def get_other_session_for_users(self, data):
+        return (
+            ('Да' if answers[-1] == 'True' else 'Нет') if answers else ''
+            for answers in data.questionnaire_answers.iter_answers('other_session')
         )
-        other_session_by_user = {
-            answer.user: 'Да' if answer.answer == 'True' else 'Нет'
-            for answer in other_session_answers
-        }
-        return [other_session_by_user.get(user, '') for user in enrollees]
 
     def get_marks_for_users(self, school_short_name, enrollees):
         results = (
             study_results_models.StudyResult.objects
             .filter(school_participant__user__in=enrollees,
                     school_participant__school__short_name=school_short_name)
+            .select_related('school_participant')
         )
         marks_by_user_id = {
             result.school_participant.user_id: '{} / {}'.format(
                 result.theory, result.practice)
             for result in results}
-        return [marks_by_user_id.get(user.id, '') for user in enrollees]
+        return (marks_by_user_id.get(user.id, '') for user in enrollees)
 
     def get_study_comments_for_users(self, school_short_name, enrollees):
         comments = (
@@ -684,11 +865,11 @@ class ExportCompleteEnrollingTable(django.views.View):
         for comment in comments:
             user_id = comment.study_result.school_participant.user_id
             comments_by_user_id[user_id].append(comment)
-        return [
+        return (
             '\n'.join('[{}] {}'.format(comment.verbose_type(), comment.comment)
-                      for comment in comments_by_user_id[user.id])
+                      for comment in comments_by_user_id.get(user.id, []))
             for user in enrollees
-        ]
+        )
 
     def get_checking_groups_for_users(self, school, enrollees):
         groups_by_user_id = collections.defaultdict(list)
@@ -697,14 +878,15 @@ class ExportCompleteEnrollingTable(django.views.View):
             for user_id in group_user_ids:
                 groups_by_user_id[user_id].append(checking_group)
 
-        return [', '.join(group.name for group in groups_by_user_id[user.id])
-                for user in enrollees]
+        return (', '.join(group.name for group in groups_by_user_id.get(user.id, []))
+                for user in enrollees)
 
     def get_entrance_status_by_user_id(self, school, enrollees):
         entrance_statuses = (
             models.EntranceStatus.objects
             .filter(school=school, user__in=enrollees)
-            .prefetch_related('sessions_and_parallels')
+            .prefetch_related('sessions_and_parallels__session',
+                              'sessions_and_parallels__parallel')
         )
         return {entrance_status.user_id: entrance_status
                 for entrance_status in entrance_statuses}
@@ -721,8 +903,8 @@ class ExportCompleteEnrollingTable(django.views.View):
         languages_by_user_id = collections.defaultdict(set)
         for solution in ok_solutions:
             languages_by_user_id[solution.user_id].add(solution.language.name)
-        return ['\n'.join(sorted(languages_by_user_id[user.id]))
-                for user in enrollees]
+        return ('\n'.join(sorted(languages_by_user_id.get(user.id, [])))
+                for user in enrollees)
 
     def format_datetime(self, timestamp: Union[datetime.datetime, str]) -> str:
         if not timestamp:
@@ -742,30 +924,31 @@ class ExportCompleteEnrollingTable(django.views.View):
         times_by_user_id = collections.defaultdict(set)
         for solution in ok_solutions:
             times_by_user_id[solution.user_id].add(solution.created_at)
-        return [self.format_datetime(aggregation_function(times_by_user_id[user.id], default="")) for user in enrollees]
+        return (self.format_datetime(aggregation_function(times_by_user_id.get(user.id, []), default=""))
+                for user in enrollees)
 
     def get_file_task_score_for_users(self, task, enrollees):
         checked_solutions = (
             models.CheckedSolution.objects
             .filter(solution__user__in=enrollees, solution__task=task)
             .order_by('created_at')
-            .select_related('solution__user')
+            .select_related('solution')
         )
         # If there are duplicate keys in dictionary comprehensions the last
         # always wins. That way we will use the score from the last available
         # check.
         last_score_by_user_id = {
-            checked_solution.solution.user.id: checked_solution.score
+            checked_solution.solution.user_id: checked_solution.score
             for checked_solution in checked_solutions
         }
-        return [last_score_by_user_id.get(user.id, '') for user in enrollees]
+        return (last_score_by_user_id.get(user.id, '') for user in enrollees)
 
     def get_file_task_comments_for_users(self, task, enrollees):
         checked_solutions = (
             models.CheckedSolution.objects
             .filter(solution__user__in=enrollees, solution__task=task)
             .order_by('-created_at')
-            .select_related('solution__user')
+            .select_related('solution', 'checked_by__profile')
         )
         comments_by_user_id = collections.defaultdict(list)
         for solution in checked_solutions:
@@ -774,7 +957,7 @@ class ExportCompleteEnrollingTable(django.views.View):
                 comments_by_user_id[user_id].append(
                     '{}: {}'.format(solution.checked_by.get_full_name(),
                                     solution.comment))
-        return ['\n\n'.join(comments_by_user_id[user.id]) for user in enrollees]
+        return ('\n\n'.join(comments_by_user_id.get(user.id, [])) for user in enrollees)
 
     def get_program_task_score_for_users(self, task, enrollees):
         OK = ejudge_models.CheckingResult.Result.OK
@@ -785,59 +968,34 @@ class ExportCompleteEnrollingTable(django.views.View):
                     ejudge_queue_element__submission__result__result=OK)
             .values_list('user_id', flat=True)
         )
-        return [('1' if user.id in solved_user_ids else '')
-                for user in enrollees]
+        return (('1' if user.id in solved_user_ids else '')
+                for user in enrollees)
 
-    def get_text_question_for_users(self, school, enrollees, short_name):
-        answers = (
-            questionnaire.models.QuestionnaireAnswer.objects
-            .filter(user__in=enrollees,
-                    questionnaire__school=school,
-                    question_short_name=short_name)
-        )
-        answer_by_user = {answer.user: answer.answer
-                          for answer in answers}
-        return [answer_by_user.get(user, '') for user in enrollees]
-
-    def get_choice_question_for_users(self, school, enrollees, short_name):
-        answers = (
-            questionnaire.models.QuestionnaireAnswer.objects
-            .filter(user__in=enrollees,
-                    questionnaire__school=school,
-                    question_short_name=short_name)
-        )
-        answer_variant_by_id = self.get_answer_variant_by_id(school)
+    def get_question_answers_for_users(self, data, short_name):
+        return data.questionnaire_answers.iter_column(short_name)
 
-        answers_selected_by_user = collections.defaultdict(list)
-        for answer in answers:
-            if not answer.answer:
-                # Ignore if user didn't select any variant
-                continue
-            answers_selected_by_user[answer.user_id].append(
-                answer_variant_by_id[answer.answer].text
-            )
-        return [', '.join(answers_selected_by_user[user.id]) for user in enrollees]
-
-    def question_exists(self, school, question_short_name):
-        return (questionnaire.models.AbstractQuestionnaireQuestion.objects
-                .filter(short_name=question_short_name,
-                        questionnaire__school_id=school.id)
-                .exists())
-
-    def get_answer_variant_by_id(self, school):
-        variants = (
-            questionnaire.models.ChoiceQuestionnaireQuestionVariant.objects
-            .filter(question__questionnaire__school=school)
-        )
-        return {str(var.id): var for var in variants}
+    def question_exists(self, data, question_short_name):
+        return data.questionnaire_answers.has_question(question_short_name)
 
     def get_checking_comments_for_users(self, school, enrollees):
         comments = (
             models.CheckingComment.objects
             .filter(school=school, user__in=enrollees)
+            .select_related('commented_by__profile')
             .order_by('created_at'))
         comments_by_user_id = collections.defaultdict(list)
         for comment in comments:
             comments_by_user_id[comment.user_id].append('{}: {}'.format(
                 comment.commented_by.get_full_name(), comment.comment))
-        return ['\n\n'.join(comments_by_user_id[user.id]) for user in enrollees]
+        return ('\n\n'.join(comments_by_user_id.get(user.id, [])) for user in enrollees)
+
+
+@sistema.staff.only_staff
+def download_enrolling_table_export(request, job_id):
+    job = get_object_or_404(
+        models.EnrollingTableExportJob,
+        id=job_id,
+        school=request.school,
+        status=models.EnrollingTableExportJob.Status.DONE,
+    )
+    return respond_as_attachment(request, job.file_name, 'enrolling.xlsx')
@@ -1,7 +1,7 @@
 from django.urls import path
 
 from . import views
-from .export import ExportCompleteEnrollingTable
+from .export import ExportCompleteEnrollingTable, download_enrolling_table_export
 
 urlpatterns = [
     path('enrolling/', views.enrolling, name='enrolling'),
@@ -14,6 +14,9 @@ urlpatterns = [
          name='user_questionnaire'),
     path('enrolling/<int:user_id>/topics/', views.user_topics, name='user_topics'),
     path('enrolling/export/', ExportCompleteEnrollingTable.as_view(), name='export_complete_enrolling_table'),
+    path('enrolling/export/<int:job_id>/download/',
+         download_enrolling_table_export,
+         name='download_enrolling_table_export'),
 
     path('solution/<int:solution_id>/', views.solution, name='user_solution'),
 
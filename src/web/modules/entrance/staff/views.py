@@ -1,16 +1,13 @@
 import operator
-import random
 
 import collections
 import django.urls
 from django.contrib import messages
-from django.db import transaction
 from django.db.models import F, Count, Sum, FloatField, IntegerField
 from django.db.models.functions import Cast
 from django.http.response import HttpResponseNotFound, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.decorators.http import require_POST
 
@@ -135,15 +132,9 @@ def user_topics(request, user_id):
     return topics_views.show_final_answers(request, user)
 
 
-def _remove_old_checking_locks():
-    models.CheckingLock.objects.filter(locked_until__lt=timezone.now()).delete()
-
-
 @sistema.staff.only_staff
 @groups.decorators.only_for_groups(entrance_groups.CAN_CHECK)
 def check(request):
-    _remove_old_checking_locks()
-
     checking_groups = request.school.entrance_checking_groups.all()
     for checking_group in checking_groups:
         checking_group.group_users = list(checking_group.group.users)
@@ -333,28 +324,44 @@ def check_group(request, group_name):
         school=request.school,
         short_name=group_name
     )
-    _remove_old_checking_locks()
-
     tasks = list(checking_group.tasks.order_by('order'))
     group_user_ids = nested_query_list(checking_group.group.user_ids)
-    for task in tasks:
-        task.solutions_count = users.models.User.objects.filter(
-            id__in=group_user_ids,
-            entrance_exam_solutions__task=task
-        ).distinct().count()
-        task.checks = models.CheckedSolution.objects.filter(
-            solution__task=task,
-            solution__user_id__in=group_user_ids
-        )
-        task.checked_solutions_count = task.checks.values_list(
-            'solution__user_id', flat=True
-        ).distinct().count()
-        task.checks_count = task.checks.count()
 
+    # Statistics for all tasks are calculated by grouped queries,
+    # so the number of queries doesn't depend on the number of tasks
+    solutions_count_by_task_id = dict(
+        models.EntranceExamTaskSolution.objects
+            .non_polymorphic()
+            .filter(task__in=tasks, user_id__in=group_user_ids)
+            .order_by()
+            .values('task_id')
+            .annotate(users_count=Count('user_id', distinct=True))
+            .values_list('task_id', 'users_count')
+    )
     group_checks = models.CheckedSolution.objects.filter(
         solution__task__in=tasks,
         solution__user_id__in=group_user_ids
     )
+    checks_stats_by_task_id = {
+        stats['solution__task_id']: stats
+        for stats in group_checks
+            .order_by()
+            .values('solution__task_id')
+            .annotate(
+                checked_solutions_count=Count('solution__user_id', distinct=True),
+                checks_count=Count('id'),
+            )
+    }
+    last_checks_by_task_id = models.CheckedSolution.get_last_checks_by_task(
+        tasks, group_user_ids, count=20
+    )
+    for task in tasks:
+        checks_stats = checks_stats_by_task_id.get(task.id, {})
+        task.solutions_count = solutions_count_by_task_id.get(task.id, 0)
+        task.checked_solutions_count = checks_stats.get('checked_solutions_count', 0)
+        task.checks_count = checks_stats.get('checks_count', 0)
+        task.checks = last_checks_by_task_id.get(task.id, [])
+
     total_solutions_count = sum(task.solutions_count for task in tasks)
     total_checked_solutions_count = sum(task.checked_solutions_count for task in tasks)
     total_checks_count = sum(task.checks_count for task in tasks)
@@ -366,9 +373,6 @@ def check_group(request, group_name):
     )
     total_users_count = len(group_user_ids)
 
-    for task in tasks:
-        task.checks = list(task.checks.order_by('-created_at')[:20])
-
     return render(request, 'entrance/staff/check_group.html', {
         'group': checking_group,
         'tasks': tasks,
@@ -643,14 +647,12 @@ def check_task(request, group_name, task_id):
         short_name=group_name,
     )
 
-    _remove_old_checking_locks()
-
     if not checking_group.tasks.filter(id=task_id).exists():
         return redirect('school:entrance:check',
                         school_name=request.school.short_name,
                         )
 
-    lock = request.user.entrance_checking_locks_by_user.first()
+    lock = models.CheckingQueueElement.get_lease(request.user)
     if lock is not None:
         messages.add_message(
             request, messages.INFO,
@@ -666,58 +668,30 @@ def check_task(request, group_name, task_id):
 
     task = get_object_or_404(models.FileEntranceExamTask, id=task_id)
 
-    with transaction.atomic():
-        locked_user_ids = set(
-            models.CheckingLock.objects
-                .filter(task=task)
-                .values_list('user_id', flat=True)
-        )
-        task_user_ids = set(task.solutions.values_list('user_id', flat=True))
-        already_checked_user_ids = set(models.CheckedSolution.objects.filter(
-            solution__task=task
-        ).values_list('solution__user_id', flat=True))
-
-        users_for_checking = (
-            checking_group.group.users
-                .exclude(id__in=locked_user_ids)
-                .exclude(id__in=already_checked_user_ids)
-                .filter(id__in=task_user_ids)
-        )
-
-        users_count = users_for_checking.count()
-
-        if users_count == 0:
-            messages.add_message(
-                request, messages.INFO,
-                'Все решения задачи «%s» проверены' % (task.title,)
-            )
-            return redirect('school:entrance:check_group',
-                            school_name=request.school.short_name,
-                            group_name=group_name,
-                            )
-
-        # Get the random user for checking
-        user_index = random.randint(0, users_count - 1)
-        user_for_checking = users_for_checking[user_index]
-        models.CheckingLock.objects.create(
-            user=user_for_checking,
-            task=task,
-            locked_by=request.user
+    queue_element = models.CheckingQueueElement.claim(
+        task, nested_query_list(checking_group.group.user_ids), request.user
+    )
+    if queue_element is None:
+        messages.add_message(
+            request, messages.INFO,
+            'Все решения задачи «%s» проверены' % (task.title,)
         )
+        return redirect('school:entrance:check_group',
+                        school_name=request.school.short_name,
+                        group_name=group_name,
+                        )
 
     return redirect('school:entrance:check_users_task',
                     school_name=request.school.short_name,
                     group_name=group_name,
                     task_id=task.id,
-                    user_id=user_for_checking.id,
+                    user_id=queue_element.user_id,
                     )
 
 
 @sistema.staff.only_staff
 @groups.decorators.only_for_groups(entrance_groups.CAN_CHECK)
 def check_users_task(request, task_id, user_id, group_name=None):
-    _remove_old_checking_locks()
-
     if group_name is not None:
         checking_group = get_object_or_404(
             models.CheckingGroup,
@@ -756,20 +730,9 @@ def check_users_task(request, task_id, user_id, group_name=None):
         entrance_exam_solutions__checks__isnull=False
     ).distinct().count()
 
-    locked_by_me = True
-    with transaction.atomic():
-        lock = models.CheckingLock.objects.filter(
-            user=user,
-            task=task,
-        ).first()
-        if lock is None:
-            lock = models.CheckingLock.objects.create(
-                user_id=user_id,
-                task_id=task_id,
-                locked_by=request.user,
-            )
-        else:
-            locked_by_me = lock.locked_by_id == request.user.id
+    # Checked solutions are not in the queue, they can be re-checked by anybody
+    lock = models.CheckingQueueElement.objects.filter(user=user, task=task).first()
+    locked_by_me = lock is None or lock.lease(request.user)
 
     base_entrance_level = upgrades.get_base_entrance_level(
         request.school, user
@@ -781,7 +744,8 @@ def check_users_task(request, task_id, user_id, group_name=None):
 
     solutions = task.solutions.filter(user=user).order_by('-created_at')
     if not solutions.exists():
-        lock.delete()
+        if lock is not None:
+            lock.delete()
         messages.add_message(
             request, messages.INFO,
             'Этот пользователь не решал выбранную задачу'
@@ -800,7 +764,8 @@ def check_users_task(request, task_id, user_id, group_name=None):
 
     if request.method == 'POST':
         if 'refuse' in request.POST:
-            lock.delete()
+            if lock is not None:
+                lock.release(request.user)
             return redirect(
                 'school:entrance:check',
                 school_name=request.school.short_name,
@@ -818,7 +783,6 @@ def check_users_task(request, task_id, user_id, group_name=None):
                 score=score,
                 comment=comment
             )
-            lock.delete()
 
             messages.add_message(
                 request, messages.INFO,
@@ -883,7 +847,6 @@ def check_users_task(request, task_id, user_id, group_name=None):
 @groups.decorators.only_for_groups(entrance_groups.ADMINS)
 def enrolling_user(request, user_id):
     user = get_object_or_404(users.models.User, id=user_id)
-    _remove_old_checking_locks()
 
     return check_user(request, user)
 
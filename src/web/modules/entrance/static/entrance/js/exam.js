@@ -37,12 +37,7 @@ $(document).ready(function(){
         });
     };
 
-    var updateProgramSolutions = function(task_id, $block, counter) {
-        if (counter > 100) {
-            alert('Произошла ошибка при обновлении статуса. Обновите страницу');
-            return;
-        }
-
+    var renderProgramSolutions = function(task_id, $block) {
         var $submits = $block.find('.entrance-exam__task__program__submits');
         var url = $block.data('solutionsUrl');
         var content = $submits.html();
@@ -51,13 +46,6 @@ $(document).ready(function(){
                 if (content != data)
                     $submits.html(data);
 
-                var is_checking = $submits.find('[name="is_checking"]').val();
-                if (is_checking == 'true') {
-                    var delay = 1000 + 500 * Math.pow(1.5, Math.min(10, counter)) // exponential backoff
-                    setTimeout(function () {
-                        updateProgramSolutions(task_id, $block, counter + 1);
-                    }, delay);
-                }
                 var is_passed = $submits.find('[name="is_passed"]').val();
                 if (is_passed == 'true') {
                     markTaskAsSolved(task_id);
@@ -68,6 +56,47 @@ $(document).ready(function(){
             });
     };
 
+    // Verdicts are polled by conditional requests: server answers 304 Not
+    // Modified while none of the solutions has changed since the version.
+    // If the server allows long polling (data-verdicts-wait > 0), it holds
+    // the request until a change instead. Solutions are re-rendered only
+    // when they have changed
+    var updateProgramSolutions = function(task_id, $block, counter, version) {
+        if (counter > 100) {
+            alert('Произошла ошибка при обновлении статуса. Обновите страницу');
+            return;
+        }
+
+        var url = $block.data('verdictsUrl');
+        var wait = parseInt($block.data('verdictsWait')) || 0;
+        var pollAgain = function(new_version) {
+            var delay = 0;
+            if (wait == 0)
+                delay = 1000 + 500 * Math.pow(1.5, Math.min(5, counter)); // exponential backoff
+            setTimeout(function () {
+                updateProgramSolutions(task_id, $block, counter + 1, new_version);
+            }, delay);
+        };
+
+        $.ajax({
+            url: url,
+            data: wait > 0 ? {wait: wait} : {},
+            headers: version ? {'If-None-Match': '"' + version + '"'} : {},
+            cache: false
+        }).done(function(data, textStatus, xhr){
+            if (xhr.status == 304) {
+                pollAgain(version);
+                return;
+            }
+
+            renderProgramSolutions(task_id, $block);
+            if (data.is_checking)
+                pollAgain(data.version);
+        }).error(function(){
+            alert('Произошла ошибка при обновлении статуса. Обновите страницу');
+        });
+    };
+
     $('.entrance-exam').on('click', '.entrance-exam__solution-report__link', function(){
         var $this = $(this);
         var $target = $($this.data('target'));
@@ -0,0 +1,130 @@
+"""Tests for checking of entrance exam solutions"""
+
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+import groups.models
+import users.models
+from modules.entrance import models
+from modules.entrance.tests import helpers
+
+
+class CheckingTestCase(TestCase):
+    """ Two file tasks, two checkers and two users who solve the tasks """
+    def setUp(self):
+        self.school = helpers.create_school('checking')
+        category = helpers.create_exam(self.school)
+        self.tasks = [helpers.create_file_task(category, i, title='Теория %d' % i) for i in range(2)]
+        self.checkers = [
+            users.models.User.objects.create_user('checker%d' % i, 'checker%d@example.com' % i, 'pass')
+            for i in range(2)
+        ]
+        self.users = [
+            users.models.User.objects.create_user('student%d' % i, 'student%d@example.com' % i, 'pass')
+            for i in range(2)
+        ]
+
+
+class LastChecksByTaskTestCase(CheckingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checker = self.checkers[0]
+        self.group_user, self.other_user = self.users
+        self.group = groups.models.ManuallyFilledGroup.objects.create(
+            school=self.school, short_name='checking-group', name='Группа проверки',
+        )
+        groups.models.UserInGroupMembership.objects.create(group=self.group, member=self.group_user)
+
+    def _check(self, task, user, minutes_ago):
+        solution = models.FileEntranceExamTaskSolution.objects.create(
+            task=task, user=user, solution='solution.txt', original_filename='solution.txt',
+        )
+        check = models.CheckedSolution.objects.create(
+            solution=solution, score=1, checked_by=self.checker,
+        )
+        # created_at is set by auto_now_add, so it's changed after creation
+        check.created_at = timezone.now() - datetime.timedelta(minutes=minutes_ago)
+        check.save()
+        return check
+
+    def test_last_checks_for_each_task(self):
+        first_task_checks = [self._check(self.tasks[0], self.group_user, minutes) for minutes in range(5)]
+        second_task_check = self._check(self.tasks[1], self.group_user, 10)
+        self._check(self.tasks[1], self.other_user, 1)
+
+        user_ids = self.group.user_ids
+        with self.assertNumQueries(1):
+            last_checks = models.CheckedSolution.get_last_checks_by_task(self.tasks, user_ids, count=3)
+
+        self.assertEqual(last_checks, {
+            self.tasks[0].id: first_task_checks[:3],
+            self.tasks[1].id: [second_task_check],
+        })
+
+    def test_no_checks(self):
+        self.assertEqual(
+            models.CheckedSolution.get_last_checks_by_task(self.tasks, self.group.user_ids, count=3),
+            {},
+        )
+
+
+class CheckingQueueTestCase(CheckingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.task = self.tasks[0]
+        self.user_ids = [user.id for user in self.users]
+
+    def _send_solution(self, user):
+        return models.FileEntranceExamTaskSolution.objects.create(
+            task=self.task, user=user, solution='solution.txt', original_filename='solution.txt',
+        )
+
+    def _get_queued_user_ids(self):
+        return set(models.CheckingQueueElement.objects.values_list('user_id', flat=True))
+
+    def test_queue_follows_solutions_and_checks(self):
+        solution = self._send_solution(self.users[0])
+        self._send_solution(self.users[0])
+        self.assertEqual(self._get_queued_user_ids(), {self.users[0].id})
+
+        check = models.CheckedSolution.objects.create(
+            solution=solution, score=1, checked_by=self.checkers[0],
+        )
+        self.assertEqual(self._get_queued_user_ids(), set())
+
+        # New solutions of the checked user are not checked again
+        self._send_solution(self.users[0])
+        self.assertEqual(self._get_queued_user_ids(), set())
+
+        check.delete()
+        self.assertEqual(self._get_queued_user_ids(), {self.users[0].id})
+
+        models.FileEntranceExamTaskSolution.objects.filter(user=self.users[0]).delete()
+        self.assertEqual(self._get_queued_user_ids(), set())
+
+    def test_claim(self):
+        for user in self.users:
+            self._send_solution(user)
+
+        first = models.CheckingQueueElement.claim(self.task, self.user_ids, self.checkers[0])
+        second = models.CheckingQueueElement.claim(self.task, self.user_ids, self.checkers[1])
+        self.assertEqual({first.user_id, second.user_id}, set(self.user_ids))
+        self.assertEqual(models.CheckingQueueElement.get_lease(self.checkers[1]), second)
+        self.assertIsNone(models.CheckingQueueElement.claim(self.task, self.user_ids, self.checkers[1]))
+
+        # Somebody else's lease can't be taken until it expires
+        self.assertFalse(first.lease(self.checkers[1]))
+        models.CheckingQueueElement.objects.filter(id=first.id).update(
+            locked_until=timezone.now() - datetime.timedelta(minutes=1),
+        )
+        self.assertIsNone(models.CheckingQueueElement.get_lease(self.checkers[0]))
+        self.assertEqual(
+            models.CheckingQueueElement.claim(self.task, self.user_ids, self.checkers[1]), first,
+        )
+
+        second.release(self.checkers[1])
+        self.assertEqual(
+            models.CheckingQueueElement.claim(self.task, [second.user_id], self.checkers[0]), second,
+        )
@@ -0,0 +1,205 @@
+"""Tests for columns of the complete enrolling table"""
+
+import datetime
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+import modules.ejudge.models as ejudge_models
+import modules.poldnev.models as poldnev_models
+import modules.topics.models as topics_models
+import questionnaire.models
+import schools.models
+import users.models
+from modules.entrance import models
+from modules.entrance.staff import export
+from modules.entrance.tests import helpers
+
+
+class EnrollingColumnsQueriesTestCase(TestCase):
+    fixtures = ['schools-test-sample-schools']
+
+    def setUp(self):
+        self.school = schools.models.School.objects.get(pk=3)
+        # School 2 is previous for school 3, see EnrollingTableData.previous_schools
+        self.previous_school = schools.models.School.objects.get(pk=2)
+        self.previous_parallel = schools.models.Parallel.objects.create(
+            school=self.previous_school, short_name='b', name='B',
+        )
+        self.parallel = schools.models.Parallel.objects.create(
+            school=self.school, short_name='a', name='A',
+        )
+        self.session = schools.models.Session.objects.create(
+            school=self.school,
+            short_name='july',
+            name='Июль',
+            start_date=datetime.date(2050, 7, 1),
+            finish_date=datetime.date(2050, 7, 21),
+        )
+        self.parallel.sessions.add(self.session)
+        self.level = models.EntranceLevel.objects.create(
+            school=self.school, short_name='c', name='C',
+        )
+        self._create_exam()
+        self._create_questionnaire()
+        self.poldnev_sessions = [
+            poldnev_models.Session.objects.create(poldnev_id=poldnev_id, name=name)
+            for poldnev_id, name in [('2048.aug', 'ЛКШ.2048.Август'), ('2047.jul', 'ЛКШ.2047.Июль')]
+        ]
+        topics_models.TopicQuestionnaire.objects.create(school=self.school, title='Тематическая анкета')
+
+        self.step = models.SelectEnrollmentTypeEntranceStep.objects.create(
+            school=self.school,
+            order=1,
+            text_on_moderation='',
+            text_passed_moderation='',
+            text_failed_moderation='',
+        )
+        self.enrollment_type = models.EnrollmentType.objects.create(
+            step=self.step, text='Олимпиада', needs_moderation=True,
+        )
+        self.staff_user = users.models.User.objects.create_user(
+            'teacher', 'teacher@example.com', 'pass', is_staff=True,
+        )
+        self.enrollees_count = 0
+
+    def _create_exam(self):
+        category = helpers.create_exam(self.school)
+        self.file_task = helpers.create_file_task(category, 1)
+        self.program_task = helpers.create_program_task(category, 2)
+        # Only tasks of some level are shown in the table
+        self.level.tasks.add(self.file_task, self.program_task)
+        self.language = ejudge_models.ProgrammingLanguage.objects.create(
+            short_name='cpp', name='C++', ejudge_id=1,
+        )
+
+    def _create_questionnaire(self):
+        self.questionnaire = questionnaire.models.Questionnaire.objects.create(
+            title='Анкета', short_name='enrollee', school=self.school,
+        )
+        for order, short_name in enumerate(['previous_parallels', 'main_language', 'want_to_session']):
+            questionnaire.models.TextQuestionnaireQuestion.objects.create(
+                questionnaire=self.questionnaire, short_name=short_name, text=short_name, order=order,
+                is_required=False, is_multiline=False,
+            )
+
+    def _add_poldnev_history(self, user):
+        person = poldnev_models.Person.objects.create(
+            poldnev_id=self.enrollees_count, first_name='Имя', last_name='Фамилия', user=user,
+        )
+        user.profile.poldnev_person = person
+        user.profile.save()
+        for session, parallel_name in zip(self.poldnev_sessions, ['B', 'C']):
+            parallel, _ = poldnev_models.Parallel.objects.get_or_create(session=session, name=parallel_name)
+            study_group, _ = poldnev_models.StudyGroup.objects.get_or_create(parallel=parallel, name=parallel_name)
+            poldnev_models.HistoryEntry.objects.create(person=person, session=session, study_group=study_group)
+
+    def _add_solutions(self, user):
+        solution = models.FileEntranceExamTaskSolution.objects.create(
+            task=self.file_task, user=user, solution='solution.txt', original_filename='solution.txt',
+        )
+        models.CheckedSolution.objects.create(
+            solution=solution, score=4, comment='Хорошо', checked_by=self.staff_user,
+        )
+        result = ejudge_models.SolutionCheckingResult.objects.create(
+            result=ejudge_models.CheckingResult.Result.OK,
+        )
+        submission = ejudge_models.Submission.objects.create(
+            ejudge_contest_id=1, ejudge_submit_id=self.enrollees_count, result=result,
+        )
+        queue_element = ejudge_models.QueueElement.objects.create(
+            ejudge_contest_id=1,
+            ejudge_problem_id=1,
+            file_name='solution.cpp',
+            submission=submission,
+            status=ejudge_models.QueueElement.Status.CHECKED,
+        )
+        models.ProgramEntranceExamTaskSolution.objects.create(
+            task=self.program_task,
+            user=user,
+            solution='solution.cpp',
+            ejudge_queue_element=queue_element,
+            language=self.language,
+        )
+
+    def _add_questionnaire_answers(self, user):
+        for short_name, answer in [
+            ('previous_parallels', 'B'), ('main_language', 'C++'), ('want_to_session', 'Июль'),
+        ]:
+            questionnaire.models.QuestionnaireAnswer.objects.create(
+                questionnaire=self.questionnaire, user=user, question_short_name=short_name, answer=answer,
+            )
+
+    def _add_enrollees(self, count):
+        for _ in range(count):
+            self.enrollees_count += 1
+            user = users.models.User.objects.create_user(
+                'student%d' % self.enrollees_count, '', 'pass',
+            )
+            users.models.UserProfile.objects.create(
+                user=user, first_name='Имя', last_name='Фамилия',
+            )
+            self._add_poldnev_history(user)
+            self._add_solutions(user)
+            self._add_questionnaire_answers(user)
+            status = models.EntranceStatus.objects.create(
+                school=self.school,
+                user=user,
+                status=models.EntranceStatus.Status.ENROLLED,
+            )
+            models.EnrolledToSessionAndParallel.objects.create(
+                entrance_status=status, session=self.session, parallel=self.parallel,
+            )
+            models.SelectedEnrollmentType.objects.create(
+                user=user,
+                step=self.step,
+                enrollment_type=self.enrollment_type,
+                is_moderated=True,
+                is_approved=True,
+                parallel=self.parallel,
+                accepted_entrance_level=self.level,
+            )
+            schools.models.SchoolParticipant.objects.create(
+                school=self.previous_school, user=user, parallel=self.previous_parallel,
+            )
+            models.CheckingComment.objects.create(
+                school=self.school, user=user, comment='Хорошо', commented_by=self.staff_user,
+            )
+
+    def _build_table(self):
+        request = export._ExportRequest(self.school, 'http://localhost/')
+        enrollees = export.get_enrollees(self.school)
+        with CaptureQueriesContext(connection) as queries:
+            columns = export.ExportCompleteEnrollingTable().get_enrolling_columns(request, enrollees)
+            cells_by_column_name = {
+                leaf.name: [cell[0] for cell in leaf.iter_cells()]
+                for column in columns
+                for leaf in column.get_leaf_columns()
+            }
+        return cells_by_column_name, len(queries)
+
+    def test_queries_count_does_not_depend_on_enrollees_count(self):
+        self._add_enrollees(2)
+        # Warm up caches (i.e. content types for polymorphic models)
+        self._build_table()
+        cells, queries_for_two = self._build_table()
+        self.assertEqual(cells['Основание для поступления'], ['Олимпиада'] * 2)
+        self.assertEqual(cells['Зачтённый уровень'], ['C'] * 2)
+        self.assertEqual(cells['Авто-зачисление'], ['A'] * 2)
+        self.assertEqual(cells['Параллель в School 2'], ['B'] * 2)
+        self.assertEqual(cells['ТА'], ['C'] * 2)
+        self.assertEqual(cells['Параллель'], ['A'] * 2)
+        self.assertEqual(cells['История (poldnev.ru)'], ['C, B'] * 2)
+        self.assertEqual(cells['История'], ['B'] * 2)
+        self.assertEqual(cells['Язык (основной)'], ['C++'] * 2)
+        self.assertEqual(cells['Смена'], ['Июль'] * 2)
+        self.assertEqual(cells['Языки ОК\'ов'], ['C++'] * 2)
+        self.assertEqual(cells['%d: Теория' % self.file_task.id], [4] * 2)
+        self.assertEqual(cells['%d: Практика' % self.program_task.id], ['1'] * 2)
+
+        self._add_enrollees(5)
+        cells, queries_for_seven = self._build_table()
+
+        self.assertEqual(len(cells['id']), 7)
+        self.assertEqual(queries_for_seven, queries_for_two)
@@ -0,0 +1,217 @@
+"""Tests for background building of the enrolling table"""
+
+import datetime
+import io
+import tempfile
+from unittest import mock
+
+from django.core import management
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+import groups.models
+import schools.models
+import users.models
+from modules.entrance import models
+from modules.entrance.staff import export
+from modules.entrance.tests import helpers
+
+
+class EnrollingTableExportJobTestCase(TestCase):
+    fixtures = ['schools-test-sample-schools']
+
+    def setUp(self):
+        self.school = schools.models.School.objects.get(pk=3)
+        self.exports_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.exports_dir.cleanup)
+
+    def _create_job(self):
+        return models.EnrollingTableExportJob.objects.create(
+            school=self.school,
+            plain_header=True,
+            base_url='http://localhost/',
+        )
+
+    def _run_worker(self):
+        with override_settings(SISTEMA_ENROLLING_EXPORTS_DIR=self.exports_dir.name):
+            management.call_command(
+                'run_export_worker', once=True, worker_id='test', stdout=io.StringIO(),
+            )
+
+    def test_worker_builds_table(self):
+        job = self._create_job()
+        self._run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.EnrollingTableExportJob.Status.DONE, job.error)
+        self.assertTrue(job.is_file_available)
+        self.assertEqual(job.progress, job.progress_total)
+
+        fingerprint = export.get_enrolling_data_fingerprint(self.school)
+        self.assertEqual(job.data_fingerprint, fingerprint)
+        self.assertEqual(
+            models.EnrollingTableExportJob.find_reusable(self.school, True, fingerprint),
+            job,
+        )
+        self.assertIsNone(
+            models.EnrollingTableExportJob.find_reusable(self.school, False, fingerprint)
+        )
+
+        user = users.models.User.objects.create_user('student', 'student@example.com', 'pass')
+        models.EntranceStatus.objects.create(
+            school=self.school,
+            user=user,
+            status=models.EntranceStatus.Status.ENROLLED,
+        )
+        new_fingerprint = export.get_enrolling_data_fingerprint(self.school)
+        self.assertNotEqual(new_fingerprint, fingerprint)
+        self.assertIsNone(
+            models.EnrollingTableExportJob.find_reusable(self.school, True, new_fingerprint)
+        )
+
+    def test_claim_expired_lease(self):
+        job = self._create_job()
+        lease = datetime.timedelta(minutes=1)
+
+        claimed = models.EnrollingTableExportJob.claim_next('first', lease)
+        self.assertEqual(claimed, job)
+        self.assertIsNone(models.EnrollingTableExportJob.claim_next('second', lease))
+
+        # The first worker has died
+        models.EnrollingTableExportJob.objects.filter(id=job.id).update(
+            lease_expires_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+        reclaimed = models.EnrollingTableExportJob.claim_next('second', lease)
+        self.assertEqual(reclaimed, job)
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # Results of the first worker are ignored
+        self.assertFalse(claimed.update_progress('', 1, 2, lease))
+        self.assertFalse(claimed.finish(models.EnrollingTableExportJob.Status.DONE))
+        self.assertTrue(reclaimed.finish(models.EnrollingTableExportJob.Status.DONE))
+
+
+class EnrollingDataFingerprintTestCase(TestCase):
+    fixtures = ['schools-test-sample-schools']
+
+    def setUp(self):
+        self.school = schools.models.School.objects.get(pk=3)
+        self.user = users.models.User.objects.create_user('student', 'student@example.com', 'pass')
+        models.EntranceStatus.objects.create(
+            school=self.school, user=self.user, status=models.EntranceStatus.Status.PARTICIPATING,
+        )
+        self.parallels = [
+            schools.models.Parallel.objects.create(school=self.school, short_name=name, name=name)
+            for name in ['A', 'B']
+        ]
+        self.task = helpers.create_file_task(helpers.create_exam(self.school), 1)
+        self.checking_group = models.CheckingGroup.objects.create(
+            school=self.school,
+            short_name='checking',
+            name='Группа проверки',
+            group=groups.models.ManuallyFilledGroup.objects.create(
+                school=self.school, short_name='checking-group', name='Группа проверки',
+            ),
+        )
+
+    def _assert_changes_fingerprint(self, change):
+        fingerprint = export.get_enrolling_data_fingerprint(self.school)
+        change()
+        self.assertNotEqual(export.get_enrolling_data_fingerprint(self.school), fingerprint)
+
+    def test_edits_change_fingerprint(self):
+        participant = schools.models.SchoolParticipant.objects.create(
+            school=self.school, user=self.user, parallel=self.parallels[0],
+        )
+        solution = models.FileEntranceExamTaskSolution.objects.create(
+            task=self.task, user=self.user, solution='solution.txt', original_filename='solution.txt',
+        )
+        checked_solution = models.CheckedSolution.objects.create(
+            solution=solution, score=1, checked_by=self.user,
+        )
+
+        def move_to_other_parallel():
+            participant.parallel = self.parallels[1]
+            participant.save()
+
+        def change_score():
+            checked_solution.score = 5
+            checked_solution.save()
+
+        def rename_task():
+            self.task.title = 'Практика'
+            self.task.save()
+
+        self._assert_changes_fingerprint(move_to_other_parallel)
+        self._assert_changes_fingerprint(change_score)
+        self._assert_changes_fingerprint(rename_task)
+
+    def test_metric_settings_change_fingerprint(self):
+        metric = models.ParallelScoreEntranceUserMetric.objects.create(name='Балл', exam=self.task.exam)
+        entry = models.ParallelScoreEntranceUserMetricFileTaskEntry.objects.create(
+            parallel_score_metric=metric, task=self.task, max_score=10,
+        )
+        program_task = helpers.create_program_task(self.task.category, 2)
+
+        def change_max_score():
+            entry.max_score = 20
+            entry.save()
+
+        self._assert_changes_fingerprint(change_max_score)
+        self._assert_changes_fingerprint(lambda: metric.replacing_program_tasks.add(program_task))
+
+    def test_metric_values_dont_change_fingerprint(self):
+        metric = models.ParallelScoreEntranceUserMetric.objects.create(name='Балл', exam=self.task.exam)
+        models.ParallelScoreEntranceUserMetricFileTaskEntry.objects.create(
+            parallel_score_metric=metric, task=self.task, max_score=10,
+        )
+
+        # Values are stored while the table is built, and the built table
+        # should be reused by the next export
+        fingerprint = export.get_enrolling_data_fingerprint(self.school)
+        metric.values_for_users([self.user])
+        self.assertTrue(models.EntranceUserMetricValue.objects.exists())
+        self.assertEqual(export.get_enrolling_data_fingerprint(self.school), fingerprint)
+
+    def test_new_rows_change_fingerprint(self):
+        self._assert_changes_fingerprint(
+            lambda: groups.models.UserInGroupMembership.objects.create(
+                group=self.checking_group.group, member=self.user,
+            )
+        )
+        self._assert_changes_fingerprint(
+            lambda: models.EnrolledToSessionAndParallel.objects.create(
+                entrance_status=models.EntranceStatus.objects.get(school=self.school, user=self.user),
+                parallel=self.parallels[0],
+            )
+        )
+
+
+@helpers.without_profiling_middlewares
+class ExportCompleteEnrollingTableViewTestCase(TestCase):
+    def setUp(self):
+        self.school = helpers.create_school('export')
+        teacher = users.models.User.objects.create_user('teacher', 'teacher@example.com', 'pass', is_staff=True)
+        users.models.UserProfile.objects.create(user=teacher, first_name='Учитель')
+        self.client.force_login(teacher)
+        self.url = reverse('school:entrance:export_complete_enrolling_table', args=[self.school.short_name])
+        # Table built from the same data as now
+        models.EnrollingTableExportJob.objects.create(
+            school=self.school,
+            plain_header=True,
+            base_url='http://localhost/',
+            status=models.EnrollingTableExportJob.Status.DONE,
+            data_fingerprint=export.get_enrolling_data_fingerprint(self.school),
+        )
+
+    def _post(self, data):
+        with mock.patch.object(models.EnrollingTableExportJob, 'is_file_available', True):
+            response = self.client.post(self.url, data)
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        return models.EnrollingTableExportJob.objects.filter(status=models.EnrollingTableExportJob.Status.QUEUED)
+
+    def test_finished_table_is_reused(self):
+        self.assertFalse(self._post({'plain_header': 'true'}).exists())
+
+    def test_force_rebuild(self):
+        self.assertEqual(self._post({'plain_header': 'true', 'force_rebuild': 'true'}).count(), 1)
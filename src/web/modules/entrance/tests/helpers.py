@@ -0,0 +1,52 @@
+"""Data and settings shared by the tests of the entrance module"""
+
+from django.conf import settings
+from django.test import override_settings
+
+import schools.models
+from modules.entrance import models
+
+# Profiling middlewares make their own queries, so tests which request
+# pages and count queries are decorated by it
+without_profiling_middlewares = override_settings(MIDDLEWARE=[
+    middleware for middleware in settings.MIDDLEWARE
+    if middleware not in ('silk.middleware.SilkyMiddleware',
+                          'debug_toolbar.middleware.DebugToolbarMiddleware')
+])
+
+
+def create_school(short_name, **kwargs):
+    """
+    Creates the school. System groups of the school (see
+    EntranceConfig.sistema_groups) are created only for the new schools,
+    not for the ones loaded from fixtures.
+    """
+    return schools.models.School.objects.create(name='ЛКШ 2048', year='2048', short_name=short_name, **kwargs)
+
+
+def create_exam(school):
+    """ Creates the exam with one category of tasks, returns the category """
+    exam = models.EntranceExam.objects.create(school=school)
+    return models.EntranceExamTaskCategory.objects.create(
+        exam=exam, short_name='main', title='Задачи', order=1,
+    )
+
+
+def create_file_task(category, order, title='Теория'):
+    return models.FileEntranceExamTask.objects.create(
+        title=title, exam=category.exam, category=category, max_score=5, order=order,
+    )
+
+
+def create_program_task(category, order, title='Практика', ejudge_problem_id=1):
+    return models.ProgramEntranceExamTask.objects.create(
+        title=title,
+        exam=category.exam,
+        category=category,
+        max_score=1,
+        order=order,
+        ejudge_contest_id=1,
+        ejudge_problem_id=ejudge_problem_id,
+        time_limit=1000,
+        memory_limit=256 * 1024 * 1024,
+    )
@@ -1,11 +1,16 @@
 """Tests for entrance levels"""
 
-from django.test import TransactionTestCase
+import datetime
 
+from django.test import TestCase, TransactionTestCase
+
+import modules.topics.models as topics_models
 import schools.models
 import users.models
-from modules.entrance import models
+from modules.entrance import cache_tags, models, upgrades
 from modules.entrance.models import levels
+from modules.entrance.tests import helpers
+from sistema.cache import get_tags_version
 
 
 class AlreadyWasEntranceLevelLimiterTestCase(TransactionTestCase):
@@ -152,3 +157,188 @@ class AlreadyWasEntranceLevelLimiterTestCase(TransactionTestCase):
             school=self.prev_school_2, parallel=self.s2_p)
         limit = self.limiter.get_limit(user)
         self.assertEqual(limit.min_level, self.c)
+
+    def test_limits_for_users(self):
+        """
+        Limits computed for many users at once are the same as for each user
+        """
+        users_list = [
+            users.models.User.objects.create_user('test-user-%d' % i)
+            for i in range(3)
+        ]
+        users_list[1].school_participations.create(
+            school=self.prev_school_1, parallel=self.s1_b)
+        users_list[2].school_participations.create(
+            school=self.prev_school_1, parallel=self.s1_c_prime)
+        users_list[2].school_participations.create(
+            school=self.prev_school_2, parallel=self.s2_c_py)
+
+        with self.assertNumQueries(3):
+            limits = self.limiter.get_limits_for_users(users_list)
+        for user in users_list:
+            self.assertEqual(limits[user.id].min_level,
+                             self.limiter.get_limit(user).min_level)
+
+    def test_entrance_levels_for_users(self):
+        users_list = [
+            users.models.User.objects.create_user('test-user-%d' % i)
+            for i in range(2)
+        ]
+        users_list[1].school_participations.create(
+            school=self.prev_school_1, parallel=self.s1_b)
+        models.EntranceLevelUpgrade.objects.create(
+            user=users_list[0], upgraded_to=self.b)
+        models.SelectedEntranceLevel.objects.create(
+            school=self.school, user=users_list[1], level=self.c)
+
+        levels_by_user = upgrades.get_entrance_levels_for_users(self.school, users_list)
+
+        self.assertEqual(levels_by_user[users_list[0].id].base, self.c_prime)
+        self.assertEqual(levels_by_user[users_list[0].id].maximum_issued, self.b)
+        self.assertIsNone(levels_by_user[users_list[0].id].selected)
+        self.assertEqual(levels_by_user[users_list[1].id].base, self.a_prime)
+        self.assertEqual(levels_by_user[users_list[1].id].recommended, self.a_prime)
+        # Selected level can't be lower than base one
+        self.assertEqual(levels_by_user[users_list[1].id].selected, self.a_prime)
+        self.assertEqual(levels_by_user[users_list[1].id].maximum_issued, self.a_prime)
+
+
+class AgeEntranceLevelLimiterInvalidationTestCase(TestCase):
+    """
+    Base levels are cached until the school's levels are invalidated (see
+    cache_tags.school_levels()), so each input of AgeEntranceLevelLimiter
+    should invalidate them
+    """
+    def setUp(self):
+        self.school = helpers.create_school('age_limiter')
+        self.c, self.b, self.a = [
+            models.EntranceLevel.objects.create(school=self.school, short_name=name, name=name, order=order)
+            for order, name in enumerate(['c', 'b', 'a'])
+        ]
+        self.limiter = levels.AgeEntranceLevelLimiter.objects.create(school=self.school)
+        self.limit_for_9 = levels.AgeEntranceLevelLimiterForClass.objects.create(
+            limiter=self.limiter, current_class=9, level=self.b,
+        )
+        levels.AgeEntranceLevelLimiterForClass.objects.create(limiter=self.limiter, current_class=10, level=self.a)
+
+        self.user = users.models.User.objects.create_user('test-user')
+        # The user is in the 7th class in January of 2048, the 9th one in
+        # January of 2050 and the 10th one in July of 2051
+        users.models.UserProfile.objects.create(
+            user=self.user, first_name='Имя', last_name='Фамилия', _zero_class_year=2040,
+        )
+
+    def _assert_base_level(self, level):
+        self.assertEqual(upgrades.get_base_entrance_level(self.school, self.user), level)
+
+    def test_changes_of_limiter_inputs(self):
+        self._assert_base_level(self.c)
+
+        self.school.year = '2050'
+        self.school.save()
+        self._assert_base_level(self.b)
+
+        session = schools.models.Session.objects.create(
+            school=self.school,
+            start_date=datetime.date(2051, 7, 1),
+            finish_date=datetime.date(2051, 7, 31),
+        )
+        self._assert_base_level(self.a)
+
+        session.start_date = datetime.date(2048, 7, 1)
+        session.save()
+        self._assert_base_level(self.c)
+
+        session.delete()
+        self._assert_base_level(self.b)
+
+        self.limit_for_9.level = self.a
+        self.limit_for_9.save()
+        self._assert_base_level(self.a)
+
+        self.limit_for_9.delete()
+        self._assert_base_level(self.c)
+
+        levels.AgeEntranceLevelLimiterForClass.objects.create(limiter=self.limiter, current_class=7, level=self.b)
+        self._assert_base_level(self.b)
+
+
+class TopicsEntranceLevelLimiterInvalidationTestCase(TestCase):
+    def setUp(self):
+        self.school = helpers.create_school('topics_limiter')
+        self.c, self.b = [
+            models.EntranceLevel.objects.create(school=self.school, short_name=name, name=name, order=order)
+            for order, name in enumerate(['c', 'b'])
+        ]
+        self.questionnaire = topics_models.TopicQuestionnaire.objects.create(
+            school=self.school, title='Тематическая анкета',
+        )
+        tag = topics_models.Tag.objects.create(questionnaire=self.questionnaire, short_name='dp', title='ДП')
+        topic = topics_models.Topic.objects.create(
+            questionnaire=self.questionnaire,
+            short_name='knapsack',
+            title='Рюкзак',
+            text='Задача о рюкзаке',
+            level=topics_models.Level.objects.create(questionnaire=self.questionnaire, name='1'),
+        )
+        topic.tags.add(tag)
+        scale = topics_models.Scale.objects.create(
+            questionnaire=self.questionnaire, short_name='practice', title='Практика', count_values=3,
+        )
+        self.scale_in_topic = topics_models.ScaleInTopic.objects.create(
+            topic=topic,
+            scale_label_group=topics_models.ScaleLabelGroup.objects.create(scale=scale, short_name='main'),
+        )
+        # Level B requires the maximal mark in all topics with the tag
+        topics_models.EntranceLevelRequirement.objects.create(
+            questionnaire=self.questionnaire, entrance_level=self.b, tag=tag, max_penalty=0,
+        )
+        topics_models.TopicsEntranceLevelLimiter.objects.create(school=self.school)
+
+        self.user = users.models.User.objects.create_user('test-user')
+
+    def _assert_base_level(self, level):
+        self.assertEqual(upgrades.get_base_entrance_level(self.school, self.user), level)
+
+    def _assert_invalidates_user_levels(self, change):
+        tags_version = get_tags_version([cache_tags.user_levels(self.user.id)])
+        result = change()
+        self.assertNotEqual(get_tags_version([cache_tags.user_levels(self.user.id)]), tags_version)
+        return result
+
+    def test_finishing_questionnaire(self):
+        status = self._assert_invalidates_user_levels(
+            lambda: topics_models.UserQuestionnaireStatus.objects.create(
+                user=self.user, questionnaire=self.questionnaire,
+                status=topics_models.UserQuestionnaireStatus.Status.STARTED,
+            )
+        )
+        mark = self._assert_invalidates_user_levels(
+            lambda: topics_models.UserMark.objects.create(user=self.user, scale_in_topic=self.scale_in_topic, mark=0)
+        )
+        self._assert_base_level(self.c)
+
+        def change_mark(value):
+            mark.mark = value
+            mark.save()
+
+        self._assert_invalidates_user_levels(lambda: change_mark(2))
+        self._assert_base_level(self.b)
+
+        def finish():
+            status.status = topics_models.UserQuestionnaireStatus.Status.FINISHED
+            status.save()
+
+        self._assert_invalidates_user_levels(finish)
+        # Level is stored on the first computation after the questionnaire is finished
+        self._assert_invalidates_user_levels(lambda: self._assert_base_level(self.b))
+        self.assertTrue(topics_models.TopicsEntranceLevelLimit.objects.filter(user=self.user).exists())
+
+        def correct_mark():
+            # Marks are corrected with the CORRECTING status, which drops the stored level
+            status.status = topics_models.UserQuestionnaireStatus.Status.CORRECTING
+            status.save()
+            change_mark(0)
+
+        self._assert_invalidates_user_levels(correct_mark)
+        self._assert_base_level(self.c)
@@ -0,0 +1,110 @@
+"""Tests for stored values of entrance metrics"""
+
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+import modules.ejudge.models as ejudge_models
+import users.models
+from modules.entrance import models
+from modules.entrance.tests import helpers
+
+
+class ParallelScoreMetricValuesTestCase(TestCase):
+    def setUp(self):
+        category = helpers.create_exam(helpers.create_school('metrics'))
+        self.file_task = helpers.create_file_task(category, 1)
+        self.program_task = helpers.create_program_task(category, 2)
+        self.metric = models.ParallelScoreEntranceUserMetric.objects.create(name='Балл', exam=category.exam)
+        models.ParallelScoreEntranceUserMetricFileTaskEntry.objects.create(
+            parallel_score_metric=self.metric, task=self.file_task, max_score=10,
+        )
+        models.ParallelScoreEntranceUserMetricProgramTaskEntry.objects.create(
+            parallel_score_metric=self.metric, task=self.program_task, score=100,
+        )
+
+        self.checker = users.models.User.objects.create_user('checker', 'checker@example.com', 'pass')
+        self.users = [
+            users.models.User.objects.create_user('student%d' % i, 'student%d@example.com' % i, 'pass')
+            for i in range(3)
+        ]
+
+    def _check(self, user, score):
+        solution = models.FileEntranceExamTaskSolution.objects.create(
+            task=self.file_task, user=user, solution='solution.txt', original_filename='solution.txt',
+        )
+        return models.CheckedSolution.objects.create(solution=solution, score=score, checked_by=self.checker)
+
+    def _get_versions(self):
+        return dict(models.EntranceUserMetricValue.objects.values_list('user_id', 'version'))
+
+    def test_values_are_stored(self):
+        self._check(self.users[0], 5)
+        self._check(self.users[1], 1)
+        self.assertEqual(self.metric.values_for_users(self.users), [10, 2, 0])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.metric.values_for_users(self.users), [10, 2, 0])
+
+    def test_only_changed_values_are_recomputed(self):
+        self._check(self.users[0], 1)
+        self.metric.values_for_users(self.users)
+        versions = self._get_versions()
+
+        check = self._check(self.users[0], 5)
+        self.assertEqual(self.metric.values_for_users(self.users), [10, 0, 0])
+        self.assertEqual(self._get_versions(), {**versions, self.users[0].id: versions[self.users[0].id] + 1})
+
+        check.delete()
+        self.assertEqual(self.metric.values_for_users(self.users), [2, 0, 0])
+
+    def test_ejudge_verdict_invalidates_value(self):
+        self.assertEqual(self.metric.values_for_users(self.users), [0, 0, 0])
+
+        queue_element = ejudge_models.QueueElement.objects.create(
+            ejudge_contest_id=1, ejudge_problem_id=1, file_name='solution.cpp',
+        )
+        models.ProgramEntranceExamTaskSolution.objects.create(
+            task=self.program_task, user=self.users[2], solution='solution.cpp',
+            ejudge_queue_element=queue_element,
+            language=ejudge_models.ProgrammingLanguage.objects.create(short_name='cpp', name='C++', ejudge_id=1),
+        )
+        result = ejudge_models.SolutionCheckingResult.objects.create(
+            result=ejudge_models.CheckingResult.Result.OK,
+        )
+        queue_element.submission = ejudge_models.Submission.objects.create(
+            ejudge_contest_id=1, ejudge_submit_id=1, result=result,
+        )
+        queue_element.status = ejudge_models.QueueElement.Status.CHECKED
+        queue_element.save()
+
+        self.assertEqual(self.metric.values_for_users(self.users), [0, 0, 100])
+
+    def test_metric_settings_invalidate_all_values(self):
+        self._check(self.users[0], 5)
+        self.assertEqual(self.metric.values_for_users(self.users), [10, 0, 0])
+
+        self.metric.file_task_entries.update(max_score=20)
+        self.metric.file_task_entries.first().save()
+        self.assertEqual(self.metric.values_for_users(self.users), [20, 0, 0])
+
+    def _get_updated_at(self):
+        return set(models.EntranceUserMetricValue.objects.values_list('updated_at', flat=True))
+
+    def test_updated_at_changes_on_invalidation_and_recomputation(self):
+        now = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            self.metric.values_for_users(self.users)
+        self.assertEqual(self._get_updated_at(), {now})
+
+        invalidated_at = now + datetime.timedelta(minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=invalidated_at):
+            self.metric.program_task_entries.first().save()
+        self.assertEqual(self._get_updated_at(), {invalidated_at})
+
+        recomputed_at = now + datetime.timedelta(minutes=2)
+        with mock.patch('django.utils.timezone.now', return_value=recomputed_at):
+            self.metric.values_for_users(self.users)
+        self.assertEqual(self._get_updated_at(), {recomputed_at})
@@ -0,0 +1,362 @@
+"""
+Query and time budgets for the hot entrance views.
+
+Every view is requested on the test data (see QueryBudgetsTestCase.setUpTestData)
+and the test fails if it makes more queries or takes more time than declared
+in VIEW_BUDGETS. If you improve the view, decrease its budget. If the view
+needs more queries, make sure their number doesn't depend on the number of
+users or tasks, and only then increase the budget.
+
+Numbers of queries are checked on small data by the default test run. Creating
+the data of realistic size takes minutes and timings depend on the machine, so
+time budgets are checked only by QueryBudgetsBenchmarkTestCase, which is
+marked as `benchmark` and run by the separate CI job with `pytest -m benchmark`.
+"""
+
+import collections
+import datetime
+import tempfile
+import time
+
+import pytest
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import groups.models
+import home.models
+import modules.ejudge.models as ejudge_models
+import questionnaire.models
+import schools.models
+import users.models
+from modules.entrance import groups as entrance_groups
+from modules.entrance import models
+from modules.entrance.home.blocks import EntranceStepsHomePageBlock
+from modules.entrance.staff import export
+from modules.entrance.tests import helpers
+from modules.topics import models as topics_models
+
+# Budget of the view on the data created in QueryBudgetsTestCase.
+# Note that staff views are requested with cold caches of groups' members,
+# so their budgets include rebuilding of the groups
+Budget = collections.namedtuple('Budget', ['queries', 'seconds'])
+
+VIEW_BUDGETS = {
+    'entrance_home': Budget(queries=35, seconds=2),
+    'exam': Budget(queries=30, seconds=3),
+    'check_group': Budget(queries=85, seconds=5),
+    'check_task': Budget(queries=50, seconds=2),
+    'checking_group_users': Budget(queries=80, seconds=12),
+    'enrolling_data': Budget(queries=8, seconds=5),
+    'results_data': Budget(queries=10, seconds=6),
+    'group_members_export': Budget(queries=25, seconds=3),
+    'complete_enrolling_table_export': Budget(queries=105, seconds=15),
+}
+
+
+@helpers.without_profiling_middlewares
+class QueryBudgetsTestCase(TestCase):
+    USERS_COUNT = 64
+    FILE_TASKS_COUNT = 16
+    PROGRAM_TASKS_COUNT = 8
+    TEST_TASKS_COUNT = 8
+    # Number of file tasks solved by each user
+    SOLVED_FILE_TASKS_PER_USER = 2
+    # Questionnaire steps before the exam, each one is available after the previous one
+    QUESTIONNAIRE_STEPS_COUNT = 6
+    CHECK_SECONDS = False
+
+    @classmethod
+    def setUpTestData(cls):
+        # The school is public, because participants open its pages too
+        cls.school = helpers.create_school('budget', is_public=True)
+        cls.session = schools.models.Session.objects.create(
+            school=cls.school,
+            short_name='july',
+            name='Июль',
+            start_date=datetime.date(2048, 7, 1),
+            finish_date=datetime.date(2048, 7, 21),
+        )
+        cls.parallel = schools.models.Parallel.objects.create(
+            school=cls.school, short_name='c', name='C',
+        )
+        cls.parallel.sessions.add(cls.session)
+
+        # Complete enrolling table contains entrance levels by topics questionnaire
+        topics_models.TopicQuestionnaire.objects.create(school=cls.school, title='Тематическая анкета')
+
+        cls._create_users()
+        cls._create_exam()
+        cls._create_solutions()
+        cls._create_checking_group()
+
+        home.models.AbstractHomePageBlock.objects.all().delete()
+        EntranceStepsHomePageBlock.objects.create(school=cls.school, order=1)
+        cls._create_steps()
+
+    @classmethod
+    def _create_steps(cls):
+        previous_step = None
+        for i in range(cls.QUESTIONNAIRE_STEPS_COUNT):
+            step_questionnaire = questionnaire.models.Questionnaire.objects.create(
+                title='Анкета %d' % i, short_name='questionnaire%d' % i, school=cls.school,
+            )
+            previous_step = models.FillQuestionnaireEntranceStep.objects.create(
+                school=cls.school, order=i, questionnaire=step_questionnaire,
+                available_after_step=previous_step,
+            )
+            # The participant has filled all questionnaires except the last one
+            if i + 1 < cls.QUESTIONNAIRE_STEPS_COUNT:
+                questionnaire.models.UserQuestionnaireStatus.objects.create(
+                    user=cls.participant, questionnaire=step_questionnaire,
+                    status=questionnaire.models.UserQuestionnaireStatus.Status.FILLED,
+                )
+        models.SolveExamEntranceStep.objects.create(
+            school=cls.school, order=cls.QUESTIONNAIRE_STEPS_COUNT, exam=cls.exam,
+            available_after_step=previous_step,
+        )
+
+    @classmethod
+    def _create_users(cls):
+        users.models.User.objects.bulk_create([
+            users.models.User(username='student%d' % i, email='student%d@example.com' % i)
+            for i in range(cls.USERS_COUNT)
+        ])
+        cls.users = list(users.models.User.objects.filter(username__startswith='student').order_by('id'))
+        users.models.UserProfile.objects.bulk_create([
+            users.models.UserProfile(
+                user=user, first_name='Имя', last_name='Фамилия %d' % user.id, city='Город',
+            )
+            for user in cls.users
+        ])
+        models.EntranceStatus.objects.bulk_create([
+            models.EntranceStatus(
+                school=cls.school,
+                user=user,
+                status=models.EntranceStatus.Status.ENROLLED,
+                is_status_visible=True,
+            )
+            for user in cls.users
+        ])
+        models.EnrolledToSessionAndParallel.objects.bulk_create([
+            models.EnrolledToSessionAndParallel(
+                entrance_status=status, session=cls.session, parallel=cls.parallel,
+            )
+            for status in models.EntranceStatus.objects.filter(school=cls.school)
+        ])
+
+        cls.checker = users.models.User.objects.create_user(
+            'checker', 'checker@example.com', 'pass', is_staff=True,
+        )
+        users.models.UserProfile.objects.create(user=cls.checker, first_name='Проверяющий')
+        can_check = groups.models.ManuallyFilledGroup.objects.get(
+            school=cls.school, short_name=entrance_groups.CAN_CHECK,
+        )
+        groups.models.UserInGroupMembership.objects.create(group=can_check, member=cls.checker)
+
+    @classmethod
+    def _create_exam(cls):
+        category = helpers.create_exam(cls.school)
+        cls.exam = category.exam
+        cls.level = models.EntranceLevel.objects.create(
+            school=cls.school, short_name='c', name='C', order=1,
+        )
+        cls.file_tasks = [
+            helpers.create_file_task(category, i, title='Теория %d' % i)
+            for i in range(cls.FILE_TASKS_COUNT)
+        ]
+        cls.program_tasks = [
+            helpers.create_program_task(
+                category, cls.FILE_TASKS_COUNT + i, title='Практика %d' % i, ejudge_problem_id=i + 1,
+            )
+            for i in range(cls.PROGRAM_TASKS_COUNT)
+        ]
+        cls.test_tasks = [
+            models.TestEntranceExamTask.objects.create(
+                title='Тест %d' % i,
+                exam=cls.exam,
+                category=category,
+                max_score=1,
+                order=cls.FILE_TASKS_COUNT + cls.PROGRAM_TASKS_COUNT + i,
+                correct_answer_re='42',
+                validation_re=r'\d+',
+            )
+            for i in range(cls.TEST_TASKS_COUNT)
+        ]
+        cls.tasks = cls.file_tasks + cls.program_tasks + cls.test_tasks
+        cls.level.tasks.add(*cls.tasks)
+
+    @classmethod
+    def _create_solutions(cls):
+        # Multi-table inherited models can't be created by bulk_create()
+        checks = []
+        for index, user in enumerate(cls.users):
+            for i in range(cls.SOLVED_FILE_TASKS_PER_USER):
+                task = cls.file_tasks[(index + i) % len(cls.file_tasks)]
+                solution = models.FileEntranceExamTaskSolution.objects.create(
+                    task=task, user=user, solution='solution.txt', original_filename='solution.txt',
+                )
+                if index % 2 == 0:
+                    checks.append(models.CheckedSolution(
+                        solution=solution, score=3, checked_by=cls.checker, comment='Неплохо',
+                    ))
+        models.CheckedSolution.objects.bulk_create(checks)
+        # bulk_create() doesn't send signals which maintain the checking queue
+        models.CheckingQueueElement.objects.filter(
+            user_id__in=[check.solution.user_id for check in checks]
+        ).delete()
+
+        # Solutions of the participant who opens the exam page
+        cls.participant = cls.users[0]
+        language = ejudge_models.ProgrammingLanguage.objects.create(
+            short_name='cpp', name='C++', ejudge_id=1,
+        )
+        for task in cls.program_tasks:
+            for _ in range(2):
+                queue_element = ejudge_models.QueueElement.objects.create(
+                    ejudge_contest_id=1, ejudge_problem_id=task.ejudge_problem_id, file_name='solution.cpp',
+                )
+                models.ProgramEntranceExamTaskSolution.objects.create(
+                    task=task,
+                    user=cls.participant,
+                    solution='solution.cpp',
+                    ejudge_queue_element=queue_element,
+                    language=language,
+                )
+        for task in cls.test_tasks:
+            for answer in ('41', '42'):
+                models.TestEntranceExamTaskSolution.objects.create(
+                    task=task, user=cls.participant, solution=answer,
+                )
+
+    @classmethod
+    def _create_checking_group(cls):
+        group = groups.models.ManuallyFilledGroup.objects.create(
+            school=cls.school, short_name='checking-group', name='Группа проверки',
+        )
+        groups.models.UserInGroupMembership.objects.bulk_create([
+            groups.models.UserInGroupMembership(group=group, member=user)
+            for user in cls.users
+        ])
+        cls.checking_group = models.CheckingGroup.objects.create(
+            school=cls.school, short_name='checking-group', name='Группа проверки', group=group,
+        )
+        cls.checking_group.tasks.add(*cls.file_tasks)
+
+    def _assert_within_budget(self, name, func):
+        max_queries, max_seconds = VIEW_BUDGETS[name]
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.monotonic()
+            result = func()
+            elapsed = time.monotonic() - started_at
+
+        self.assertLessEqual(
+            len(queries), max_queries,
+            '%s made %d queries, but its budget is %d. Queries:\n%s' % (
+                name, len(queries), max_queries,
+                '\n'.join(query['sql'] for query in queries.captured_queries),
+            ))
+        if self.CHECK_SECONDS:
+            self.assertLessEqual(
+                elapsed, max_seconds,
+                '%s took %.2f seconds, but its budget is %d' % (name, elapsed, max_seconds),
+            )
+        return result
+
+    def _get(self, name, url, user=None):
+        self.client.force_login(user or self.checker)
+        response = self._assert_within_budget(name, lambda: self.client.get(url))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def _school_url(self, view_name, **kwargs):
+        return reverse(view_name, kwargs={'school_name': self.school.short_name, **kwargs})
+
+    def test_entrance_home(self):
+        self._get('entrance_home', self._school_url('school:user'), user=self.participant)
+
+    def test_exam(self):
+        response = self._get('exam', self._school_url('school:entrance:exam'), user=self.participant)
+        tasks = response.context['categories_with_tasks'][0][1]
+        self.assertEqual(len(tasks), len(self.tasks))
+        # The last answer of the participant to each test task is correct
+        self.assertEqual(
+            [task.is_solved for task in tasks if isinstance(task, models.TestEntranceExamTask)],
+            [True] * self.TEST_TASKS_COUNT,
+        )
+
+    def test_check_group(self):
+        response = self._get(
+            'check_group',
+            self._school_url('school:entrance:check_group', group_name=self.checking_group.short_name),
+        )
+        tasks = response.context['tasks']
+        self.assertEqual(len(tasks), self.FILE_TASKS_COUNT)
+        self.assertEqual(
+            response.context['total_solutions_count'], self.USERS_COUNT * self.SOLVED_FILE_TASKS_PER_USER,
+        )
+        self.assertEqual(
+            response.context['total_checks_count'], self.USERS_COUNT // 2 * self.SOLVED_FILE_TASKS_PER_USER,
+        )
+        self.assertEqual(response.context['total_teachers_count'], 1)
+        checks_per_task = self.USERS_COUNT // 2 * self.SOLVED_FILE_TASKS_PER_USER // self.FILE_TASKS_COUNT
+        self.assertTrue(all(len(task.checks) == min(checks_per_task, 20) for task in tasks))
+
+    def test_check_task(self):
+        self.client.force_login(self.checker)
+        url = self._school_url(
+            'school:entrance:check_task',
+            group_name=self.checking_group.short_name,
+            task_id=self.file_tasks[0].id,
+        )
+        response = self._assert_within_budget('check_task', lambda: self.client.get(url))
+        self.assertEqual(response.status_code, 302)
+        lease = models.CheckingQueueElement.get_lease(self.checker)
+        self.assertEqual(lease.task_id, self.file_tasks[0].id)
+        self.assertFalse(models.CheckedSolution.objects.filter(solution__user_id=lease.user_id).exists())
+
+    def test_checking_group_users(self):
+        self._get(
+            'checking_group_users',
+            self._school_url('school:entrance:checking_group_users', group_name=self.checking_group.short_name),
+        )
+
+    def test_enrolling_data(self):
+        response = self._get('enrolling_data', self._school_url('school:entrance:enrolling_data'))
+        self.assertEqual(response.json()['recordsTotal'], self.USERS_COUNT)
+
+    def test_results_data(self):
+        response = self._get('results_data', self._school_url('school:entrance:results_data'))
+        data = response.json()['data']
+        self.assertEqual(len(data), self.USERS_COUNT)
+        self.assertEqual(data[0]['session'], 'Июль')
+        self.assertEqual(data[0]['parallel'], 'C')
+
+    def test_group_members_export(self):
+        groups.models.GroupAccessForUser.objects.create(
+            to_group=self.checking_group.group,
+            user=self.checker,
+            access_type=groups.models.GroupAccess.Type.LIST_MEMBERS,
+        )
+        response = self._get(
+            'group_members_export',
+            self._school_url('school:groups:export_group', group_name=self.checking_group.short_name),
+        )
+        # Table is built while the response is being sent
+        self._assert_within_budget('group_members_export', lambda: b''.join(response.streaming_content))
+
+    def test_complete_enrolling_table_export(self):
+        job = models.EnrollingTableExportJob.objects.create(school=self.school, base_url='http://localhost/')
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as output, \
+                override_settings(SISTEMA_ENROLLING_EXPORTS_DIR=tempfile.gettempdir()):
+            self._assert_within_budget(
+                'complete_enrolling_table_export',
+                lambda: export.ExportCompleteEnrollingTable().build(job, output.name, lambda *args: None),
+            )
+
+
+@pytest.mark.benchmark
+class QueryBudgetsBenchmarkTestCase(QueryBudgetsTestCase):
+    USERS_COUNT = 2000
+    CHECK_SECONDS = True
@@ -0,0 +1,67 @@
+"""Tests for cached rendered blocks of entrance steps on the home page"""
+
+from unittest import mock
+
+from django.core.cache import cache as django_cache
+from django.test import TestCase
+from django.urls import reverse
+from htmlmin.minify import html_minify
+
+import home.models
+import users.models
+from modules.entrance import models
+from modules.entrance.home import blocks
+from modules.entrance.home.blocks import EntranceStepsHomePageBlock
+from modules.entrance.tests import helpers
+
+
+@helpers.without_profiling_middlewares
+class EntranceStepBlocksCacheTestCase(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.school = helpers.create_school('step_blocks', is_public=True)
+        home.models.AbstractHomePageBlock.objects.filter(school=self.school).delete()
+        EntranceStepsHomePageBlock.objects.create(school=self.school, order=1)
+        self.step = models.SelectEnrollmentTypeEntranceStep.objects.create(
+            school=self.school, order=1, text_step_is_not_passed='Выберите способ поступления',
+            text_on_moderation='', text_passed_moderation='', text_failed_moderation='',
+        )
+        self.enrollment_type = models.EnrollmentType.objects.create(
+            step=self.step, text='По вступительной работе', needs_moderation=False,
+        )
+
+        self.user = users.models.User.objects.create_user('student', 'student@example.com', 'pass')
+        users.models.UserProfile.objects.create(user=self.user, first_name='Имя', last_name='Фамилия')
+        self.client.force_login(self.user)
+        self.url = reverse('school:user', kwargs={'school_name': self.school.short_name})
+
+    def _get_content(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertNotIn(blocks.CSRF_TOKEN_PLACEHOLDER, content)
+        self.assertNotIn('sistema-minified-fragment', content)
+        return content
+
+    def test_rendered_blocks_are_cached(self):
+        with mock.patch('modules.entrance.home.blocks.html_minify', wraps=html_minify) as minify:
+            first_content = self._get_content()
+            second_content = self._get_content()
+        self.assertEqual(minify.call_count, 1)
+        self.assertIn('Выберите способ поступления', first_content)
+        self.assertIn('name="csrfmiddlewaretoken"', second_content)
+
+    def test_changes_invalidate_rendered_blocks(self):
+        self._get_content()
+
+        self.step.text_step_is_not_passed = 'Способ поступления ещё не выбран'
+        self.step.save()
+        self.assertIn('Способ поступления ещё не выбран', self._get_content())
+
+        models.SelectedEnrollmentType.objects.create(
+            user=self.user, step=self.step, enrollment_type=self.enrollment_type,
+            is_moderated=True, is_approved=True,
+        )
+        content = self._get_content()
+        self.assertNotIn('Способ поступления ещё не выбран', content)
+        self.assertIn('done-icon', content)
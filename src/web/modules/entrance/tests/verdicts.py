@@ -0,0 +1,87 @@
+"""Tests for polling verdicts of entrance exam solutions"""
+
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+import modules.ejudge.models as ejudge_models
+import users.models
+from modules.entrance import models
+from modules.entrance.tests import helpers
+
+
+@helpers.without_profiling_middlewares
+class TaskVerdictsTestCase(TestCase):
+    def setUp(self):
+        school = helpers.create_school('verdicts', is_public=True)
+        self.task = helpers.create_program_task(helpers.create_exam(school), 1)
+        self.language = ejudge_models.ProgrammingLanguage.objects.create(
+            short_name='cpp', name='C++', ejudge_id=1,
+        )
+        self.user = users.models.User.objects.create_user('student', 'student@example.com', 'pass')
+        users.models.UserProfile.objects.create(user=self.user, first_name='Имя', last_name='Фамилия')
+        self.client.force_login(self.user)
+        self.url = reverse('school:entrance:task_verdicts', kwargs={
+            'school_name': school.short_name, 'task_id': self.task.id,
+        })
+
+    def _send_solution(self):
+        queue_element = ejudge_models.QueueElement.objects.create(
+            ejudge_contest_id=1, ejudge_problem_id=1, file_name='solution.cpp',
+        )
+        models.ProgramEntranceExamTaskSolution.objects.create(
+            task=self.task, user=self.user, solution='solution.cpp',
+            ejudge_queue_element=queue_element, language=self.language,
+        )
+        return queue_element
+
+    def _check(self, queue_element, result):
+        checking_result = ejudge_models.SolutionCheckingResult.objects.create(result=result)
+        queue_element.submission = ejudge_models.Submission.objects.create(
+            ejudge_contest_id=1, ejudge_submit_id=queue_element.id, result=checking_result,
+        )
+        queue_element.status = ejudge_models.QueueElement.Status.CHECKED
+        queue_element.save()
+
+    def test_not_modified_until_solutions_change(self):
+        first = self._send_solution()
+        second = self._send_solution()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['is_checking'])
+        self.assertFalse(data['is_passed'])
+        self.assertEqual(response['ETag'], '"%s"' % data['version'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self._check(first, ejudge_models.CheckingResult.Result.WRONG_ANSWER_ERROR)
+        self._check(second, ejudge_models.CheckingResult.Result.OK)
+        response = self.client.get(self.url, {'since': data['version']})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertFalse(data['is_checking'])
+        self.assertTrue(data['is_passed'])
+
+        self._send_solution()
+        data = self.client.get(self.url, {'since': data['version']}).json()
+        self.assertTrue(data['is_checking'])
+
+    @mock.patch('time.sleep')
+    def test_wait_is_ignored_by_default(self, sleep):
+        version = self.client.get(self.url).json()['version']
+        response = self.client.get(self.url, {'since': version, 'wait': 20})
+        self.assertEqual(response.status_code, 304)
+        sleep.assert_not_called()
+
+    @override_settings(SISTEMA_ENTRANCE_VERDICTS_MAX_WAIT=1)
+    @mock.patch('modules.entrance.views.TASK_VERDICTS_POLL_INTERVAL', 0.1)
+    def test_not_modified_after_waiting(self):
+        version = self.client.get(self.url).json()['version']
+        with mock.patch('time.sleep', wraps=time.sleep) as sleep:
+            response = self.client.get(self.url, {'since': version, 'wait': 20})
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(sleep.called)
@@ -1,14 +1,16 @@
 import modules.topics.models
 from sistema.cache import cache
+from . import cache_tags
 from . import models
 
 
-# TODO(artemtab): I've made this timeout 10 days long as a workaround for
-#     checking 2017. We need to be able to see and export enrolling table
-#     without waiting forever. There shouldn't be any harm in doing that,
-#     because entrance levels do not change after exam is over.
-# TODO(andgein): In 2018 I've reverted timeout back to 30 seconds
-@cache(60)
+def _get_entrance_level_tags(school, user):
+    return [cache_tags.school_levels(school.id), cache_tags.user_levels(user.id)]
+
+
+# Levels are invalidated when the school's levels and limiters or the user's
+# data used by limiters change (see cache_tags), so they can be cached for long
+@cache(3600, tags=_get_entrance_level_tags)
 def get_base_entrance_level(school, user):
     override = (models.EntranceLevelOverride.objects
                 .filter(school=school, user=user).first())
@@ -18,7 +20,7 @@ def get_base_entrance_level(school, user):
     return _get_entrance_level_by_limiters(school, user, allow_recommendation_only_limiters=False)
 
 
-@cache(60)
+@cache(3600, tags=_get_entrance_level_tags)
 def get_recommended_entrance_level(school, user):
     return _get_entrance_level_by_limiters(school, user, allow_recommendation_only_limiters=True)
 
@@ -37,6 +39,80 @@ def _get_entrance_level_by_limiters(school, user, allow_recommendation_only_limi
     return current_limit.min_level
 
 
+class UserEntranceLevels:
+    def __init__(self, base, recommended, selected, maximum_issued):
+        self.base = base
+        self.recommended = recommended
+        # None if user hasn't selected the level
+        self.selected = selected
+        self.maximum_issued = maximum_issued
+
+
+def get_entrance_levels_for_users(school, users):
+    """
+    Computes base, recommended, selected and maximum issued entrance levels
+    for many users at once. Number of queries doesn't depend on the number
+    of users.
+    :return: dict {user_id: UserEntranceLevels}
+    """
+    users = list(users)
+    user_ids = [user.id for user in users]
+    minimal_level = school.entrance_levels.order_by('order').first()
+
+    overrides = {
+        override.user_id: override.entrance_level
+        for override in models.EntranceLevelOverride.objects.filter(
+            school=school, user_id__in=user_ids
+        ).select_related('entrance_level')
+    }
+
+    base_limits = {user_id: models.EntranceLevelLimit(None) for user_id in user_ids}
+    recommended_limits = {user_id: models.EntranceLevelLimit(None) for user_id in user_ids}
+    for limiter in school.entrance_level_limiters.all():
+        limits = limiter.get_limits_for_users(users)
+        for user_id in user_ids:
+            recommended_limits[user_id].update_with_other(limits[user_id])
+            if not limiter.is_recommendation_only_limiter:
+                base_limits[user_id].update_with_other(limits[user_id])
+
+    # The last selected level is used, so order by creation time
+    selected_levels = {
+        selected_level.user_id: selected_level.level
+        for selected_level in models.SelectedEntranceLevel.objects.filter(
+            school=school, user_id__in=user_ids
+        ).order_by('created_at').select_related('level')
+    }
+
+    maximum_upgrades = {}
+    for upgrade in models.EntranceLevelUpgrade.objects.filter(
+        user_id__in=user_ids, upgraded_to__school=school
+    ).select_related('upgraded_to'):
+        current = maximum_upgrades.get(upgrade.user_id)
+        if current is None or upgrade.upgraded_to > current:
+            maximum_upgrades[upgrade.user_id] = upgrade.upgraded_to
+
+    result = {}
+    for user_id in user_ids:
+        base = overrides.get(user_id)
+        if base is None:
+            base = base_limits[user_id].min_level or minimal_level
+        recommended = recommended_limits[user_id].min_level or minimal_level
+
+        selected = None
+        if user_id in selected_levels:
+            selected = selected_levels[user_id]
+            if selected is None or base > selected:
+                selected = base
+
+        maximum_issued = base
+        maximum_upgrade = maximum_upgrades.get(user_id)
+        if maximum_upgrade is not None and maximum_upgrade > base:
+            maximum_issued = maximum_upgrade
+
+        result[user_id] = UserEntranceLevels(base, recommended, selected, maximum_issued)
+    return result
+
+
 def get_topics_entrance_level(school, user):
     # Create limiter, but don't save it to database
     # Actually, we could get limiter from the database, but it's not guaranteed
@@ -47,6 +123,20 @@ def get_topics_entrance_level(school, user):
     return fake_limiter.get_limit(user).min_level
 
 
+def get_topics_entrance_levels_for_users(school, users):
+    """
+    Same as get_topics_entrance_level(), but for many users at once.
+    :return: dict {user_id: EntranceLevel}
+    """
+    fake_limiter = modules.topics.models.TopicsEntranceLevelLimiter(
+        school=school
+    )
+    return {
+        user_id: limit.min_level
+        for user_id, limit in fake_limiter.get_limits_for_users(users).items()
+    }
+
+
 def get_maximum_issued_entrance_level(school, user, base_level):
     user_upgrades = models.EntranceLevelUpgrade.objects.filter(user=user, upgraded_to__school=school)
     maximum_upgrade = user_upgrades.order_by('-upgraded_to__order').first()
@@ -95,7 +185,7 @@ def get_entrance_tasks(school, user, base_level):
 
     issued_tasks = set()
     for level in issued_levels:
-        for task in level.tasks.all():
+        for task in level.tasks.select_related('category', 'exam', 'exam__school'):
             issued_tasks.add(task)
 
     return list(sorted(issued_tasks, key=lambda x: x.order))
@@ -10,6 +10,7 @@ urlpatterns = [
     path('exam/task/<int:task_id>/', views.task, name='task'),
     path('exam/task/<int:task_id>/submit/', views.submit, name='submit'),
     path('exam/task/<int:task_id>/submits/', views.task_solutions, name='task_solutions'),
+    path('exam/task/<int:task_id>/verdicts/', views.task_verdicts, name='task_verdicts'),
     path('exam/upgrade_panel/', views.upgrade_panel, name='upgrade_panel'),
     path('exam/upgrade/', views.upgrade, name='upgrade'),
 
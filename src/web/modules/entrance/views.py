@@ -1,11 +1,14 @@
 import operator
+import time
 
 import django.urls
 import ipware.ip
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.db.models import Prefetch, Min
 from django.http.response import (HttpResponseNotFound,
+                                  HttpResponseNotModified,
                                   JsonResponse,
                                   HttpResponseForbidden)
 from django.shortcuts import render, redirect, get_object_or_404
@@ -67,9 +70,41 @@ def get_entrance_level_and_tasks(school, user):
         if task.visible_only_for_group is None or task.visible_only_for_group.is_user_in_group(user)
     ]
 
+    # Tasks share instances of their categories and exams,
+    # so dates of categories and of the exam are loaded only once
+    categories = {}
+    exams = {}
+    for task in tasks:
+        task.category = categories.setdefault(task.category_id, task.category)
+        task.exam = exams.setdefault(task.exam_id, task.exam)
+
     return level, tasks
 
 
+def _get_entrance_status(entrance_statuses):
+    # Statuses with their sessions and parallels are prefetched in
+    # EntrancedUsersTable.__init__(), so use all() instead of get() or filter() to avoid
+    # a query for each row. There is one status per school and user
+    statuses = entrance_statuses.all()
+    if not statuses:
+        raise models.EntranceStatus.DoesNotExist()
+    return statuses[0]
+
+
+def _render_selected_or_all(entrance_statuses, field_name):
+    status = _get_entrance_status(entrance_statuses)
+    sessions_and_parallels = status.sessions_and_parallels.all()
+    for session_and_parallel in sessions_and_parallels:
+        if session_and_parallel.selected_by_user:
+            value = getattr(session_and_parallel, field_name)
+            return value.name if value else ''
+    return ', '.join(set(
+        getattr(session_and_parallel, field_name).name
+        for session_and_parallel in sessions_and_parallels
+        if getattr(session_and_parallel, field_name) is not None
+    ))
+
+
 class EntrancedUsersTable(frontend.table.Table):
     index = frontend.table.IndexColumn(verbose_name='')
 
@@ -126,7 +161,13 @@ class EntrancedUsersTable(frontend.table.Table):
         ).select_related('profile').prefetch_related(
             Prefetch(
                 'entrance_statuses',
-                models.EntranceStatus.objects.filter(school=school)),
+                models.EntranceStatus.objects.filter(school=school).prefetch_related(
+                    Prefetch(
+                        'sessions_and_parallels',
+                        models.EnrolledToSessionAndParallel.objects
+                            .select_related('session', 'parallel')
+                            .order_by('id')),
+                )),
             Prefetch(
                 'absence_reasons',
                 models.AbstractAbsenceReason.objects.filter(school=school)),
@@ -147,32 +188,10 @@ class EntrancedUsersTable(frontend.table.Table):
         return ', '.join(parts)
 
     def render_session(self, value):
-        # TODO: will it be filtered?
-        status = value.get()
-        sessions_and_parallels = status.sessions_and_parallels.all()
-        selected_session = sessions_and_parallels.filter(selected_by_user=True).first()
-        if selected_session is not None:
-            return selected_session.session.name if selected_session.session else ''
-        return ', '.join(set(
-            sessions_and_parallels
-                .filter(session__isnull=False)
-                .order_by('session_id')
-                .values_list('session__name', flat=True)
-        ))
+        return _render_selected_or_all(value, 'session')
 
     def render_parallel(self, value):
-        # TODO: will it be filtered?
-        status = value.get()
-        sessions_and_parallels = status.sessions_and_parallels.all()
-        selected_parallel = sessions_and_parallels.filter(selected_by_user=True).first()
-        if selected_parallel is not None:
-            return selected_parallel.parallel.name if selected_parallel.parallel else ''
-        return ', '.join(set(
-            sessions_and_parallels
-                .filter(parallel__isnull=False)
-                .order_by('parallel_id')
-                .values_list('parallel__name', flat=True)
-        ))
+        return _render_selected_or_all(value, 'parallel')
 
     def render_enrolled_status(self, record):
         absence_reasons = record.absence_reasons.all()
@@ -180,7 +199,7 @@ class EntrancedUsersTable(frontend.table.Table):
         if absence_reason is not None:
             return str(absence_reason)
 
-        entrance_status = record.entrance_statuses.get()
+        entrance_status = _get_entrance_status(record.entrance_statuses)
         if not entrance_status.is_approved:
             return 'Участие не подтверждено'
 
@@ -199,12 +218,15 @@ def exam(request, selected_task_id=None):
 
     # Order task by type and order
     tasks = sorted(tasks, key=lambda t: (t.type_title, t.order))
+    models.EntranceExamTask.load_user_solutions(tasks, request.user)
+    language_choices = None
     for task in tasks:
-        task.user_solutions = list(
-            task.solutions.filter(user=request.user).order_by('-created_at'))
-        task.is_accepted = task.is_accepted_for_user(request.user)
-        task.is_solved = task.is_solved_by_user(request.user)
         task.form = task.get_form_for_user(request.user)
+        # Forms of all program tasks have the same list of languages
+        if 'language' in task.form.fields:
+            if language_choices is None:
+                language_choices = list(task.form.fields['language'].choices)
+            task.form.fields['language'].choices = language_choices
 
     if selected_task_id is None and len(tasks) > 0:
         selected_task_id = tasks[0].id
@@ -374,6 +396,56 @@ def task_solutions(request, task_id):
     return HttpResponseNotFound()
 
 
+# How often task_verdicts() checks for new verdicts while waiting, in seconds
+TASK_VERDICTS_POLL_INTERVAL = 1
+
+
+@login_required
+def task_verdicts(request, task_id):
+    """
+    Cheap alternative to task_solutions() for polling verdicts of ejudge tasks.
+    Returns JSON with the new version and the checking status of the task if
+    any solution has changed since the version passed in the If-None-Match
+    header or in the `since` parameter, and 304 Not Modified otherwise. Then
+    the client re-renders solutions by task_solutions(). With the `wait`
+    parameter (in seconds) the request waits for a change before returning
+    304, but no longer than settings.SISTEMA_ENTRANCE_VERDICTS_MAX_WAIT.
+    """
+    task = get_object_or_404(models.EntranceExamTask, id=task_id)
+    if not isinstance(task, models.EjudgeEntranceExamTask):
+        return HttpResponseNotFound()
+
+    known_version = request.GET.get('since')
+    if 'If-None-Match' in request.headers:
+        known_version = request.headers['If-None-Match'].strip('"')
+    try:
+        wait = min(max(int(request.GET.get('wait', 0)), 0), settings.SISTEMA_ENTRANCE_VERDICTS_MAX_WAIT)
+    except ValueError:
+        wait = 0
+
+    wait_until = time.monotonic() + wait
+    version = task.get_user_solutions_version(request.user)
+    while version == known_version and time.monotonic() < wait_until:
+        time.sleep(TASK_VERDICTS_POLL_INTERVAL)
+        version = task.get_user_solutions_version(request.user)
+
+    if version == known_version:
+        response = HttpResponseNotModified()
+    else:
+        solutions = list(
+            task.solution_class.objects
+            .filter(task=task, user=request.user)
+            .select_related('ejudge_queue_element__submission__result')
+        )
+        response = JsonResponse({
+            'version': version,
+            'is_checking': any(s.result is None for s in solutions),
+            'is_passed': task.is_solved_by_solutions(solutions),
+        })
+    response['ETag'] = '"%s"' % version
+    return response
+
+
 @login_required
 def upgrade_panel(request):
     base_level, _ = get_entrance_level_and_tasks(request.school, request.user)
@@ -13,12 +13,14 @@ class EntranceStaffInterface(sistema.staff.StaffInterface):
         self.student_comments_viewer = groups.is_user_in_group(
             request.user,
             study_results_groups.STUDENT_COMMENTS_VIEWERS,
-            request.school
+            request.school,
+            request=request,
         )
         self.student_comments_editor = groups.is_user_in_group(
             request.user,
             study_results_groups.STUDENT_COMMENTS_EDITORS,
-            request.school
+            request.school,
+            request=request,
         )
 
     def get_sidebar_menu(self):
@@ -6,14 +6,19 @@ class TopicsEntranceLevelLimiter(levels.EntranceLevelLimiter):
     def __str__(self):
         return "Лимитер по тематической анкете"
 
-    def get_limit(self, user):
+    def _get_questionnaire(self):
         if not hasattr(self.school, 'topicquestionnaire'):
             raise Exception(
                 '{}.{}:cannot use TopicsEntranceLevelLimiter without topics '
                 'questionnaire for this school'
                     .format(self.__module__, self.__class__.__name__))
 
-        questionnaire = self.school.topicquestionnaire
+        return self.school.topicquestionnaire
 
+    def get_limit(self, user):
         return models.TopicsEntranceLevelLimit.get_limit(
-            user=user, questionnaire=questionnaire)
+            user=user, questionnaire=self._get_questionnaire())
+
+    def get_limits_for_users(self, users):
+        return models.TopicsEntranceLevelLimit.get_limits_for_users(
+            users=users, questionnaire=self._get_questionnaire())
@@ -794,13 +794,60 @@ class TopicsEntranceLevelLimit(models.Model):
             cls.objects.create(user=user, questionnaire=questionnaire, level=level)
         return entrance_levels.EntranceLevelLimit(level)
 
+    @classmethod
+    def get_limits_for_users(cls, *, users, questionnaire) -> dict:
+        """
+        Returns dict {user_id: EntranceLevelLimit}. Cached limits are loaded
+        with one query, limits for other users are computed for all of them
+        at once by compute_levels_for_users().
+        """
+        cached_levels = {
+            cached_limit.user_id: cached_limit.level
+            for cached_limit in (
+                cls.objects
+                .filter(user_id__in=[user.id for user in users], questionnaire=questionnaire)
+                .select_related('level'))
+        }
+
+        not_cached_users = [user for user in users if user.id not in cached_levels]
+        computed_levels = cls.compute_levels_for_users(
+            users=not_cached_users, questionnaire=questionnaire)
+
+        # Same as get_limit(): cache levels only for finished questionnaires
+        finished_user_ids = set(UserQuestionnaireStatus.objects.filter(
+            questionnaire=questionnaire,
+            user_id__in=[user.id for user in not_cached_users],
+            status=UserQuestionnaireStatus.Status.FINISHED,
+        ).values_list('user_id', flat=True))
+        cls.objects.bulk_create([
+            cls(user_id=user_id, questionnaire=questionnaire, level=level)
+            for user_id, level in computed_levels.items()
+            if user_id in finished_user_ids
+        ], ignore_conflicts=True)
+
+        levels = {**cached_levels, **computed_levels}
+        return {user.id: entrance_levels.EntranceLevelLimit(levels[user.id]) for user in users}
+
     @classmethod
     def compute_level(cls, *, user, questionnaire) -> entrance_models.EntranceLevel:
+        return cls.compute_levels_for_users(users=[user], questionnaire=questionnaire)[user.id]
+
+    @classmethod
+    def compute_levels_for_users(cls, *, users, questionnaire) -> dict:
+        """
+        Returns dict {user_id: EntranceLevel}. Number of queries doesn't
+        depend on the number of users.
+        """
+        user_ids = [user.id for user in users]
+        if not user_ids:
+            return {}
+
         user_marks = (
             UserMark.objects
-            .filter(user=user,
+            .filter(user_id__in=user_ids,
                     scale_in_topic__topic__questionnaire=questionnaire)
-            .prefetch_related('scale_in_topic__topic__tags'))
+            .prefetch_related('scale_in_topic__scale_label_group__scale',
+                              'scale_in_topic__topic__tags'))
 
         requirements = (
             EntranceLevelRequirement.objects
@@ -810,6 +857,7 @@ class TopicsEntranceLevelLimit(models.Model):
             requirements, operator.attrgetter('tag_id'))
         requirements_by_level = sistema.helpers.group_by(
             requirements, operator.attrgetter('entrance_level'))
+        # (user_id, requirement_id) -> marks
         sum_marks_for_requirements = collections.defaultdict(int)
         max_marks_for_requirements = collections.defaultdict(int)
 
@@ -820,29 +868,35 @@ class TopicsEntranceLevelLimit(models.Model):
 
             for tag in topic_tags:
                 for requirement in requirements_by_tag[tag.id]:
-                    sum_marks_for_requirements[requirement.id] += mark.mark
-                    max_marks_for_requirements[requirement.id] += (
+                    key = (mark.user_id, requirement.id)
+                    sum_marks_for_requirements[key] += mark.mark
+                    max_marks_for_requirements[key] += (
                         scale_in_topic.scale.max_mark)
 
         # Если всё плохо, самый просто уровень считаем выполненным — иначе
         # нечего будет решать
-        maximum_satisfied_level = (
+        minimal_level = (
             entrance_models.EntranceLevel.objects
             .filter(school=questionnaire.school)
             .order_by('order').first())
-        for level, requirements_for_level in requirements_by_level.items():
-            all_satisfied = True
-            for requirement in requirements_for_level:
-                all_satisfied = all_satisfied and requirement.satisfy(
-                    sum_marks_for_requirements[requirement.id],
-                    max_marks_for_requirements[requirement.id],
-                )
-
-            if all_satisfied:
-                if level.order > maximum_satisfied_level.order:
-                    maximum_satisfied_level = level
-
-        return maximum_satisfied_level
+
+        result = {}
+        for user_id in user_ids:
+            maximum_satisfied_level = minimal_level
+            for level, requirements_for_level in requirements_by_level.items():
+                all_satisfied = True
+                for requirement in requirements_for_level:
+                    all_satisfied = all_satisfied and requirement.satisfy(
+                        sum_marks_for_requirements[(user_id, requirement.id)],
+                        max_marks_for_requirements[(user_id, requirement.id)],
+                    )
+
+                if all_satisfied:
+                    if level.order > maximum_satisfied_level.order:
+                        maximum_satisfied_level = level
+            result[user_id] = maximum_satisfied_level
+
+        return result
 
 
 @receiver(post_save, sender=UserQuestionnaireStatus)
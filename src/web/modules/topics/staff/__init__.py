@@ -22,7 +22,8 @@ class TopicsStaffInterface(sistema.staff.StaffInterface):
         self.is_entrance_admin = groups.is_user_in_group(
             request.user,
             entrance_groups.ADMINS,
-            request.school
+            request.school,
+            request=request,
         )
 
     def get_sidebar_menu(self):
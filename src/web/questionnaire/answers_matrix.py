@@ -0,0 +1,143 @@
+"""
+Answers of many users to all questions of questionnaires, loaded by one scan
+over QuestionnaireAnswer. Used by wide exports instead of querying the answers
+question by question.
+"""
+
+import csv
+
+from sistema.export import PlainExcelColumn
+
+
+class QuestionnaireAnswersMatrix:
+    """
+    Dense user × question matrix of answers. Rows are `users` in the given
+    order, columns are questions of `questionnaires` ordered by questionnaire
+    and then by `order`. Questions with the same short_name in several
+    questionnaires share the column.
+
+    Cell is a list of answers of the user: ChoiceQuestionnaireQuestionVariant
+    for choice questions and stored string for other ones.
+    """
+    def __init__(self, questionnaires, users):
+        # It's here to avoid cyclic imports
+        from questionnaire import models
+
+        self.questionnaires = list(questionnaires)
+        self.users = list(users)
+
+        # Questions and variants of all questionnaires are loaded at once.
+        # Schemas would take several queries for each questionnaire
+        questionnaire_ids = [questionnaire.id for questionnaire in self.questionnaires]
+        position_by_questionnaire_id = {id_: position for position, id_ in enumerate(questionnaire_ids)}
+        questions = sorted(
+            models.AbstractQuestionnaireQuestion.objects
+            .filter(questionnaire_id__in=questionnaire_ids)
+            .order_by('order'),
+            key=lambda question: position_by_questionnaire_id[question.questionnaire_id],
+        )
+        variants_by_id = {
+            str(variant.id): variant
+            for variant in models.ChoiceQuestionnaireQuestionVariant.objects
+            .filter(question__questionnaire_id__in=questionnaire_ids)
+        }
+
+        self.questions = []
+        self._cells_by_short_name = {}
+        questions_by_key = {}
+        for question in questions:
+            questions_by_key[(question.questionnaire_id, question.short_name)] = question
+            if question.short_name not in self._cells_by_short_name:
+                self.questions.append(question)
+                self._cells_by_short_name[question.short_name] = [None] * len(self.users)
+
+        row_by_user_id = {user.id: row for row, user in enumerate(self.users)}
+        answers = (
+            models.QuestionnaireAnswer.objects
+            .filter(questionnaire_id__in=questionnaire_ids, user__in=users)
+            .order_by('id')
+            .values_list('questionnaire_id', 'user_id', 'question_short_name', 'answer')
+        )
+        for questionnaire_id, user_id, short_name, answer in answers.iterator():
+            question = questions_by_key.get((questionnaire_id, short_name))
+            # Question could be deleted from the time when user answered it
+            if question is None:
+                continue
+            if isinstance(question, models.ChoiceQuestionnaireQuestion):
+                # Ignore if user didn't select any variant. Variant could be
+                # deleted as well as the question
+                if answer not in variants_by_id:
+                    continue
+                answer = variants_by_id[answer]
+
+            cells = self._cells_by_short_name[short_name]
+            row = row_by_user_id[user_id]
+            if cells[row] is None:
+                cells[row] = []
+            cells[row].append(answer)
+
+    @classmethod
+    def for_school(cls, school, users):
+        """ Matrix for all questionnaires of the school """
+        # It's here to avoid cyclic imports
+        from questionnaire import models
+
+        questionnaires = models.Questionnaire.objects.filter(school=school).order_by('id')
+        return cls(questionnaires, users)
+
+    @property
+    def short_names(self):
+        return [question.short_name for question in self.questions]
+
+    def has_question(self, short_name):
+        return short_name in self._cells_by_short_name
+
+    def iter_answers(self, short_name):
+        """ Yields list of user's answers for each user """
+        return (cell or [] for cell in self._cells_by_short_name[short_name])
+
+    def get_answers(self, short_name):
+        """ Returns list of users' answers for each user """
+        return list(self.iter_answers(short_name))
+
+    def iter_column(self, short_name, separator=', '):
+        """
+        Yields answers formatted as strings for each user. Several answers
+        (e.g. for multiple choice questions) are joined by `separator`.
+        """
+        return (self._format_cell(cell, separator) for cell in self._cells_by_short_name[short_name])
+
+    def get_column(self, short_name, separator=', '):
+        """ Same as iter_column(), but returns a list """
+        return list(self.iter_column(short_name, separator))
+
+    @staticmethod
+    def _format_cell(cell, separator):
+        if cell is None:
+            return ''
+        return separator.join(answer if isinstance(answer, str) else answer.text for answer in cell)
+
+    def iter_rows(self, separator=', '):
+        """
+        Yields (user, [formatted answers for all questions]) row by row
+        """
+        columns = [self._cells_by_short_name[question.short_name] for question in self.questions]
+        for row, user in enumerate(self.users):
+            yield user, [self._format_cell(column[row], separator) for column in columns]
+
+    def write_csv(self, file):
+        """ Writes the matrix to the text file row by row """
+        writer = csv.writer(file)
+        writer.writerow(['user_id'] + self.short_names)
+        for user, cells in self.iter_rows():
+            writer.writerow([user.id] + cells)
+
+    def get_excel_columns(self, separator=', '):
+        """
+        Returns columns for sistema.export.write_columns(), one per
+        question. Cells are formatted lazily while the sheet is written.
+        """
+        return [
+            PlainExcelColumn(name=question.short_name, data=self.iter_column(question.short_name, separator))
+            for question in self.questions
+        ]
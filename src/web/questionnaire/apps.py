@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class QuestionnaireConfig(AppConfig):
+    name = 'questionnaire'
+
+    def ready(self):
+        from questionnaire import schema
+        schema.connect_signals()
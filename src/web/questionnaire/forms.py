@@ -21,11 +21,10 @@ class ChoiceQuestionField(forms.Field):
     def update_with_initial(self, initial):
         # Disable question if user has checked variant which is marked as `disable_question_if_chosen`
         if initial:
-            if self.question.is_multiple:
-                qs = self.question.variants.filter(id__in=initial, disable_question_if_chosen=True)
-            else:
-                qs = self.question.variants.filter(id=initial, disable_question_if_chosen=True)
-            if qs.exists():
+            initial_ids = initial if self.question.is_multiple else [initial]
+            initial_ids = {str(variant_id) for variant_id in initial_ids}
+            if any(str(variant.id) in initial_ids and variant.disable_question_if_chosen
+                   for variant in self.question.ordered_variants):
                 self.disabled = True
 
 
@@ -0,0 +1,43 @@
+from django.core.management import base as management_base
+import xlsxwriter
+
+from questionnaire.answers_matrix import QuestionnaireAnswersMatrix
+from sistema.export import PlainExcelColumn, write_columns
+import schools.models
+import users.models
+
+
+class Command(management_base.BaseCommand):
+    help = 'Export answers to all questionnaires of the school to .csv or .xlsx file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('school', help='short name of the school')
+        parser.add_argument('output_file', help='name of the output .csv or .xlsx file')
+
+    def handle(self, *args, **options):
+        school = schools.models.School.objects.filter(short_name=options['school']).first()
+        if school is None:
+            raise management_base.CommandError('School "%s" not found' % options['school'])
+
+        respondents = (
+            users.models.User.objects
+            .filter(questionnaire_answers__questionnaire__school=school)
+            .distinct()
+            .order_by('id')
+        )
+        matrix = QuestionnaireAnswersMatrix.for_school(school, respondents)
+
+        output_file_name = options['output_file']
+        if output_file_name.endswith('.xlsx'):
+            # Rows are flushed to the disk as soon as they are written
+            book = xlsxwriter.Workbook(output_file_name, {'constant_memory': True})
+            sheet = book.add_worksheet(school.name[:31])
+            columns = [PlainExcelColumn(name='user_id', cell_width=7, data=[user.id for user in matrix.users])]
+            write_columns(sheet, columns + matrix.get_excel_columns(), frozen_columns=1)
+            book.close()
+        else:
+            with open(output_file_name, 'w', newline='', encoding='utf-8') as output_file:
+                matrix.write_csv(output_file)
+        self.stdout.write('Exported answers of %d users to %d questions' % (
+            len(matrix.users), len(matrix.questions)
+        ))
@@ -1,8 +1,10 @@
 from django.db import models, IntegrityError
+from django.db.models import Q
 
+import groups.materialized
 import groups.models
 from questionnaire.models import Questionnaire, ChoiceQuestionnaireQuestionVariant, \
-    QuestionnaireAnswer
+    QuestionnaireAnswer, UserQuestionnaireStatus
 
 
 class UsersFilledQuestionnaireGroup(groups.models.AbstractGroup):
@@ -57,3 +59,30 @@ class UsersSelectedQuestionVariantGroup(groups.models.AbstractGroup):
             question_short_name=question.short_name,
             answer=self.variant.id
         ).values_list('user_id', flat=True).distinct()
+
+
+groups.materialized.register_dependency(
+    Questionnaire,
+    lambda questionnaire: UsersNotFilledQuestionnaireGroup.objects.filter(
+        questionnaire_id=questionnaire.id
+    )
+)
+groups.materialized.register_dependency(
+    UserQuestionnaireStatus,
+    lambda status: groups.models.AbstractGroup.objects.filter(
+        Q(usersfilledquestionnairegroup__questionnaire_id=status.questionnaire_id) |
+        Q(usersnotfilledquestionnairegroup__questionnaire_id=status.questionnaire_id)
+    )
+)
+groups.materialized.register_dependency(
+    QuestionnaireAnswer,
+    lambda answer: UsersSelectedQuestionVariantGroup.objects.filter(
+        variant__question__questionnaire_id=answer.questionnaire_id,
+        variant__question__short_name=answer.question_short_name,
+    )
+)
+groups.materialized.register_dependants(
+    lambda group_ids: UsersNotFilledQuestionnaireGroup.objects.filter(
+        questionnaire__must_fill_id__in=group_ids
+    )
+)
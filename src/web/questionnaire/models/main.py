@@ -1,6 +1,5 @@
 import copy
 import datetime
-import operator
 
 import django.forms
 import django.utils.timezone
@@ -17,7 +16,6 @@ import groups.models
 import schools.models
 import sistema.models
 import users.models
-from sistema.helpers import group_by
 import questionnaire.forms as forms
 
 
@@ -103,10 +101,8 @@ class AbstractQuestionnaireBlock(polymorphic.models.PolymorphicModel):
         :param user: User
         :return: True if block is visible, False otherwise
         """
-        group_member_conditions = (
-            self.show_conditions_questionnaireblockgroupmembershowcondition.all()
-        )
-        if not group_member_conditions.exists():
+        group_member_conditions = self.group_member_show_conditions
+        if not group_member_conditions:
             return True
 
         for condition in group_member_conditions:
@@ -154,10 +150,16 @@ class AbstractQuestionnaireBlock(polymorphic.models.PolymorphicModel):
             self.__class__.__name__
         )
 
+    # Show conditions of the blocks from the questionnaire's schema are
+    # preloaded, see questionnaire.schema
+    @cached_property
+    def group_member_show_conditions(self):
+        return list(self.show_conditions_questionnaireblockgroupmembershowcondition.all())
+
     @cached_property
     def show_conditions(self):
         return (
-            list(self.show_conditions_questionnaireblockgroupmembershowcondition.all()) +
+            self.group_member_show_conditions +
             list(self.show_conditions_questionnaireblockvariantcheckedshowcondition.all())
         )
 
@@ -201,8 +203,9 @@ class InlineQuestionnaireBlock(AbstractQuestionnaireBlock):
             )
             child.save()
 
+    @cached_property
     def ordered_children(self):
-        return self.children.order_by('block__order')
+        return list(self.children.order_by('block__order'))
 
 
 class InlineQuestionnaireBlockChild(models.Model):
@@ -389,7 +392,7 @@ class ChoiceQuestionnaireQuestion(AbstractQuestionnaireQuestion):
             attrs = {}
 
         choices = ((v.id, {'label': v.text, 'disabled': v.is_disabled})
-                   for v in self.variants.order_by('order', 'id'))
+                   for v in self.ordered_variants)
 
         attrs['inline'] = self.is_inline
         if self.is_multiple:
@@ -410,6 +413,10 @@ class ChoiceQuestionnaireQuestion(AbstractQuestionnaireQuestion):
             help_text=self.help_text,
         )
 
+    @cached_property
+    def ordered_variants(self):
+        return list(self.variants.order_by('order', 'id'))
+
     def get_variant_text(self, variant_id):
         variant = self.variants.filter(id=variant_id).first()
         if variant is None:
@@ -562,38 +569,35 @@ class Questionnaire(models.Model):
                 self.close_time.passed_for_user(user))
 
     @cached_property
-    def _blocks_with_server_side_show_conditions(self):
-        return (
-            self.blocks.prefetch_related('show_conditions_questionnaireblockgroupmembershowcondition')
-        )
+    def schema(self):
+        """
+        Cached blocks of the questionnaire with their variants and show
+        conditions, see questionnaire.schema.QuestionnaireSchema
+        """
+        # It's here to avoid cyclic imports
+        from questionnaire import schema as questionnaire_schema
+
+        return questionnaire_schema.get_questionnaire_schema(self.id)
 
     @cached_property
     def ordered_blocks(self):
-        return self._blocks_with_server_side_show_conditions.order_by('order')
+        return self.schema.blocks
 
     @cached_property
     def ordered_top_level_blocks(self):
-        return (
-            self._blocks_with_server_side_show_conditions
-                .filter(is_top_level=True).order_by('order')
-        )
+        return [block for block in self.schema.blocks if block.is_top_level]
 
     @cached_property
     def questions(self):
-        return (
-            self._blocks_with_server_side_show_conditions
-                .instance_of(AbstractQuestionnaireQuestion)
-        )
+        return [block for block in self.schema.blocks if block.is_question]
 
     @cached_property
     def ordered_questions(self):
-        return self.questions.order_by('order')
+        return self.questions
 
     @cached_property
     def variant_checked_show_conditions(self):
-        conditions = (QuestionnaireBlockVariantCheckedShowCondition.objects
-                      .filter(block__questionnaire=self))
-        return group_by(conditions, operator.attrgetter('block_id'))
+        return self.schema.variant_checked_show_conditions
 
     def get_form_class(self, user, attrs=None):
         if attrs is None:
@@ -669,12 +673,12 @@ class Questionnaire(models.Model):
         questions = {q.short_name: q for q in self.questions}
         answers = self.answers.filter(user=user)
 
-        variants = list(
-            ChoiceQuestionnaireQuestionVariant.objects.filter(
-                question__questionnaire=self
-            )
-        )
-        variants = {v.id: v for v in variants}
+        variants = {
+            v.id: v
+            for question in questions.values()
+            if isinstance(question, ChoiceQuestionnaireQuestion)
+            for v in question.ordered_variants
+        }
 
         result = {}
         for answer in answers:
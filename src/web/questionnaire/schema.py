@@ -0,0 +1,185 @@
+"""
+Compiled structure of questionnaires: blocks, questions with their variants,
+children of inline blocks and show conditions.
+
+Building of the questionnaire's form used to query all of them on each
+request. Now they are loaded once and cached (see sistema.cache) until any
+of them is changed.
+"""
+
+import operator
+
+from django.apps import apps
+from django.db.models.signals import post_save, post_delete
+
+import groups.models
+from sistema.cache import cache, invalidate_tags
+from sistema.helpers import group_by
+
+
+def questionnaire_schema(questionnaire_id):
+    """Blocks, variants and show conditions of the questionnaire"""
+    return 'questionnaire.schema:%s' % questionnaire_id
+
+
+class QuestionnaireSchema:
+    """
+    Blocks of the questionnaire ordered by `order` with preloaded variants
+    (ChoiceQuestionnaireQuestion.ordered_variants), children
+    (InlineQuestionnaireBlock.ordered_children) and show conditions.
+    Instances are shared between requests, so don't modify them.
+    """
+    def __init__(self, questionnaire_id):
+        # It's here to avoid cyclic imports
+        from questionnaire import models
+
+        self.blocks = list(
+            models.AbstractQuestionnaireBlock.objects
+            .filter(questionnaire_id=questionnaire_id)
+            .order_by('order')
+        )
+        blocks_by_id = {block.id: block for block in self.blocks}
+
+        variants = list(
+            models.ChoiceQuestionnaireQuestionVariant.objects
+            .filter(question__questionnaire_id=questionnaire_id)
+            .order_by('order', 'id')
+        )
+        variants_by_question_id = group_by(variants, operator.attrgetter('question_id'))
+        children = list(
+            models.InlineQuestionnaireBlockChild.objects
+            .filter(parent__questionnaire_id=questionnaire_id)
+            .order_by('block__order')
+        )
+        children_by_parent_id = group_by(children, operator.attrgetter('parent_id'))
+        for child in children:
+            child.block = blocks_by_id[child.block_id]
+        for variant in variants:
+            variant.question = blocks_by_id[variant.question_id]
+
+        group_member_conditions = list(
+            models.QuestionnaireBlockGroupMemberShowCondition.objects
+            .filter(block__questionnaire_id=questionnaire_id)
+        )
+        user_list_questions = [
+            block for block in self.blocks
+            if isinstance(block, models.UserListQuestionnaireQuestion) and block.group_id is not None
+        ]
+        # Groups are loaded with their real classes, because some of them
+        # override is_user_in_group()
+        blocks_groups = groups.models.AbstractGroup.objects.in_bulk(
+            {condition.group_id for condition in group_member_conditions} |
+            {question.group_id for question in user_list_questions}
+        )
+        for condition in group_member_conditions:
+            condition.group = blocks_groups[condition.group_id]
+        for question in user_list_questions:
+            question.group = blocks_groups[question.group_id]
+        group_member_conditions_by_block_id = group_by(
+            group_member_conditions, operator.attrgetter('block_id')
+        )
+
+        variant_checked_conditions = list(
+            models.QuestionnaireBlockVariantCheckedShowCondition.objects
+            .filter(block__questionnaire_id=questionnaire_id)
+            .order_by('id')
+        )
+        variants_by_id = {variant.id: variant for variant in variants}
+        for condition in variant_checked_conditions:
+            condition.variant = variants_by_id[condition.variant_id]
+        self.variant_checked_show_conditions = dict(
+            group_by(variant_checked_conditions, operator.attrgetter('block_id'))
+        )
+
+        for block in self.blocks:
+            block.group_member_show_conditions = group_member_conditions_by_block_id.get(block.id, [])
+            block.show_conditions = (
+                block.group_member_show_conditions +
+                self.variant_checked_show_conditions.get(block.id, [])
+            )
+            if isinstance(block, models.ChoiceQuestionnaireQuestion):
+                block.ordered_variants = variants_by_question_id.get(block.id, [])
+            if isinstance(block, models.InlineQuestionnaireBlock):
+                block.ordered_children = children_by_parent_id.get(block.id, [])
+
+        for condition in variant_checked_conditions:
+            condition.block = blocks_by_id[condition.block_id]
+        for condition in group_member_conditions:
+            condition.block = blocks_by_id[condition.block_id]
+
+
+@cache(3600, tags=lambda questionnaire_id: [questionnaire_schema(questionnaire_id)])
+def get_questionnaire_schema(questionnaire_id):
+    return QuestionnaireSchema(questionnaire_id)
+
+
+def _on_block_changed(instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_tags(questionnaire_schema(instance.questionnaire_id))
+
+
+def _invalidate_schema_of_block(block_id):
+    # It's here to avoid cyclic imports
+    from questionnaire import models
+
+    # Block can be deleted together with its dependants. Then it has
+    # invalidated the schema by itself
+    questionnaire_ids = (
+        models.AbstractQuestionnaireBlock.objects
+        .filter(id=block_id)
+        .values_list('questionnaire_id', flat=True)
+    )
+    invalidate_tags(*[questionnaire_schema(questionnaire_id) for questionnaire_id in questionnaire_ids])
+
+
+def _on_variant_changed(instance, raw=False, **kwargs):
+    if not raw:
+        _invalidate_schema_of_block(instance.question_id)
+
+
+def _on_child_changed(instance, raw=False, **kwargs):
+    if not raw:
+        _invalidate_schema_of_block(instance.parent_id)
+
+
+def _on_show_condition_changed(instance, raw=False, **kwargs):
+    if not raw:
+        _invalidate_schema_of_block(instance.block_id)
+
+
+def _on_group_saved(instance, raw, **kwargs):
+    if raw:
+        return
+    # It's here to avoid cyclic imports
+    from questionnaire import models
+
+    questionnaire_ids = set(
+        models.QuestionnaireBlockGroupMemberShowCondition.objects
+        .filter(group_id=instance.id)
+        .values_list('block__questionnaire_id', flat=True)
+    ) | set(
+        models.UserListQuestionnaireQuestion.objects
+        .filter(group_id=instance.id)
+        .values_list('questionnaire_id', flat=True)
+    )
+    invalidate_tags(*[questionnaire_schema(questionnaire_id) for questionnaire_id in questionnaire_ids])
+
+
+def _connect_to_save_and_delete(receiver, model):
+    post_save.connect(receiver, sender=model)
+    post_delete.connect(receiver, sender=model)
+
+
+def connect_signals():
+    from questionnaire import models
+
+    for model in apps.get_models():
+        if issubclass(model, models.AbstractQuestionnaireBlock):
+            _connect_to_save_and_delete(_on_block_changed, model)
+        # Groups of the show conditions and the questions are cached with their settings
+        if issubclass(model, groups.models.AbstractGroup):
+            post_save.connect(_on_group_saved, sender=model)
+    _connect_to_save_and_delete(_on_variant_changed, models.ChoiceQuestionnaireQuestionVariant)
+    _connect_to_save_and_delete(_on_child_changed, models.InlineQuestionnaireBlockChild)
+    _connect_to_save_and_delete(_on_show_condition_changed, models.QuestionnaireBlockVariantCheckedShowCondition)
+    _connect_to_save_and_delete(_on_show_condition_changed, models.QuestionnaireBlockGroupMemberShowCondition)
@@ -0,0 +1,73 @@
+"""Tests for saving answers to questionnaire"""
+
+import django.test
+
+import users.models
+from questionnaire import models
+from questionnaire.views import save_questionnaire_answers
+
+
+class SaveQuestionnaireAnswersTestCase(django.test.TestCase):
+    def setUp(self):
+        self.questionnaire = models.Questionnaire.objects.create(
+            title='Анкета', short_name='answers',
+        )
+        models.TextQuestionnaireQuestion.objects.create(
+            questionnaire=self.questionnaire, short_name='name', text='Имя', order=1,
+            is_required=True, is_multiline=False,
+        )
+        question = models.ChoiceQuestionnaireQuestion.objects.create(
+            questionnaire=self.questionnaire, short_name='languages', text='Языки', order=2,
+            is_required=False, is_multiple=True, is_inline=False,
+        )
+        self.variants = [
+            models.ChoiceQuestionnaireQuestionVariant.objects.create(question=question, text=text, order=i)
+            for i, text in enumerate(['C++', 'Python', 'Java'])
+        ]
+        self.java_group = models.UsersSelectedQuestionVariantGroup.objects.create(
+            short_name='java', name='Пишущие на Java', description='', variant=self.variants[2],
+        )
+        self.user = users.models.User.objects.create_user('student', 'student@example.com', 'pass')
+
+    def _save(self, name, variants):
+        form_class = self.questionnaire.get_form_class(self.user)
+        prefix = self.questionnaire.get_fields_common_prefix()
+        form = form_class(data={
+            prefix + '-name': name,
+            prefix + '-languages': [variant.id for variant in variants],
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        save_questionnaire_answers(self.user, self.questionnaire, form)
+
+    def _get_answer_ids(self):
+        return dict(
+            models.QuestionnaireAnswer.objects
+            .filter(questionnaire=self.questionnaire, user=self.user)
+            .values_list('answer', 'id')
+        )
+
+    def test_only_changed_answers_are_saved(self):
+        self._save('Петя', self.variants[:2])
+        answer_ids = self._get_answer_ids()
+        self.assertTrue(self.questionnaire.is_filled_by(self.user))
+
+        self._save('Петя', self.variants[1:])
+        new_answer_ids = self._get_answer_ids()
+        self.assertEqual(self.questionnaire.get_user_answers(self.user), {
+            'name': 'Петя', 'languages': [str(self.variants[1].id), str(self.variants[2].id)],
+        })
+        # Unchanged answers are kept, others are removed or added
+        python_id = str(self.variants[1].id)
+        self.assertEqual(new_answer_ids['Петя'], answer_ids['Петя'])
+        self.assertEqual(new_answer_ids[python_id], answer_ids[python_id])
+        self.assertNotIn(str(self.variants[0].id), new_answer_ids)
+
+    def test_groups_are_invalidated(self):
+        self._save('Петя', self.variants[:1])
+        self.assertFalse(self.java_group.is_user_in_group(self.user))
+
+        self._save('Петя', self.variants)
+        self.assertTrue(self.java_group.is_user_in_group(self.user))
+
+        self._save('Вася', [])
+        self.assertFalse(self.java_group.is_user_in_group(self.user))
@@ -0,0 +1,71 @@
+"""Tests for the matrix of answers to questionnaires"""
+
+import io
+
+import django.test
+
+import users.models
+from questionnaire import models
+from questionnaire.answers_matrix import QuestionnaireAnswersMatrix
+
+
+class QuestionnaireAnswersMatrixTestCase(django.test.TestCase):
+    def setUp(self):
+        self.questionnaire = models.Questionnaire.objects.create(
+            title='Анкета', short_name='matrix',
+        )
+        models.TextQuestionnaireQuestion.objects.create(
+            questionnaire=self.questionnaire, short_name='name', text='Имя', order=1,
+            is_required=True, is_multiline=False,
+        )
+        question = models.ChoiceQuestionnaireQuestion.objects.create(
+            questionnaire=self.questionnaire, short_name='languages', text='Языки', order=2,
+            is_required=False, is_multiple=True, is_inline=False,
+        )
+        self.variants = [
+            models.ChoiceQuestionnaireQuestionVariant.objects.create(question=question, text=text, order=i)
+            for i, text in enumerate(['C++', 'Python'])
+        ]
+        self.users = [
+            users.models.User.objects.create_user('student%d' % i, '', 'pass')
+            for i in range(3)
+        ]
+        self._answer(self.users[0], 'name', 'Петя')
+        self._answer(self.users[0], 'languages', str(self.variants[0].id))
+        self._answer(self.users[0], 'languages', str(self.variants[1].id))
+        self._answer(self.users[2], 'name', 'Вася')
+        # Not selected variant and answer to the deleted question
+        self._answer(self.users[2], 'languages', '')
+        self._answer(self.users[2], 'deleted', 'Ответ')
+
+    def _answer(self, user, short_name, answer):
+        models.QuestionnaireAnswer.objects.create(
+            questionnaire=self.questionnaire, user=user, question_short_name=short_name, answer=answer,
+        )
+
+    def _get_matrix(self):
+        questionnaires = models.Questionnaire.objects.filter(id=self.questionnaire.id)
+        return QuestionnaireAnswersMatrix(questionnaires, self.users)
+
+    def test_answers_are_loaded_by_one_scan(self):
+        # Warm up caches (i.e. content types for polymorphic models)
+        self._get_matrix()
+
+        # Questionnaires, questions of two types, variants and answers
+        with self.assertNumQueries(6):
+            matrix = self._get_matrix()
+        self.assertEqual(matrix.short_names, ['name', 'languages'])
+        self.assertFalse(matrix.has_question('deleted'))
+        self.assertEqual(matrix.get_answers('languages'), [self.variants, [], []])
+        self.assertEqual(matrix.get_column('name'), ['Петя', '', 'Вася'])
+        self.assertEqual(matrix.get_column('languages'), ['C++, Python', '', ''])
+
+    def test_write_csv(self):
+        output = io.StringIO()
+        self._get_matrix().write_csv(output)
+        self.assertEqual(output.getvalue().splitlines(), [
+            'user_id,name,languages',
+            '%d,Петя,"C++, Python"' % self.users[0].id,
+            '%d,,' % self.users[1].id,
+            '%d,Вася,' % self.users[2].id,
+        ])
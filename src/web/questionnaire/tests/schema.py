@@ -0,0 +1,72 @@
+"""Tests for the cached schema of questionnaire"""
+
+import django.test
+from django.core.cache import cache as django_cache
+
+import users.models
+from questionnaire import models
+
+
+class QuestionnaireSchemaTestCase(django.test.TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.questionnaire = models.Questionnaire.objects.create(
+            title='Анкета', short_name='schema',
+        )
+        inline = models.InlineQuestionnaireBlock.objects.create(
+            questionnaire=self.questionnaire, short_name='about', text='О себе', order=1,
+        )
+        name = models.TextQuestionnaireQuestion.objects.create(
+            questionnaire=self.questionnaire, short_name='name', text='Имя', order=2,
+            is_required=True, is_multiline=False, is_top_level=False,
+        )
+        models.InlineQuestionnaireBlockChild.objects.create(parent=inline, block=name)
+        self.question = models.ChoiceQuestionnaireQuestion.objects.create(
+            questionnaire=self.questionnaire, short_name='olympiads', text='Олимпиады', order=3,
+            is_required=False, is_multiple=False, is_inline=False,
+        )
+        self.variant = models.ChoiceQuestionnaireQuestionVariant.objects.create(
+            question=self.question, text='Да', order=1,
+        )
+        self.comment = models.TextQuestionnaireQuestion.objects.create(
+            questionnaire=self.questionnaire, short_name='comment', text='Какие?', order=4,
+            is_required=False, is_multiline=True,
+        )
+        models.QuestionnaireBlockVariantCheckedShowCondition.objects.create(
+            block=self.comment, variant=self.variant,
+        )
+        self.user = users.models.User.objects.create_user('student', 'student@example.com', 'pass')
+
+    def _get_questionnaire(self):
+        # New instance doesn't keep the schema in its cached properties
+        return models.Questionnaire.objects.get(id=self.questionnaire.id)
+
+    def test_form_is_built_without_queries(self):
+        self._get_questionnaire().get_form_class(self.user)
+
+        questionnaire = self._get_questionnaire()
+        with self.assertNumQueries(0):
+            form = questionnaire.get_form_class(self.user)()
+            self.assertEqual(list(form.fields), ['name', 'olympiads', 'comment'])
+            self.assertEqual(
+                [block.short_name for block in questionnaire.ordered_top_level_blocks],
+                ['about', 'olympiads', 'comment'],
+            )
+            about = questionnaire.ordered_top_level_blocks[0]
+            self.assertEqual([child.block.short_name for child in about.ordered_children], ['name'])
+            conditions = questionnaire.variant_checked_show_conditions[self.comment.id]
+            self.assertEqual([condition.variant.question.short_name for condition in conditions], ['olympiads'])
+
+    def test_changes_invalidate_schema(self):
+        self._get_questionnaire().get_form_class(self.user)
+
+        models.ChoiceQuestionnaireQuestionVariant.objects.create(question=self.question, text='Нет', order=2)
+        self.question.text = 'Участвовали ли вы в олимпиадах?'
+        self.question.save()
+        field = self._get_questionnaire().get_form_class(self.user)().fields['olympiads']
+        self.assertEqual(field.label, 'Участвовали ли вы в олимпиадах?')
+        self.assertEqual([label['label'] for _, label in field.choices], ['Да', 'Нет'])
+
+        self.variant.delete()
+        field = self._get_questionnaire().get_form_class(self.user)().fields['olympiads']
+        self.assertEqual([label['label'] for _, label in field.choices], ['Нет'])
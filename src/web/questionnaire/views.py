@@ -1,3 +1,4 @@
+import collections
 import datetime
 
 from django.conf import settings
@@ -6,16 +7,18 @@ from django.db import transaction
 from django.db.models import QuerySet
 from django.shortcuts import render, get_object_or_404, redirect
 
+import groups.materialized
+
 from . import forms
 from . import models
 
 
-@transaction.atomic
-def save_questionnaire_answers(user, questionnaire, form):
-    # Remove all old answers
-    models.QuestionnaireAnswer.objects.filter(questionnaire=questionnaire,
-                                              user=user).delete()
-
+def _get_form_answers(form):
+    """
+    :return: dict {question short name: list of answers as they are stored
+    in QuestionnaireAnswer.answer}
+    """
+    result = {}
     for field in form.fields:
         answer = form.cleaned_data[field]
         if isinstance(answer, (tuple, list)):
@@ -30,20 +33,74 @@ def save_questionnaire_answers(user, questionnaire, form):
         else:
             answer_list = [answer]
 
-        for answer in answer_list:
-            models.QuestionnaireAnswer(questionnaire=questionnaire,
-                                       user=user,
-                                       question_short_name=field,
-                                       answer=answer
-                                       ).save()
+        result[field] = [str(answer) for answer in answer_list]
+    return result
 
-    models.UserQuestionnaireStatus.objects.update_or_create(
+
+@transaction.atomic
+def save_questionnaire_answers(user, questionnaire, form):
+    # Only the difference between the submitted form and the stored answers
+    # is saved, so the number of queries depends on the number of changed
+    # answers, not on the size of the questionnaire
+    form_answers = _get_form_answers(form)
+    stored_answers = collections.defaultdict(list)
+    for answer_id, question_short_name, answer in (
+        models.QuestionnaireAnswer.objects
+        .filter(questionnaire=questionnaire, user=user)
+        .order_by('id')
+        .values_list('id', 'question_short_name', 'answer')
+    ):
+        stored_answers[question_short_name].append((answer_id, answer))
+
+    removed_answer_ids = []
+    added_answers = []
+    # Answers to the questions which are not in the form anymore are removed too
+    for question_short_name in stored_answers.keys() | form_answers.keys():
+        new_answers = form_answers.get(question_short_name, [])
+        # Counts of the new answers which are not stored yet
+        not_stored = collections.Counter(new_answers)
+        for answer_id, answer in stored_answers[question_short_name]:
+            if not_stored[answer] > 0:
+                not_stored[answer] -= 1
+            else:
+                removed_answer_ids.append(answer_id)
+        for answer in new_answers:
+            if not_stored[answer] > 0:
+                not_stored[answer] -= 1
+                added_answers.append(models.QuestionnaireAnswer(
+                    questionnaire=questionnaire,
+                    user=user,
+                    question_short_name=question_short_name,
+                    answer=answer,
+                ))
+
+    if removed_answer_ids:
+        # Groups depending on the removed answers are invalidated by signals
+        models.QuestionnaireAnswer.objects.filter(id__in=removed_answer_ids).delete()
+    if added_answers:
+        models.QuestionnaireAnswer.objects.bulk_create(added_answers)
+        # bulk_create() doesn't send signals, so the groups depending on the
+        # answers (see questionnaire.models.groups) are invalidated here
+        groups.materialized.invalidate(
+            models.UsersSelectedQuestionVariantGroup.objects.filter(
+                variant__question__questionnaire_id=questionnaire.id,
+                variant__question__short_name__in={answer.question_short_name for answer in added_answers},
+            ).values_list('id', flat=True)
+        )
+
+    # Status is saved only when it's changed, because its saving invalidates
+    # groups of users who have filled the questionnaire
+    status, created = models.UserQuestionnaireStatus.objects.get_or_create(
         questionnaire=questionnaire,
         user=user,
         defaults={
             'status': models.UserQuestionnaireStatus.Status.FILLED
         },
     )
+    if not created and status.status != models.UserQuestionnaireStatus.Status.FILLED:
+        status.status = models.UserQuestionnaireStatus.Status.FILLED
+        status.save()
+
 
 def questionnaire_for_user(request, user, questionnaire_name):
     if hasattr(request, 'school'):
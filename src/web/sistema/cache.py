@@ -1,39 +1,250 @@
-# Quick fix to possibly survive high QPS
-# TODO: refactor from here
+"""
+Cache of function results.
+
+Results are kept in a bounded in-process LRU cache in front of Django's
+cache. Cached function can declare dependency tags of its result, i.e.
+"entrance levels of the school 5". Current versions of the tags are stored in
+Django's cache and are a part of the result's key, so invalidate_tags() makes
+all dependent results stale in all processes at once. It allows to cache
+results for a long time if all changes of their dependencies invalidate tags
+(usually in model signals).
+
+Values from the in-process cache are shared between the calls like in
+functools.lru_cache(), so callers must not modify them.
+
+Only one thread of one process computes the value for the key at a time,
+others wait for its result. Hits and misses are counted for each function,
+see get_statistics().
+"""
+
+import collections
+import contextlib
+import functools
+import threading
+import time
+
 from django.core.cache import cache as _djcache
+from django.db import transaction
+
+_TAG_VERSION_KEY = 'sistema.cache.tag:%s'
+_LOCK_KEY = 'sistema.cache.lock:%s'
+
+# Other processes wait for the value computed by the process holding the lock
+# for the key at most this number of seconds, then compute the value by themselves
+STAMPEDE_LOCK_TIMEOUT = 10
+STAMPEDE_WAIT_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+class CacheStatistics:
+    def __init__(self):
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def as_dict(self):
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+        }
+
+
+# Function name -> CacheStatistics. Statistics is collected per process
+_statistics = {}
+
+
+def get_statistics():
+    """
+    :return: dict {function name: {'local_hits': ..., 'shared_hits': ..., 'misses': ...}}
+    for all cached functions of the current process
+    """
+    return {name: statistics.as_dict() for name, statistics in _statistics.items()}
+
+
+class _LocalCache:
+    """
+    Thread-safe LRU cache with expiration of values, which keeps at most
+    `max_size` values
+    """
+    def __init__(self, max_size):
+        self._max_size = max_size
+        # key -> (expires_at, value) from the least to the most recently used
+        self._values = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            expires_at, value = self._values.get(key, (None, _MISSING))
+            if value is _MISSING:
+                return _MISSING
+            if expires_at < time.monotonic():
+                del self._values[key]
+                return _MISSING
+            self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value, seconds):
+        with self._lock:
+            self._values[key] = (time.monotonic() + seconds, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self._max_size:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class _KeyLocks:
+    """Locks for keys which are being computed by threads of this process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> (lock, number of threads using this lock)
+        self._locks = {}
 
+    @contextlib.contextmanager
+    def hold(self, key):
+        with self._lock:
+            lock, threads_count = self._locks.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._locks[key] = (lock, threads_count + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, threads_count = self._locks[key]
+                if threads_count == 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, threads_count - 1)
 
-def cache(seconds=900):
+
+def _get_tag_versions(tags):
+    keys = [_TAG_VERSION_KEY % tag for tag in tags]
+    versions = _djcache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Another process could have created the version meanwhile
+            _djcache.add(key, time.time_ns(), None)
+            versions[key] = _djcache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_tags_version(tags):
+    """
+    Returns the string which changes each time when any of the tags is
+    invalidated. Use it in the keys of values cached without cache()
+    """
+    return ','.join(map(str, _get_tag_versions(tags)))
+
+
+def _set_new_tag_versions(tags):
+    # New version is never equal to the previous one, even if the previous
+    # one has been evicted from the cache
+    now = time.time_ns()
+    _djcache.set_many({_TAG_VERSION_KEY % tag: now for tag in tags}, None)
+
+
+def invalidate_tags(*tags):
+    """
+    Makes stale all cached results which depend on any of the tags. Inside
+    a transaction tags are invalidated once more after the commit
+    """
+    # Results computed in this transaction should see its changes
+    _set_new_tag_versions(tags)
+    # Other connections read the data as it was before the commit, and
+    # results computed by them until the commit would be stored under the
+    # new versions
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _set_new_tag_versions(tags))
+
+
+def _get_arg_name(arg):
+    return str(arg.id) if hasattr(arg, 'id') else str(arg)
+
+
+def _get_shared_value(key, compute, seconds):
+    """
+    Returns (value, whether it has been found in Django's cache). Only one
+    process computes the value for the key at a time: others wait for it
+    """
+    lock_key = _LOCK_KEY % key
+    wait_until = time.monotonic() + STAMPEDE_LOCK_TIMEOUT
+    while True:
+        cached = _djcache.get(key, _MISSING)
+        if cached is not _MISSING:
+            # Value is wrapped into tuple to distinguish cached None from a miss
+            return cached[0], True
+        if _djcache.add(lock_key, True, STAMPEDE_LOCK_TIMEOUT) or time.monotonic() >= wait_until:
+            break
+        time.sleep(STAMPEDE_WAIT_INTERVAL)
+
+    try:
+        value = compute()
+        _djcache.set(key, (value, ), seconds)
+    finally:
+        _djcache.delete(lock_key)
+    return value, False
+
+
+def cache(seconds=900, tags=None, local_size=1024):
     """
-    Cache the result of a function call for the specified number of seconds,
-    using Django's caching mechanism.
-    Assumes that the function never returns None (as the cache returns None to indicate a miss), and
-    that the function's result only depends on its parameters.
+    Cache the result of a function call for the specified number of seconds.
+    Assumes that the function's result only depends on its parameters and on
+    the data described by `tags`. Model instances are identified by their ids.
     Note that the ordering of parameters is important. e.g. myFunction(x = 1, y = 2), myFunction(y = 2, x = 1),
     and myFunction(1,2) will each be cached separately.
 
+    :param tags: function which gets the same parameters and returns the list
+    of dependency tags of the result, see invalidate_tags()
+    :param local_size: maximum number of results kept in the process memory
+
     Usage:
 
-    @cache(600)
-    def myExpensiveMethod(parm1, parm2, parm3):
+    @cache(3600, tags=lambda school, user: ['school_levels:%d' % school.id])
+    def myExpensiveMethod(school, user):
         ....
         return expensiveResult
     """
-    def doCache(f):
-        def x(*args, **kwargs):
-            arg_names = [str(arg.id) if hasattr(arg, 'id') else str(arg) for arg in args]
-            kwarg_names = [
-                f"{name}={value.id if hasattr(value, 'id') else str(value)}"
-                for name, value in kwargs.items()
-            ]
-            key = f"{f.__module__}.{f.__name__}({';!;'.join(arg_names)};!!;{';!;'.join(kwarg_names)})"
-            cache_value = _djcache.get(key)
-            if cache_value is None:
-                result = f(*args, **kwargs)
-                _djcache.set(key, (True, result), seconds)
-            else:
-                _, result = cache_value
-            return result
-        return x
-    return doCache
-# TODO: to here
+    def decorator(f):
+        name = f'{f.__module__}.{f.__qualname__}'
+        statistics = _statistics[name] = CacheStatistics()
+        local_cache = _LocalCache(local_size)
+        key_locks = _KeyLocks()
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            arg_names = [_get_arg_name(arg) for arg in args]
+            kwarg_names = [f'{kwarg}={_get_arg_name(value)}' for kwarg, value in kwargs.items()]
+            key = f"{name}({';!;'.join(arg_names)};!!;{';!;'.join(kwarg_names)})"
+            if tags is not None:
+                key += '@' + get_tags_version(tags(*args, **kwargs))
+
+            value = local_cache.get(key)
+            if value is not _MISSING:
+                statistics.local_hits += 1
+                return value
+
+            with key_locks.hold(key):
+                # The value could be computed by another thread while we waited for the lock
+                value = local_cache.get(key)
+                if value is not _MISSING:
+                    statistics.local_hits += 1
+                    return value
+
+                value, is_hit = _get_shared_value(key, lambda: f(*args, **kwargs), seconds)
+                if is_hit:
+                    statistics.shared_hits += 1
+                else:
+                    statistics.misses += 1
+                local_cache.set(key, value, seconds)
+            return value
+
+        wrapper.statistics = statistics
+        wrapper.clear_local_cache = local_cache.clear
+        return wrapper
+    return decorator
@@ -1,9 +1,33 @@
+import collections
+import itertools
+import tempfile
+
+import xlsxwriter
+from django.http import StreamingHttpResponse
 from django.utils.functional import cached_property
 
-__all__ = ["ExcelColumn", "ExcelMultiColumn", "PlainExcelColumn", "LinkExcelColumn"]
+__all__ = [
+    "ExcelColumn", "ExcelMultiColumn", "PlainExcelColumn", "LinkExcelColumn",
+    "write_columns", "xlsx_streaming_response",
+]
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Header cell, possibly merged from several cells
+HeaderCell = collections.namedtuple(
+    'HeaderCell', ['first_row', 'first_col', 'last_row', 'last_col', 'value', 'cell_format']
+)
+
+_MISSING = object()
 
 
 class ExcelColumn:
+    """
+    Column of the exported table. Leaf columns produce their cells lazily one
+    by one (see `iter_cells()`), so the table is written row by row by
+    `write_columns()` and can be exported in xlsxwriter's constant_memory mode.
+    """
     def __init__(self, name='', plain_header=True):
         self.name = name
         self.plain_header = plain_header
@@ -24,23 +48,32 @@ class ExcelColumn:
     def cell_format(self):
         return None
 
-    def write_header(self, sheet, irow, icol, header_height=None):
+    def get_leaf_columns(self):
+        return [self]
+
+    def get_header_cells(self, irow, icol, header_height):
         if self.plain_header or header_height == 1:
-            sheet.write(irow, icol, self.name, self.header_format)
-        else:
-            sheet.merge_range(irow,
-                              icol,
-                              irow + header_height - 1,
-                              icol,
-                              self.name,
-                              cell_format=self.header_format)
-        return irow + (1 if self.plain_header else header_height)
+            return [HeaderCell(irow, icol, irow, icol, self.name, self.header_format)]
+        return [HeaderCell(
+            irow, icol, irow + header_height - 1, icol, self.name, self.header_format
+        )]
+
+    def iter_cells(self):
+        """
+        Returns an iterator over the column's cells, from top to bottom.
+        Each cell is passed to `write_cell()` later.
+        """
+        raise NotImplementedError()
 
-    def write(self, sheet, irow, icol, header_height=None):
-        return NotImplementedError()
+    def write_cell(self, sheet, irow, icol, cell):
+        raise NotImplementedError()
 
 
 class PlainExcelColumn(ExcelColumn):
+    """
+    `data` and `comments` can be any iterables, i.e. generators: they are
+    consumed lazily while the rows are written.
+    """
     def __init__(self,
                  data=None,
                  comments=None,
@@ -51,35 +84,43 @@ class PlainExcelColumn(ExcelColumn):
         self.comments = [] if comments is None else comments
         self.cell_width = cell_width
 
-    def write(self, sheet, irow, icol, header_height=None):
-        sheet.set_column(icol, icol, self.cell_width)
+    def iter_cells(self):
+        return itertools.zip_longest(self.data, self.comments)
 
-        irow = self.write_header(sheet, irow, icol, header_height)
-
-        for i, value in enumerate(self.data):
-            sheet.write(irow + i, icol, value, self.cell_format)
-        for i, comment in enumerate(self.comments):
-            if comment:
-                sheet.write_comment(irow + i, icol, comment)
+    def write_cell(self, sheet, irow, icol, cell):
+        value, comment = cell
+        sheet.write(irow, icol, value, self.cell_format)
+        if comment:
+            sheet.write_comment(irow, icol, comment)
 
 
 class LinkExcelColumn(PlainExcelColumn):
     def __init__(self, data_urls=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.data_urls = self.data if data_urls is None else data_urls
-        if len(self.data) != len(self.data_urls):
+        self.data_urls = data_urls
+        # Lengths of lazy iterables are checked while writing
+        if (data_urls is not None and
+                hasattr(self.data, '__len__') and hasattr(data_urls, '__len__') and
+                len(self.data) != len(data_urls)):
             raise ValueError()
 
-    def write(self, sheet, irow, icol, header_height=None):
-        sheet.set_column(icol, icol, self.cell_width)
+    def iter_cells(self):
+        if self.data_urls is None:
+            return ((value, value) for value in self.data)
+        return self._iter_data_with_urls()
 
-        irow = self.write_header(sheet, irow, icol, header_height)
+    def _iter_data_with_urls(self):
+        for value, url in itertools.zip_longest(self.data, self.data_urls, fillvalue=_MISSING):
+            if value is _MISSING or url is _MISSING:
+                raise ValueError('Data and urls of the column "%s" have different lengths' % self.name)
+            yield value, url
 
-        for i, (value, url) in enumerate(zip(self.data, self.data_urls)):
-            if url:
-                sheet.write_url(irow + i, icol, url, string=str(value))
-            else:
-                sheet.write(irow + i, icol, value)
+    def write_cell(self, sheet, irow, icol, cell):
+        value, url = cell
+        if url:
+            sheet.write_url(irow, icol, url, string=str(value))
+        else:
+            sheet.write(irow, icol, value)
 
 
 class ExcelMultiColumn(ExcelColumn):
@@ -99,20 +140,139 @@ class ExcelMultiColumn(ExcelColumn):
         return 1 + max(subcolumn.header_height
                        for subcolumn in self.subcolumns)
 
-    def write(self, sheet, irow, icol, header_height=None):
+    def get_leaf_columns(self):
+        return [leaf
+                for subcolumn in self.subcolumns
+                for leaf in subcolumn.get_leaf_columns()]
+
+    def get_header_cells(self, irow, icol, header_height):
+        cells = []
         if not self.plain_header:
-            if len(self.subcolumns) > 1:
-                sheet.merge_range(irow,
-                                  icol,
-                                  irow,
-                                  icol + self.width - 1,
-                                  self.name,
-                                  self.header_format)
-            else:
-                sheet.write(irow, icol, self.name, self.header_format)
+            cells.append(HeaderCell(
+                irow, icol, irow, icol + self.width - 1, self.name, self.header_format
+            ))
             irow += 1
+            header_height -= 1
 
         for column in self.subcolumns:
-            column.header_format = self.header_format
-            column.write(sheet, irow, icol, header_height=header_height - 1)
+            cells.extend(column.get_header_cells(irow, icol, header_height))
             icol += column.width
+        return cells
+
+
+def _set_formats(column, plain_header, header_format, cell_format):
+    column.plain_header = plain_header
+    column.header_format = header_format
+    column.cell_format = cell_format
+    for subcolumn in getattr(column, 'subcolumns', []):
+        _set_formats(subcolumn, plain_header, header_format, cell_format)
+
+
+def _check_header_overlaps(header_cells):
+    # Worksheet.merge_range() checks it, but here it's not used, see below.
+    # Overlapping merged cells make the file broken for Excel
+    value_by_position = {}
+    for cell in header_cells:
+        for irow in range(cell.first_row, cell.last_row + 1):
+            for icol in range(cell.first_col, cell.last_col + 1):
+                if (irow, icol) in value_by_position:
+                    raise ValueError('Header cells "%s" and "%s" overlap' % (
+                        value_by_position[(irow, icol)], cell.value
+                    ))
+                value_by_position[(irow, icol)] = cell.value
+
+
+def _write_header(sheet, header_cells, header_height):
+    # In constant_memory mode cells can be written only row by row, and
+    # merge_range() writes all rows of the range at once. So it can't merge
+    # cells of several header rows: writing of the next row flushes the
+    # previous one, and later merges starting there are silently dropped.
+    # Instead the cells are filled in manually and the ranges are added
+    # to the private Worksheet.merge list, that's why XlsxWriter version
+    # is pinned in requirements.txt. sistema/tests/xlsx_export.py checks
+    # that the ranges get to the file.
+    _check_header_overlaps(header_cells)
+
+    for irow in range(header_height):
+        for cell in header_cells:
+            if not cell.first_row <= irow <= cell.last_row:
+                continue
+            for icol in range(cell.first_col, cell.last_col + 1):
+                if (irow, icol) == (cell.first_row, cell.first_col):
+                    sheet.write(irow, icol, cell.value, cell.cell_format)
+                else:
+                    sheet.write_blank(irow, icol, None, cell.cell_format)
+
+    for cell in header_cells:
+        if (cell.first_row, cell.first_col) != (cell.last_row, cell.last_col):
+            sheet.merge.append([cell.first_row, cell.first_col, cell.last_row, cell.last_col])
+
+
+def write_columns(sheet, columns, plain_header=True,
+                  header_format=None, cell_format=None,
+                  frozen_columns=0, on_progress=None, progress_interval=1000):
+    """
+    Writes the table to the worksheet row by row: header first, then one row
+    of cells from all leaf columns at a time. Columns' data is consumed
+    lazily, so the sheet can be written by the workbook opened with
+    {'constant_memory': True}, and the memory doesn't grow with the table.
+    :param on_progress: function(number of written rows), called every
+    `progress_interval` rows
+    :return: number of written rows without header
+    """
+    for column in columns:
+        _set_formats(column, plain_header, header_format, cell_format)
+
+    header_height = 1 if plain_header else max(column.header_height for column in columns)
+    header_cells = []
+    icol = 0
+    for column in columns:
+        header_cells.extend(column.get_header_cells(0, icol, header_height))
+        icol += column.width
+    header_cells.sort(key=lambda cell: (cell.first_row, cell.first_col))
+
+    leaves = [leaf for column in columns for leaf in column.get_leaf_columns()]
+    for icol, leaf in enumerate(leaves):
+        sheet.set_column(icol, icol, getattr(leaf, 'cell_width', None))
+    sheet.freeze_panes(header_height, frozen_columns)
+
+    _write_header(sheet, header_cells, header_height)
+
+    rows = itertools.zip_longest(*(leaf.iter_cells() for leaf in leaves), fillvalue=_MISSING)
+    rows_count = 0
+    for rows_count, cells in enumerate(rows, start=1):
+        irow = header_height + rows_count - 1
+        for icol, (leaf, cell) in enumerate(zip(leaves, cells)):
+            if cell is not _MISSING:
+                leaf.write_cell(sheet, irow, icol, cell)
+        if on_progress is not None and rows_count % progress_interval == 0:
+            on_progress(rows_count)
+    return rows_count
+
+
+def xlsx_streaming_response(file_name, write_workbook, chunk_size=64 * 1024):
+    """
+    Returns StreamingHttpResponse with the workbook filled by
+    `write_workbook(book)`. The workbook is built in constant_memory mode
+    into a temporary file only when the response starts to be sent, so
+    headers of the response reach the browser immediately. Then the file is
+    sent by chunks. Note that xlsx is a zip archive which xlsxwriter
+    assembles in `close()`, so the content itself can't be sent before the
+    whole table is written.
+    """
+    def generate():
+        with tempfile.TemporaryFile() as output:
+            book = xlsxwriter.Workbook(output, {'constant_memory': True})
+            write_workbook(book)
+            book.close()
+
+            output.seek(0)
+            while True:
+                chunk = output.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    response = StreamingHttpResponse(generate(), content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = 'attachment; filename=%s' % file_name
+    return response
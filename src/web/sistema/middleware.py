@@ -1,4 +1,6 @@
 import re
+
+import htmlmin.middleware
 import wiki.plugins.attachments.markdown_extensions
 import django.core.exceptions
 from django.utils.deprecation import MiddlewareMixin
@@ -15,3 +17,49 @@ class WikiWorkaroundMiddleware(MiddlewareMixin):
             r'(?P<before>.*)\[ *(attachment\:(?P<id>[0-9]+))( *((title\:\"(?P<title>[^\"]+)\")|(?P<size>size)))*\](?P<after>.*)',
             re.IGNORECASE)
         raise django.core.exceptions.MiddlewareNotUsed()
+
+
+_MINIFIED_FRAGMENT_PLACEHOLDER = '<sistema-minified-fragment data-id="%d"></sistema-minified-fragment>'
+_MINIFIED_FRAGMENT_PLACEHOLDER_RE = re.compile(
+    r'<sistema-minified-fragment data-id="(\d+)">\s*</sistema-minified-fragment>'
+)
+
+
+def add_minified_fragment(request, fragment):
+    """
+    Returns the placeholder for the already minified HTML fragment which
+    should be inserted into the response instead of the fragment itself.
+    HtmlMinifyMiddleware doesn't minify such fragments again and puts them
+    into the response after minifying the rest of it
+    """
+    fragments = getattr(request, '_minified_fragments', None)
+    # The request hasn't passed through HtmlMinifyMiddleware
+    if fragments is None:
+        return fragment
+    fragments.append(fragment)
+    return _MINIFIED_FRAGMENT_PLACEHOLDER % (len(fragments) - 1)
+
+
+class HtmlMinifyMiddleware(htmlmin.middleware.HtmlMinifyMiddleware):
+    """
+    htmlmin's HtmlMinifyMiddleware which skips fragments added
+    by add_minified_fragment()
+    """
+    def __call__(self, request):
+        request._minified_fragments = []
+        return super().__call__(request)
+
+    def process_response(self, request, response):
+        response = super().process_response(request, response)
+        fragments = getattr(request, '_minified_fragments', None)
+        if not fragments or response.streaming or 'text/html' not in response.get('Content-Type', ''):
+            return response
+
+        content = response.content.decode(response.charset)
+        response.content = _MINIFIED_FRAGMENT_PLACEHOLDER_RE.sub(
+            lambda match: fragments[int(match.group(1))],
+            content,
+        )
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = len(response.content)
+        return response
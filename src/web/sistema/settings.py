@@ -103,7 +103,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'htmlmin.middleware.HtmlMinifyMiddleware',
+    'sistema.middleware.HtmlMinifyMiddleware',
     'htmlmin.middleware.MarkRequestMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -117,6 +117,7 @@ MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
 
     'schools.middleware.SchoolMiddleware',
+    'groups.middleware.GroupMembershipMiddleware',
     'sistema.middleware.WikiWorkaroundMiddleware',
     'users.middleware.UserProfileMiddleware',
 ]
@@ -261,6 +262,18 @@ SISTEMA_GENERATOR_ASSETS_DIR = os.path.join(SISTEMA_UPLOAD_FILES_DIR, 'generator
 
 SISTEMA_FINANCE_DOCUMENTS = os.path.join(SISTEMA_UPLOAD_FILES_DIR, 'finance-documents')
 
+# Complete enrolling tables built by `run_export_worker`
+SISTEMA_ENROLLING_EXPORTS_DIR = os.path.join(SISTEMA_UPLOAD_FILES_DIR, 'enrolling-exports')
+
+# Touched by modules.ejudge.queue on new solutions to wake up the ejudge submitter
+SISTEMA_EJUDGE_SUBMITTER_WAKEUP_FILE = os.path.join(SISTEMA_UPLOAD_FILES_DIR, 'ejudge-submitter-wakeup')
+
+# Maximum time in seconds which modules.entrance.views.task_verdicts() waits for
+# new verdicts before answering 304 Not Modified. Waiting request holds a worker,
+# so enable it only for deployments with async workers. With 0 the exam page
+# polls verdicts by cheap conditional requests with a pause between them
+SISTEMA_ENTRANCE_VERDICTS_MAX_WAIT = 0
+
 CONSTANCE_BACKEND = 'constance.backends.database.DatabaseBackend'
 CONSTANCE_CONFIG = {
     'SISTEMA_CURRENT_SCHOOL_SHORT_NAME': ('2016',
@@ -340,6 +353,7 @@ SOCIALACCOUNT_LOGIN_ON_GET = True
 SETTINGS_EXPORT = [
     'DEBUG',
     'SISTEMA_CONTACT_US_EMAIL',
+    'SISTEMA_ENTRANCE_VERDICTS_MAX_WAIT',
 ]
 
 # Django >=3.2 requires default type for models.AutoField
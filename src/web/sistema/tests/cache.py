@@ -0,0 +1,73 @@
+"""Tests for sistema.cache"""
+
+from django.core.cache import cache as django_cache
+from django.test import SimpleTestCase, TestCase
+
+from sistema.cache import cache, invalidate_tags
+
+
+class CacheTestCase(SimpleTestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.calls = []
+
+    def _make_function(self, **kwargs):
+        @cache(60, **kwargs)
+        def function(x):
+            self.calls.append(x)
+            return None if x == 0 else x * 2
+        return function
+
+    def test_results_are_cached(self):
+        function = self._make_function()
+        self.assertEqual([function(1), function(1), function(0), function(0)], [2, 2, None, None])
+        self.assertEqual(self.calls, [1, 0])
+        self.assertEqual(function.statistics.as_dict(), {'local_hits': 2, 'shared_hits': 0, 'misses': 2})
+
+        # Another process finds the result in the shared cache
+        function.clear_local_cache()
+        function(1)
+        self.assertEqual(self.calls, [1, 0])
+        self.assertEqual(function.statistics.shared_hits, 1)
+
+    def test_local_cache_is_bounded(self):
+        function = self._make_function(local_size=2)
+        for x in (1, 2, 3, 1):
+            function(x)
+        self.assertEqual(function.statistics.local_hits, 0)
+        self.assertEqual(function.statistics.shared_hits, 1)
+
+    def test_invalidate_tags(self):
+        function = self._make_function(tags=lambda x: ['parity:%d' % (x % 2), 'all'])
+        function(1)
+        function(2)
+
+        invalidate_tags('parity:1')
+        function(1)
+        function(2)
+        self.assertEqual(self.calls, [1, 2, 1])
+
+        invalidate_tags('all')
+        function(1)
+        function(2)
+        self.assertEqual(self.calls, [1, 2, 1, 1, 2])
+
+
+class InvalidationInTransactionTestCase(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+    def test_tags_are_invalidated_after_commit(self):
+        committed_data = {'value': 1}
+
+        @cache(60, tags=lambda: ['data'])
+        def function():
+            return committed_data['value']
+
+        self.assertEqual(function(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_tags('data')
+            # Another connection reads the data before the commit
+            self.assertEqual(function(), 1)
+            committed_data['value'] = 2
+        self.assertEqual(function(), 2)
@@ -0,0 +1,98 @@
+"""Tests for sistema.export"""
+
+import io
+import re
+import zipfile
+
+import xlsxwriter
+from django.test import SimpleTestCase
+
+from sistema import export
+from sistema.export import (
+    ExcelMultiColumn, LinkExcelColumn, PlainExcelColumn, write_columns, xlsx_streaming_response,
+)
+
+
+class WriteColumnsTestCase(SimpleTestCase):
+    def _get_columns(self, rows_count):
+        return [
+            LinkExcelColumn(
+                name='id',
+                data=(i for i in range(rows_count)),
+                data_urls=('http://localhost/%d/' % i for i in range(rows_count)),
+            ),
+            ExcelMultiColumn(
+                name='Оценки',
+                subcolumns=[
+                    PlainExcelColumn(name='A', data=('a%d' % i for i in range(rows_count))),
+                    PlainExcelColumn(name='B', data=('b%d' % i for i in range(rows_count))),
+                ],
+            ),
+        ]
+
+    def _write(self, rows_count, plain_header):
+        output = io.BytesIO()
+        book = xlsxwriter.Workbook(output, {'constant_memory': True})
+        sheet = book.add_worksheet()
+        written = write_columns(sheet, self._get_columns(rows_count), plain_header=plain_header)
+        book.close()
+        with zipfile.ZipFile(output) as archive:
+            return written, archive.read('xl/worksheets/sheet1.xml').decode()
+
+    def _get_cells(self, sheet_xml):
+        # Strings are inline in constant_memory mode
+        return dict(re.findall(r'<c r="([A-Z]+\d+)"[^>]*t="inlineStr"><is><t>([^<]*)</t>', sheet_xml))
+
+    def test_plain_header(self):
+        written, sheet_xml = self._write(3, plain_header=True)
+
+        self.assertEqual(written, 3)
+        cells = self._get_cells(sheet_xml)
+        self.assertEqual(cells['A1'], 'id')
+        self.assertEqual(cells['B1'], 'A')
+        self.assertEqual(cells['C1'], 'B')
+        self.assertEqual(cells['B2'], 'a0')
+        self.assertEqual(cells['C4'], 'b2')
+        self.assertNotIn('<mergeCell ', sheet_xml)
+        self.assertEqual(sheet_xml.count('<hyperlink '), 3)
+
+    def test_merged_header(self):
+        written, sheet_xml = self._write(2, plain_header=False)
+
+        self.assertEqual(written, 2)
+        cells = self._get_cells(sheet_xml)
+        self.assertEqual(cells['A1'], 'id')
+        self.assertEqual(cells['B1'], 'Оценки')
+        self.assertEqual(cells['B2'], 'A')
+        self.assertEqual(cells['C2'], 'B')
+        self.assertEqual(cells['B3'], 'a0')
+        self.assertEqual(cells['C4'], 'b1')
+        self.assertIn('<mergeCell ref="A1:A2"/>', sheet_xml)
+        self.assertIn('<mergeCell ref="B1:C1"/>', sheet_xml)
+
+    def test_overlapping_header_cells(self):
+        book = xlsxwriter.Workbook(io.BytesIO(), {'constant_memory': True})
+        self.addCleanup(book.close)
+        header_cells = [
+            export.HeaderCell(0, 0, 1, 0, 'id', None),
+            export.HeaderCell(1, 0, 1, 1, 'Оценки', None),
+        ]
+        with self.assertRaises(ValueError):
+            export._write_header(book.add_worksheet(), header_cells, 2)
+
+    def test_different_lengths_of_link_column(self):
+        column = LinkExcelColumn(name='id', data=iter([1, 2]), data_urls=iter(['http://localhost/']))
+        with self.assertRaises(ValueError):
+            list(column.iter_cells())
+
+    def test_streaming_response(self):
+        def write_workbook(book):
+            write_columns(book.add_worksheet(), self._get_columns(10))
+
+        response = xlsx_streaming_response('table.xlsx', write_workbook)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=table.xlsx')
+        content = b''.join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIn('xl/worksheets/sheet1.xml', archive.namelist())